@@ -0,0 +1,4 @@
+from dotenv import load_dotenv, find_dotenv
+
+# Loaded once, before any module reads its settings from the environment
+load_dotenv(find_dotenv())
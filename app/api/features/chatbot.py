@@ -1,11 +1,24 @@
-from langchain_google_genai import GoogleGenerativeAI
-from langchain.prompts import PromptTemplate
+from langchain_core.prompts import PromptTemplate
+from pydantic import BaseModel
+from typing import List, Optional, Tuple
 import os
-from app.api.features.schemas.schemas import ChatMessage, Message
+import uuid
+from app.api.features.schemas.schemas import ChatRequest
+from app.api.features.util.cache import content_hash
+from app.api.features.util.chat_history import (
+    CHAT_HISTORY_TOKEN_BUDGET,
+    CHAT_SUMMARY_BATCH_TOKENS,
+    estimate_tokens,
+    render_lines,
+    render_message,
+    split_history
+)
+from app.api.features.util.llm_invocation import estimate_prompt_tokens, provider_limit
+from app.api.features.util.metrics import observe_llm_call
+from app.api.registry import registry
 
-from dotenv import load_dotenv, find_dotenv
-
-load_dotenv(find_dotenv())
+# Rolling summaries kept per user for clients that resend the whole history
+CHAT_SUMMARIES_PER_USER = int(os.environ.get("CHAT_SUMMARIES_PER_USER", 8))
 
 def read_text_file(file_path):
     script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -28,24 +41,175 @@ def build_prompt():
     
     return prompt
 
+def build_summary_prompt():
+    """
+    Build the prompt that folds new history lines into the running conversation summary.
+    """
 
-def chatbot_executor(user_name: str, user_query: str, messages: list[Message], k=10):
-    
-    # create a memory list of last k = 3 messages
-    chat_context = [
-        ChatMessage(
-            role=message.role, 
-            type=message.type, 
-            text=message.payload.text
-        ) for message in messages[-k:]
+    template = read_text_file("prompt/summary-prompt.txt")
+    prompt = PromptTemplate(
+        template=template,
+        input_variables=["summary", "new_lines"],
+    )
+
+    return prompt
+
+
+class Conversation(BaseModel):
+    conversation_id: str
+    user_query: str
+    # Previous (role, text) pairs, without the current query
+    history: List[Tuple[str, str]]
+    # Number of earlier messages no longer present in `history`
+    offset: int = 0
+    session_id: Optional[str] = None
+    session_key: Optional[str] = None
+
+async def load_conversation(request: ChatRequest):
+    """
+    Build the conversation for a `ChatRequest`, either from the full `messages` list
+    sent by the client or, in session mode, from the server-side session store.
+    """
+    if request.messages:
+        messages = request.messages
+        return Conversation(
+            conversation_id=content_hash("conversation", request.user.id),
+            user_query=messages[-1].payload.text,
+            history=[(message.role.value, message.payload.text) for message in messages[:-1]]
+        )
+
+    session_id = request.session_id or uuid.uuid4().hex
+    session_key = f"{request.user.id}:{session_id}"
+    offset, history = await registry.get("session_store").load(session_key)
+
+    return Conversation(
+        conversation_id=session_key,
+        user_query=request.message.payload.text,
+        history=history,
+        offset=offset,
+        session_id=session_id,
+        session_key=session_key
+    )
+
+async def save_turn(conversation: Conversation, response: str):
+    if conversation.session_key is None:
+        return
+
+    await registry.get("session_store").append(
+        conversation.session_key,
+        [("human", conversation.user_query), ("ai", response)]
+    )
+
+def prefix_hashes(lines):
+    """
+    Chained hash of every prefix of `lines`: entry `k` identifies the first `k + 1` lines.
+    """
+    hashes, current = [], ""
+    for line in lines:
+        current = content_hash(current, line)
+        hashes.append(current)
+    return hashes
+
+def load_summary(conversation, older):
+    """
+    The stored summary that applies to `older`. Session summaries are kept per session.
+    Stateless clients resend the whole history, so their summaries are kept per user
+    and only reused by a conversation that starts with exactly the lines they cover.
+    """
+    empty = {"summary": "", "covered": 0}
+    stored = registry.get("chat_summaries").get(conversation.conversation_id)
+
+    if conversation.session_key is not None:
+        return stored or empty
+
+    hashes = prefix_hashes(older)
+    matching = [
+        entry for entry in stored or []
+        if 0 < entry["covered"] <= len(older) and hashes[entry["covered"] - 1] == entry["prefix"]
     ]
+    return max(matching, key=lambda entry: entry["covered"], default=empty)
+
+def save_summary(conversation, older, replaced, summary):
+    summaries = registry.get("chat_summaries")
+    covered = conversation.offset + len(older)
+
+    if conversation.session_key is not None:
+        summaries.set(conversation.conversation_id, {"summary": summary, "covered": covered})
+        return
+
+    # The new summary extends `replaced`, the user's other conversations keep theirs
+    others = [entry for entry in summaries.get(conversation.conversation_id) or [] if entry["prefix"] != replaced.get("prefix")]
+    entry = {"summary": summary, "covered": covered, "prefix": prefix_hashes(older)[-1]}
+    summaries.set(conversation.conversation_id, [entry] + others[:CHAT_SUMMARIES_PER_USER - 1])
+
+async def summarize_history(conversation, older):
+    """
+    Summarize the history lines that no longer fit the token budget. The summary is
+    kept per conversation and only extended with new lines once they are worth a
+    call; until then they are returned as pending and sent verbatim.
+    """
+    stored = load_summary(conversation, older)
+
+    # `covered` counts messages from the start of the conversation, `older` starts at `offset`
+    pending = older[max(stored["covered"] - conversation.offset, 0):]
+    if estimate_tokens(render_lines(pending)) <= CHAT_SUMMARY_BATCH_TOKENS:
+        return stored["summary"], pending
+
+    inputs = {"summary": stored["summary"] or "No summary yet.", "new_lines": render_lines(pending)}
+    async with provider_limit("google", estimate_prompt_tokens(inputs.values())):
+        with observe_llm_call("google", "chat_summary"):
+            summary = await registry.get("summary_chain").ainvoke(inputs)
+    save_summary(conversation, older, stored, summary)
 
-    prompt = build_prompt()
+    return summary, []
+
+async def build_chat_inputs(user_name: str, conversation: Conversation, token_budget=CHAT_HISTORY_TOKEN_BUDGET):
     
-    llm = GoogleGenerativeAI(model="gemini-1.5-flash") 
+    lines = [render_message(role, text) for role, text in conversation.history]
+    older, recent = split_history(lines, token_budget)
+
+    summary, pending = "", []
+    if older:
+        summary, pending = await summarize_history(conversation, older)
+
+    return {
+        "conversation_summary": summary or "No earlier conversation.",
+        "chat_history": render_lines(pending + recent) or "No previous messages.",
+        "user_name": user_name,
+        "user_query": conversation.user_query
+    }
+
+async def chatbot_executor(user_name: str, conversation: Conversation, token_budget=CHAT_HISTORY_TOKEN_BUDGET):
     
-    chain =  prompt | llm
+    chain = registry.get("chatbot_chain")
+    inputs = await build_chat_inputs(user_name, conversation, token_budget)
+
+    # Identical conversations in flight at the same time share one completion
+    key = content_hash("chat", inputs)
     
-    response = chain.invoke({"chat_history": chat_context, "user_name": user_name, "user_query": user_query})
+    async def complete():
+        async with provider_limit("google", estimate_prompt_tokens(inputs.values())):
+            with observe_llm_call("google", "chat"):
+                return await chain.ainvoke(inputs)
+
+    response = await registry.get("chat_flights").run(key, complete)
+
+    await save_turn(conversation, response)
     
     return response
+
+async def chatbot_stream(user_name: str, conversation: Conversation, token_budget=CHAT_HISTORY_TOKEN_BUDGET):
+    """
+    Yield the answer text chunk by chunk as the model produces it.
+    """
+    chain = registry.get("chatbot_chain")
+    inputs = await build_chat_inputs(user_name, conversation, token_budget)
+
+    chunks = []
+    async with provider_limit("google", estimate_prompt_tokens(inputs.values())):
+        with observe_llm_call("google", "chat"):
+            async for chunk in chain.astream(inputs):
+                chunks.append(chunk)
+                yield chunk
+
+    await save_turn(conversation, "".join(chunks))
@@ -1,8 +1,20 @@
 from langgraph.graph import StateGraph
-from app.api.features.schemas.codexpert_schema import GraphState
-from langgraph.graph import END
+from app.api.features.schemas.codexpert_schema import CodeInput, GraphState
+from langgraph.graph import START, END
 
+import asyncio
+import os
+
+from app.api.features.util.cache import content_hash, normalize_code, normalize_text
+from app.api.features.util.checkpoints import claim_run, finish_run, invoke_run, load_run, new_run_id, resume_run, run_config
+from app.api.features.util.llm_invocation import track_retries
+from app.api.features.util.metrics import observe_node
+from app.api.features.util.rate_limiter import set_priority
+from app.api.features.util.streaming import graph_events
+from app.api.logger import setup_logger
+from app.api.registry import registry
 from app.api.features.util.codexpert_functions import (
+    static_analysis,
     code_evaluation,
     generate_refactoring_suggestions,
     research_design_pattern,
@@ -10,23 +22,233 @@ from app.api.features.util.codexpert_functions import (
     generate_optimized_code
 )
 
-workflow = StateGraph(GraphState)
+logger = setup_logger(__name__)
+
+PIPELINE_MODES = ("sequential", "parallel")
+DEFAULT_PIPELINE_MODE = os.environ.get("CODEXPERT_PIPELINE_MODE", "sequential")
+
+OUTPUT_MODES = ("full", "diff")
+DEFAULT_OUTPUT_MODE = os.environ.get("CODEXPERT_OUTPUT_MODE", "full")
+
+NODES = {
+    "code_evaluation_node": code_evaluation,
+    "generate_refactoring_suggestions": generate_refactoring_suggestions,
+    "research_design_pattern": research_design_pattern,
+    "apply_quality_attributes": apply_quality_attributes,
+    "generate_optimized_code": generate_optimized_code
+}
+
+# Sequential mode: every node waits for the one before it
+SEQUENTIAL_ORDER = [
+    "code_evaluation_node",
+    "generate_refactoring_suggestions",
+    "research_design_pattern",
+    "apply_quality_attributes",
+    "generate_optimized_code"
+]
+
+# Parallel mode: the nodes whose outputs each node actually reads from the state
+NODE_DEPENDENCIES = {
+    "code_evaluation_node": [],
+    "research_design_pattern": [],
+    "generate_refactoring_suggestions": ["code_evaluation_node"],
+    "apply_quality_attributes": ["generate_refactoring_suggestions", "research_design_pattern"],
+    "generate_optimized_code": ["generate_refactoring_suggestions", "research_design_pattern", "apply_quality_attributes"]
+}
+
+def _ancestors(node):
+    ancestors = set()
+    pending = list(NODE_DEPENDENCIES[node])
+    while pending:
+        dependency = pending.pop()
+        if dependency not in ancestors:
+            ancestors.add(dependency)
+            pending.extend(NODE_DEPENDENCIES[dependency])
+    return ancestors
+
+def direct_dependencies(node):
+    """
+    Drop the dependencies already implied by another dependency, so each node
+    only joins on the nodes that can finish last.
+    """
+    dependencies = NODE_DEPENDENCIES[node]
+    implied = set().union(*(_ancestors(dependency) for dependency in dependencies))
+    return [dependency for dependency in dependencies if dependency not in implied]
+
+def route_after_static_analysis(first_nodes):
+    """
+    End the run when the local parser found syntax errors, its `CodeEvaluation` is the
+    answer; otherwise continue with the LLM nodes.
+    """
+    def route(state):
+        facts = state.get("static_analysis")
+        if facts is not None and not facts["parsed"]:
+            return END
+        return first_nodes
+    return route
+
+def build_workflow(mode=DEFAULT_PIPELINE_MODE):
+    if mode not in PIPELINE_MODES:
+        raise ValueError(f"Unknown CodeXpert pipeline mode '{mode}', expected one of {PIPELINE_MODES}")
+
+    workflow = StateGraph(GraphState)
+
+    workflow.add_node("static_analysis_node", observe_node("static_analysis_node", static_analysis))
+    for name, node in NODES.items():
+        workflow.add_node(name, observe_node(name, track_retries(name, node)))
+
+    workflow.add_edge(START, "static_analysis_node")
+
+    if mode == "sequential":
+        first_nodes = SEQUENTIAL_ORDER[:1]
+        for source, target in zip(SEQUENTIAL_ORDER, SEQUENTIAL_ORDER[1:]):
+            workflow.add_edge(source, target)
+    else:
+        first_nodes = [name for name in NODES if not NODE_DEPENDENCIES[name]]
+        for name in NODES:
+            dependencies = direct_dependencies(name)
+            if len(dependencies) == 1:
+                workflow.add_edge(dependencies[0], name)
+            elif dependencies:
+                workflow.add_edge(dependencies, name)
+
+    workflow.add_conditional_edges("static_analysis_node", route_after_static_analysis(first_nodes), [*first_nodes, END])
+    workflow.add_edge('generate_optimized_code', END)
+
+    return workflow
+
+def compile_workflow(mode=DEFAULT_PIPELINE_MODE):
+    codexpert = build_workflow(mode).compile(checkpointer=registry.get("checkpointer"))
+    return codexpert
+
+def cache_key(request):
+    return content_hash(
+        "codexpert",
+        normalize_code(request.code),
+        normalize_text(request.programming_language).lower(),
+        bool(request.is_ai_related),
+        normalize_text(request.context),
+        request.output_mode or DEFAULT_OUTPUT_MODE,
+        request.include_optimized_code
+    )
+
+def initial_state(request, run_id):
+    return {
+        "code": request.code,
+        "programming_language": request.programming_language,
+        "is_ai_related": request.is_ai_related,
+        "context": request.context,
+        "pipeline_mode": request.pipeline_mode or DEFAULT_PIPELINE_MODE,
+        "structured_output_mode": request.structured_output_mode,
+        "output_mode": request.output_mode or DEFAULT_OUTPUT_MODE,
+        "include_optimized_code": request.include_optimized_code,
+        "run_id": run_id
+    }
+
+def select_graph(pipeline_mode):
+    return registry.get(f"codexpert_{pipeline_mode or DEFAULT_PIPELINE_MODE}_graph")
+
+async def run_codexpert(request):
+    """
+    Run the CodeXpert graph for a `CodeInput`, answering from the result cache when
+    the same normalized submission was already analysed and sharing one execution
+    between identical submissions that are in flight at the same time.
+
+    A request with its own `run_id` always gets a run of its own: a cached or shared
+    result would carry another run's id and the client's run would never exist.
+    """
+    # Pipelines leave the reserved provider slots to interactive chat
+    set_priority("pipeline")
+
+    cache = registry.get("codexpert_cache")
+    key = cache_key(request)
+
+    async def execute():
+        run_id = request.run_id or new_run_id()
+        result = await invoke_run(select_graph(request.pipeline_mode), initial_state(request, run_id), run_id)
+        await cache.set(key, result)
+        return result
+
+    if request.run_id:
+        return await execute()
+
+    cached_result = await cache.get(key)
+    if cached_result is not None:
+        logger.info(f"CodeXpert cache hit: {key[:12]}")
+        return cached_result
+
+    return await registry.get("codexpert_flights").run(key, execute)
+
+async def stream_codexpert(request):
+    """
+    Same as `run_codexpert`, but yields each node's result as soon as it is ready.
+    A cache hit yields the final result straight away, unless the request names its
+    own `run_id`.
+    """
+    set_priority("pipeline")
+
+    cache = registry.get("codexpert_cache")
+    key = cache_key(request)
+
+    cached_result = None if request.run_id else await cache.get(key)
+    if cached_result is not None:
+        logger.info(f"CodeXpert cache hit: {key[:12]}")
+        yield "done", cached_result
+        return
+
+    run_id = request.run_id or new_run_id()
+    yield "run", {"run_id": run_id}
+
+    graph = select_graph(request.pipeline_mode)
+    async with claim_run(run_id):
+        async for event, data in graph_events(graph, initial_state(request, run_id), run_config(run_id)):
+            if event == "done":
+                await finish_run(run_id)
+                await cache.set(key, data)
+            yield event, data
+
+async def resume_codexpert(run_id):
+    """
+    Continue an interrupted CodeXpert run from its last completed node.
+    """
+    set_priority("pipeline")
+
+    snapshot = await load_run(select_graph(DEFAULT_PIPELINE_MODE), run_id)
+    result = await resume_run(select_graph(snapshot.values.get("pipeline_mode")), run_id)
+
+    request = CodeInput.model_construct(**{field: result.get(field) for field in ("code", "programming_language", "is_ai_related", "context", "output_mode", "include_optimized_code")})
+    await registry.get("codexpert_cache").set(cache_key(request), result)
+    return result
 
-workflow.add_node("code_evaluation_node", code_evaluation)
-workflow.add_node("generate_refactoring_suggestions", generate_refactoring_suggestions)
-workflow.add_node("research_design_pattern", research_design_pattern)
-workflow.add_node("apply_quality_attributes", apply_quality_attributes)
-workflow.add_node("generate_optimized_code", generate_optimized_code)
+async def run_codexpert_batch(items, max_concurrency):
+    """
+    Run CodeXpert over a batch with at most `max_concurrency` graphs at a time,
+    yielding `{"index", "result"}` or `{"index", "error"}` entries as items finish.
+    Items with the same cache key inside the batch are analysed once, except those
+    with their own `run_id`.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
 
-workflow.set_entry_point("code_evaluation_node")
+    indices_by_key = {}
+    for index, item in enumerate(items):
+        key = ("run", index) if item.run_id else cache_key(item)
+        indices_by_key.setdefault(key, []).append(index)
 
-workflow.add_edge('code_evaluation_node', "generate_refactoring_suggestions")
-workflow.add_edge('generate_refactoring_suggestions', "research_design_pattern")
-workflow.add_edge('research_design_pattern', "apply_quality_attributes")
-workflow.add_edge('apply_quality_attributes', "generate_optimized_code")
+    async def run_one(indices):
+        async with semaphore:
+            try:
+                return indices, {"result": await run_codexpert(items[indices[0]])}
+            except Exception as e:
+                logger.error(f"Error in batch item {indices[0]}: {e}")
+                return indices, {"error": f"Error in executor: {e}", "run_id": getattr(e, "run_id", None)}
 
-workflow.add_edge('generate_optimized_code', END)
+    tasks = [asyncio.ensure_future(run_one(indices)) for indices in indices_by_key.values()]
 
-def compile_workflow():
-    codexpert = workflow.compile()
-    return codexpert
\ No newline at end of file
+    try:
+        for finished in asyncio.as_completed(tasks):
+            indices, outcome = await finished
+            for index in indices:
+                yield {"index": index, **outcome}
+    finally:
+        for task in tasks:
+            task.cancel()
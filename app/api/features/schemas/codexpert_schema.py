@@ -1,11 +1,23 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, TypedDict
+from typing import Annotated, List, Literal, Optional, Dict, TypedDict
+
+import os
 
 class CodeInput(BaseModel):
     code: str = Field(..., description="The code provided by the user to be analyzed and optimized")
     programming_language: str = Field(..., description="The programming language of the provided code (e.g., Python, Java, etc.)")
     is_ai_related: bool = Field(None, description="Indicates if the code is related to AI, for researching design patterns using Tavily if applicable")
     context: str = Field(None, description="Optional context or description of the problem the code is addressing")
+    pipeline_mode: Optional[Literal["sequential", "parallel"]] = Field(None, description="How the CodeXpert nodes are scheduled; defaults to the CODEXPERT_PIPELINE_MODE setting")
+    structured_output_mode: Optional[Literal["prompt", "native"]] = Field(None, description="How node results are structured: JSON format instructions in the prompt or the provider's native structured output; defaults to the STRUCTURED_OUTPUT_MODE setting")
+    run_id: Optional[str] = Field(None, description="Identifier of the run, used to resume it after a failure; generated when not given")
+    output_mode: Optional[Literal["full", "diff"]] = Field(None, description="How the optimized code is generated: the whole file, or edits applied locally and returned as a unified diff; defaults to the CODEXPERT_OUTPUT_MODE setting")
+    include_optimized_code: bool = Field(True, description="In diff output mode, also return the patched file in `optimized_code`")
+
+class CodeBatchInput(BaseModel):
+    items: List[CodeInput] = Field(..., min_length=1, max_length=int(os.environ.get("CODEXPERT_BATCH_MAX_ITEMS", 500)), description="The code submissions to analyse")
+    max_concurrency: int = Field(int(os.environ.get("CODEXPERT_BATCH_CONCURRENCY", 4)), ge=1, le=32, description="Maximum number of CodeXpert runs executed at the same time")
+    stream: bool = Field(False, description="Stream each result as an NDJSON line as soon as it finishes instead of returning them all at the end")
 
 class CodeEvaluation(BaseModel):
     works: bool = Field(..., description="Indicates if the code works as expected")
@@ -27,11 +39,33 @@ class QualityAttributesApplication(BaseModel):
 class CodeOutput(BaseModel):
     optimized_code: str = Field(..., description="The optimized version of the provided code after processing")
 
+class CodeEdit(BaseModel):
+    original: str = Field(..., description="Consecutive lines copied verbatim from the provided code, long enough to appear only once in it")
+    replacement: str = Field(..., description="The text that replaces `original`")
+
+class CodePatch(BaseModel):
+    edits: List[CodeEdit] = Field(..., description="Edits that turn the provided code into its optimized version, in file order; empty when no change is needed")
+
+def merge_node_retries(left, right):
+    return {**(left or {}), **(right or {})}
+
 class GraphState(TypedDict):
     code: str
     programming_language: str
     is_ai_related: bool
     context: str
+    pipeline_mode: str
+    structured_output_mode: str
+    output_mode: str
+    include_optimized_code: bool
+    run_id: str
+
+    # Facts from the local parser, None when the language has none
+    static_analysis: Optional[Dict]
+
+    # Large inputs only: the units analysed separately, and each unit's evaluation by index
+    units: Optional[List[Dict]]
+    unit_evaluations: Optional[Dict[str, CodeEvaluation]]
 
     code_evaluation: CodeEvaluation
 
@@ -41,4 +75,9 @@ class GraphState(TypedDict):
 
     quality_attributes_application: QualityAttributesApplication
 
-    optimized_code: CodeOutput
\ No newline at end of file
+    optimized_code: CodeOutput
+
+    # Diff output mode only: the applied edits as a unified diff
+    optimized_code_patch: Optional[str]
+
+    node_retries: Annotated[Dict[str, int], merge_node_retries]
\ No newline at end of file
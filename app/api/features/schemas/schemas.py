@@ -1,6 +1,6 @@
 from enum import Enum
 from typing import Any, List, Optional
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 
 class User(BaseModel):
     id: str
@@ -41,7 +41,17 @@ class GenericRequest(BaseModel):
     type: RequestType
 
 class ChatRequest(GenericRequest):
-    messages: List[Message]
+    messages: Optional[List[Message]] = None
+    # Session mode: the server keeps the history, the client only sends the new message
+    session_id: Optional[str] = None
+    message: Optional[Message] = None
+
+    @model_validator(mode="after")
+    def check_conversation(self):
+        if not self.messages and self.message is None:
+            raise ValueError("Either 'messages' or 'message' (with an optional 'session_id') must be provided")
+        return self
 
 class ChatResponse(BaseModel):
-    data: List[Message]
\ No newline at end of file
+    data: List[Message]
+    session_id: Optional[str] = None
\ No newline at end of file
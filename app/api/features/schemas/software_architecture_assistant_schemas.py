@@ -1,11 +1,14 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 from typing import Dict
 
 class SoftwareArchitectureAssistantArgs(BaseModel):
     img_url: str
     requirements: str
     lang: str
+    use_cache: bool = True
+    structured_output_mode: Optional[Literal["prompt", "native"]] = None
+    run_id: Optional[str] = None
 
 class Component(BaseModel):
     name: str = Field(..., description="The name of the component, such as 'API Gateway' or 'Database'.")
@@ -57,12 +60,19 @@ class QualityAttributesSchema(BaseModel):
     quality_attributes: List[QualityAttribute] = Field(..., description="A list of quality attributes applied to the architecture.")
     quality_evaluation: Dict[str, int] = Field(None, description="Evaluation of the quality attributes' implementation status.")
 
-from typing import Dict, TypedDict, Optional
+from typing import Annotated, Dict, TypedDict, Optional
+
+def merge_node_retries(left, right):
+    return {**(left or {}), **(right or {})}
 
 class GraphState(TypedDict):
     img_url: str
+    img_hash: str
     requirements: str
     lang: str
+    use_cache: bool
+    structured_output_mode: str
+    run_id: str
 
     detected_architecture: ArchitectureSchema
 
@@ -70,4 +80,6 @@ class GraphState(TypedDict):
 
     improved_architecture: ArchitectureImprovementSchema
 
-    architecture_with_quality_attributes: QualityAttributesSchema
\ No newline at end of file
+    architecture_with_quality_attributes: QualityAttributesSchema
+
+    node_retries: Annotated[Dict[str, int], merge_node_retries]
\ No newline at end of file
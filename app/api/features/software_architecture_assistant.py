@@ -1,27 +1,115 @@
 from langgraph.graph import StateGraph
 from app.api.features.schemas.software_architecture_assistant_schemas import GraphState
+from app.api.features.util.cache import content_hash, memoize_node, normalize_text
+from app.api.features.util.checkpoints import claim_run, finish_run, invoke_run, new_run_id, resume_run, run_config
+from app.api.features.util.llm_invocation import track_retries
+from app.api.features.util.metrics import observe_node
+from app.api.features.util.rate_limiter import set_priority
+from app.api.features.util.streaming import graph_events
 from app.api.features.util.software_architecture_assistant_functions import (
     evaluate_architecture_quality,
     generate_architecture_description,
     suggest_architecture_improvements, 
     validate_architecture
 )
+from app.api.logger import setup_logger
+from app.api.registry import registry
 from langgraph.graph import END
 
-workflow = StateGraph(GraphState)
+logger = setup_logger(__name__)
 
-workflow.add_node("generate_architecture_description", generate_architecture_description)
-workflow.add_node("validate_architecture", validate_architecture)
-workflow.add_node("suggest_architecture_improvements", suggest_architecture_improvements)
-workflow.add_node("evaluate_architecture_quality", evaluate_architecture_quality)
+# State fields each node reads, used as its memoization key
+NODE_CACHE_KEYS = {
+    "generate_architecture_description": ["img_hash", "lang"],
+    "validate_architecture": ["detected_architecture", "requirements", "lang"],
+    "suggest_architecture_improvements": ["architecture_with_requirements", "requirements", "lang"],
+    "evaluate_architecture_quality": ["improved_architecture", "lang"]
+}
 
-workflow.set_entry_point("generate_architecture_description")
+def build_workflow():
+    node_cache = registry.get("architecture_node_cache")
 
-workflow.add_edge('generate_architecture_description', "validate_architecture")
-workflow.add_edge('validate_architecture', "suggest_architecture_improvements")
-workflow.add_edge('suggest_architecture_improvements', "evaluate_architecture_quality")
-workflow.add_edge('evaluate_architecture_quality', END)
+    def memoized(name, node):
+        # Retries are tracked outside the cache so a cache hit reports none
+        return observe_node(name, track_retries(name, memoize_node(node_cache, name, NODE_CACHE_KEYS[name])(node)))
+
+    workflow = StateGraph(GraphState)
+
+    workflow.add_node("generate_architecture_description", memoized("generate_architecture_description", generate_architecture_description))
+    workflow.add_node("validate_architecture", memoized("validate_architecture", validate_architecture))
+    workflow.add_node("suggest_architecture_improvements", memoized("suggest_architecture_improvements", suggest_architecture_improvements))
+    workflow.add_node("evaluate_architecture_quality", memoized("evaluate_architecture_quality", evaluate_architecture_quality))
+
+    workflow.set_entry_point("generate_architecture_description")
+
+    workflow.add_edge('generate_architecture_description', "validate_architecture")
+    workflow.add_edge('validate_architecture', "suggest_architecture_improvements")
+    workflow.add_edge('suggest_architecture_improvements', "evaluate_architecture_quality")
+    workflow.add_edge('evaluate_architecture_quality', END)
+
+    return workflow
 
 def compile_workflow():
-    architecture_assistant = workflow.compile()
-    return architecture_assistant
\ No newline at end of file
+    architecture_assistant = build_workflow().compile(checkpointer=registry.get("checkpointer"))
+    return architecture_assistant
+
+def initial_state(image, img_url, requirements, lang, use_cache=True, structured_output_mode=None, run_id=None):
+    # The image bytes stay out of the checkpointed state, the nodes look them up by hash
+    registry.get("ingested_images").set(image.content_hash, image)
+    if img_url.startswith("data:"):
+        img_url = f"inline:{image.content_hash[:12]}"
+
+    return {
+        "img_url": img_url,
+        "img_hash": image.content_hash,
+        "requirements": requirements,
+        "lang": lang,
+        "use_cache": use_cache,
+        "structured_output_mode": structured_output_mode,
+        "run_id": run_id
+    }
+
+async def run_architecture_assistant(image, img_url, requirements, lang, use_cache=True, structured_output_mode=None, run_id=None):
+    """
+    Run the architecture graph on an already ingested image, sharing one execution
+    between identical requests in flight.
+    """
+    # Pipelines leave the reserved provider slots to interactive chat
+    set_priority("pipeline")
+
+    async def execute():
+        architecture_assistant = registry.get("architecture_graph")
+        execution_id = run_id or new_run_id()
+        state = initial_state(image, img_url, requirements, lang, use_cache, structured_output_mode, execution_id)
+        return await invoke_run(architecture_assistant, state, execution_id)
+
+    # A request that bypasses the cache, or names its own run, asks for a fresh run, so it
+    # is not coalesced either
+    if not use_cache or run_id:
+        return await execute()
+
+    key = content_hash("architecture", image.content_hash, normalize_text(requirements), lang)
+    return await registry.get("architecture_flights").run(key, execute)
+
+async def stream_architecture_assistant(image, img_url, requirements, lang, use_cache=True, structured_output_mode=None, run_id=None):
+    set_priority("pipeline")
+
+    run_id = run_id or new_run_id()
+    yield "run", {"run_id": run_id}
+
+    architecture_assistant = registry.get("architecture_graph")
+    state = initial_state(image, img_url, requirements, lang, use_cache, structured_output_mode, run_id)
+
+    async with claim_run(run_id):
+        async for event, data in graph_events(architecture_assistant, state, run_config(run_id)):
+            if event == "done":
+                await finish_run(run_id)
+            yield event, data
+
+async def resume_architecture_assistant(run_id):
+    """
+    Continue an interrupted architecture run from its last completed node.
+    """
+    set_priority("pipeline")
+
+    return await resume_run(registry.get("architecture_graph"), run_id)
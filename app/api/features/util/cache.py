@@ -0,0 +1,202 @@
+import asyncio
+import functools
+import hashlib
+import json
+import sqlite3
+import textwrap
+import threading
+import time
+from collections import OrderedDict
+
+from app.api.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+def normalize_code(code):
+    """
+    Normalize a code snippet so that submissions differing only in line endings,
+    trailing spaces, surrounding blank lines or common indentation share a key.
+    """
+    code = code.replace("\r\n", "\n").replace("\r", "\n")
+    lines = [line.rstrip() for line in textwrap.dedent(code).split("\n")]
+    return "\n".join(lines).strip("\n")
+
+def normalize_text(text):
+    return " ".join(text.split()) if text else ""
+
+def content_hash(*parts):
+    payload = json.dumps(parts, sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+class LRUCache:
+    """
+    Bounded in-memory cache with least-recently-used eviction and a per-entry TTL.
+    """
+
+    def __init__(self, max_size=256, ttl=3600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations
+        }
+
+class SQLiteCache:
+    """
+    Cache tier stored in a SQLite file, shared by every worker process on the instance
+    and kept across restarts. Values must be JSON serializable.
+    """
+
+    def __init__(self, path, ttl=3600):
+        self.path = path
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, value TEXT NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        with self._connect() as connection:
+            row = connection.execute("SELECT expires_at, value FROM cache WHERE key = ?", (key,)).fetchone()
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            expires_at, value = row
+            if expires_at < time.time():
+                connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+        self.hits += 1
+        return json.loads(value)
+
+    def set(self, key, value):
+        with self._connect() as connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO cache (key, expires_at, value) VALUES (?, ?, ?)",
+                (key, time.time() + self.ttl, json.dumps(value, default=str))
+            )
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expirations": self.expirations
+        }
+
+class TieredCache:
+    """
+    In-memory LRU in front of an optional SQLite tier. Disk hits are promoted to memory.
+    """
+
+    def __init__(self, memory, disk=None):
+        self.memory = memory
+        self.disk = disk
+
+    async def get(self, key):
+        value = self.memory.get(key)
+        if value is not None or self.disk is None:
+            return value
+
+        try:
+            value = await asyncio.to_thread(self.disk.get, key)
+        except sqlite3.Error as e:
+            logger.warning(f"Disk cache lookup failed: {e}")
+            return None
+
+        if value is not None:
+            self.memory.set(key, value)
+        return value
+
+    async def set(self, key, value):
+        self.memory.set(key, value)
+        if self.disk is None:
+            return
+
+        try:
+            await asyncio.to_thread(self.disk.set, key, value)
+        except sqlite3.Error as e:
+            logger.warning(f"Disk cache write failed: {e}")
+
+    def stats(self):
+        return {
+            "memory": self.memory.stats(),
+            "disk": self.disk.stats() if self.disk else None
+        }
+
+def memoize_node(cache, node_name, key_fields):
+    """
+    Wrap an async graph node so its state update is cached by a hash of the state
+    fields it reads. When the state has `use_cache` set to false the lookup is
+    skipped, but the fresh update still replaces the cached one.
+    """
+    def decorator(node):
+        @functools.wraps(node)
+        async def wrapper(state):
+            key = content_hash(node_name, *(state.get(field) for field in key_fields))
+
+            if state.get("use_cache", True):
+                cached_update = cache.get(key)
+                if cached_update is not None:
+                    logger.info(f"Node cache hit for {node_name}: {key[:12]}")
+                    return cached_update
+
+            update = await node(state)
+            cache.set(key, update)
+            return update
+        return wrapper
+    return decorator
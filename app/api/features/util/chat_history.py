@@ -0,0 +1,46 @@
+import os
+
+CHAT_HISTORY_TOKEN_BUDGET = int(os.environ.get("CHAT_HISTORY_TOKEN_BUDGET", 2000))
+CHAT_MESSAGE_MAX_TOKENS = int(os.environ.get("CHAT_MESSAGE_MAX_TOKENS", 500))
+CHAT_SUMMARY_BATCH_TOKENS = int(os.environ.get("CHAT_SUMMARY_BATCH_TOKENS", 500))
+
+# Rough average for English text and code, good enough to size a prompt without calling the provider
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def truncate_text(text, max_tokens=CHAT_MESSAGE_MAX_TOKENS):
+    """
+    Keep the head and tail of an oversized message (e.g. a pasted stack trace), where
+    the useful lines usually are.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+
+    half = max_chars // 2
+    omitted = len(text) - 2 * half
+    return f"{text[:half]}\n[... {omitted} characters omitted ...]\n{text[-half:]}"
+
+def render_message(role, text):
+    return f"{role}: {truncate_text(text)}"
+
+def render_lines(lines):
+    return "\n".join(lines)
+
+def split_history(lines, token_budget=CHAT_HISTORY_TOKEN_BUDGET):
+    """
+    Split rendered history lines into `(older, recent)`, where `recent` is the longest
+    suffix that fits in `token_budget`.
+    """
+    used = 0
+    start = len(lines)
+    for index in range(len(lines) - 1, -1, -1):
+        cost = estimate_tokens(lines[index])
+        if used + cost > token_budget:
+            break
+        used += cost
+        start = index
+
+    return lines[:start], lines[start:]
@@ -0,0 +1,172 @@
+import asyncio
+import contextlib
+import os
+import tempfile
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from app.api.logger import setup_logger
+from app.api.registry import registry
+
+logger = setup_logger(__name__)
+
+CHECKPOINT_TTL = float(os.environ.get("CHECKPOINT_TTL", 24 * 3600))
+CHECKPOINT_PURGE_INTERVAL = float(os.environ.get("CHECKPOINT_PURGE_INTERVAL", 3600))
+
+# Runs executing in this process, so an id is never run twice at the same time
+_active_runs = set()
+
+class RunNotFound(LookupError):
+    pass
+
+class RunConflict(ValueError):
+    """
+    The `run_id` of a new run already has a checkpoint, or is running.
+    """
+
+class RunFailed(Exception):
+    """
+    A checkpointed graph run stopped with an error; it can be resumed with `run_id`.
+    """
+
+    def __init__(self, run_id, error):
+        super().__init__(str(error))
+        self.run_id = run_id
+
+def checkpoint_path():
+    """
+    CHECKPOINT_DB, or a file in the temporary directory, the only writable one on
+    read-only platforms such as App Engine standard. None when its directory is not writable.
+    """
+    path = os.environ.get("CHECKPOINT_DB") or os.path.join(tempfile.gettempdir(), "checkpoints.sqlite")
+    if not os.access(os.path.dirname(os.path.abspath(path)), os.W_OK):
+        return None
+    return path
+
+def build_checkpointer():
+    """
+    Checkpoint store shared by the graphs: a SQLite file at `checkpoint_path()` by default,
+    or process memory with CHECKPOINT_STORE=memory or when no writable path is available.
+    Must be built inside the event loop.
+    """
+    path = checkpoint_path()
+    if os.environ.get("CHECKPOINT_STORE", "sqlite") == "memory" or path is None:
+        if path is None:
+            logger.warning("Checkpoint directory is not writable, keeping checkpoints in memory")
+        from langgraph.checkpoint.memory import MemorySaver
+        return MemorySaver()
+
+    import aiosqlite
+    from langgraph.checkpoint.sqlite.aio import AsyncSqliteSaver
+
+    # The connection is opened by the saver on first use
+    return AsyncSqliteSaver(aiosqlite.connect(path))
+
+async def close_checkpointer(checkpointer):
+    conn = getattr(checkpointer, "conn", None)
+    if conn is not None and conn.is_alive():
+        await conn.close()
+
+def new_run_id():
+    return uuid.uuid4().hex
+
+def run_config(run_id):
+    return {"configurable": {"thread_id": run_id}}
+
+async def finish_run(run_id):
+    # Finished runs are answered from the result caches, their checkpoints are not needed
+    await registry.get("checkpointer").adelete_thread(run_id)
+
+@contextlib.asynccontextmanager
+async def claim_run(run_id, resume=False):
+    """
+    Hold `run_id` while its graph runs. A run id that is already running is refused, and
+    so is a new run whose id has a checkpoint, instead of continuing on top of that state.
+    """
+    if run_id in _active_runs:
+        raise RunConflict(f"Run '{run_id}' is already running")
+
+    _active_runs.add(run_id)
+    try:
+        if not resume and await registry.get("checkpointer").aget_tuple(run_config(run_id)) is not None:
+            raise RunConflict(f"Run '{run_id}' already exists, resume it or use a new run_id")
+        yield
+    finally:
+        _active_runs.discard(run_id)
+
+async def invoke_run(graph, state, run_id):
+    """
+    Run `graph` from `state`, checkpointing after every node under `run_id`.
+    """
+    async with claim_run(run_id):
+        try:
+            result = await graph.ainvoke(state, run_config(run_id))
+        except Exception as e:
+            raise RunFailed(run_id, e) from e
+
+        await finish_run(run_id)
+    return result
+
+async def load_run(graph, run_id):
+    snapshot = await graph.aget_state(run_config(run_id))
+    if not snapshot.values:
+        raise RunNotFound(f"Run '{run_id}' not found or already completed")
+    return snapshot
+
+async def resume_run(graph, run_id):
+    """
+    Continue an interrupted run from its last completed node, so only the remaining
+    nodes are executed.
+    """
+    async with claim_run(run_id, resume=True):
+        snapshot = await load_run(graph, run_id)
+        logger.info(f"Resuming run {run_id} at {list(snapshot.next)}")
+
+        try:
+            result = await graph.ainvoke(None, run_config(run_id))
+        except Exception as e:
+            raise RunFailed(run_id, e) from e
+
+        await finish_run(run_id)
+    return result
+
+async def purge_stale_runs(checkpointer, ttl=CHECKPOINT_TTL):
+    """
+    Delete the checkpoints of runs whose last node finished more than `ttl` seconds
+    ago: failed runs nobody resumed and runs abandoned mid-way.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=ttl)
+    last_update = {}
+    async for checkpoint in checkpointer.alist(None):
+        thread_id = checkpoint.config["configurable"]["thread_id"]
+        timestamp = datetime.fromisoformat(checkpoint.checkpoint["ts"])
+        last_update[thread_id] = max(last_update.get(thread_id, timestamp), timestamp)
+
+    stale = [thread_id for thread_id, timestamp in last_update.items() if timestamp < cutoff and thread_id not in _active_runs]
+    for thread_id in stale:
+        await checkpointer.adelete_thread(thread_id)
+
+    if stale:
+        logger.info(f"Purged the checkpoints of {len(stale)} stale runs")
+    return len(stale)
+
+async def purge_sessions():
+    purged = await registry.get("session_store").purge()
+    if purged:
+        logger.info(f"Purged {purged} messages of expired chat sessions")
+    return purged
+
+async def purge_periodically(interval=CHECKPOINT_PURGE_INTERVAL):
+    """
+    Every `interval` seconds, delete stale run checkpoints and expired chat sessions.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await purge_stale_runs(registry.get("checkpointer"))
+        except Exception as e:
+            logger.warning(f"Checkpoint purge failed: {e}")
+        try:
+            await purge_sessions()
+        except Exception as e:
+            logger.warning(f"Chat session purge failed: {e}")
@@ -0,0 +1,212 @@
+import ast
+import asyncio
+import os
+
+from app.api.features.util.cache import content_hash, normalize_code
+from app.api.features.util.static_analysis import line_metrics
+from app.api.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+LARGE_INPUT_LINES = int(os.environ.get("CODEXPERT_LARGE_INPUT_LINES", 300))
+UNIT_MAX_LINES = int(os.environ.get("CODEXPERT_UNIT_MAX_LINES", 150))
+UNIT_CONCURRENCY = int(os.environ.get("CODEXPERT_UNIT_CONCURRENCY", 8))
+
+def _python_units(code, tree=None):
+    """
+    Top-level functions and classes, with their decorators, and the module-level
+    statements between them grouped into one unit per run of statements.
+
+    Units are fingerprinted by their AST without positions, so comments, formatting
+    and edits elsewhere in the file leave the fingerprint unchanged.
+    """
+    tree = tree or ast.parse(code)
+    units = []
+    for node in tree.body:
+        start = min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+        dump = ast.dump(node)
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            kind = "class" if isinstance(node, ast.ClassDef) else "function"
+            units.append({"name": node.name, "kind": kind, "start_line": start, "end_line": node.end_lineno, "fingerprint": content_hash("ast", dump)})
+        elif units and units[-1]["kind"] == "module":
+            units[-1]["end_line"] = node.end_lineno
+            units[-1]["fingerprint"] = content_hash("ast", units[-1]["fingerprint"], dump)
+        else:
+            units.append({"name": "module code", "kind": "module", "start_line": start, "end_line": node.end_lineno, "fingerprint": content_hash("ast", dump)})
+    return units
+
+def _block_units(lines):
+    """
+    Runs of non-blank lines, for languages without a local parser.
+    """
+    units = []
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        if units and units[-1]["end_line"] == number - 1:
+            units[-1]["end_line"] = number
+        else:
+            units.append({"name": "code", "kind": "block", "start_line": number, "end_line": number})
+    for unit in units:
+        unit["fingerprint"] = _text_fingerprint(lines, unit["start_line"], unit["end_line"])
+    return units
+
+def _text_fingerprint(lines, start_line, end_line):
+    return content_hash("text", normalize_code("\n".join(lines[start_line - 1:end_line])))
+
+def _ends_group(unit, max_lines):
+    """
+    Content-defined boundary: whether a group of packed units closes after `unit`
+    depends only on the unit itself, about once every `max_lines` lines. An edit
+    then only regroups the units around it, and every other group keeps its
+    fingerprint.
+    """
+    size = unit["end_line"] - unit["start_line"] + 1
+    return int(unit["fingerprint"][:8], 16) % max_lines < size
+
+def _windows(lines, start_line, end_line, max_lines):
+    """
+    Split a line range into pieces of at most `max_lines`, cut at a blank line when
+    there is one in the second half of the piece.
+    """
+    pieces = []
+    start = start_line
+    while start <= end_line:
+        end = min(start + max_lines - 1, end_line)
+        if end < end_line:
+            blank = next((number for number in range(end, start + max_lines // 2, -1) if not lines[number - 1].strip()), None)
+            end = blank or end
+        pieces.append((start, end))
+        start = end + 1
+    return pieces
+
+def _pack(units, lines, max_lines):
+    """
+    Split units longer than `max_lines` and merge consecutive small ones, so every
+    unit is one LLM call of at most `max_lines` lines.
+    """
+    packed = []
+    group_open = False
+    for unit in units:
+        size = unit["end_line"] - unit["start_line"] + 1
+        if size > max_lines:
+            pieces = _windows(lines, unit["start_line"], unit["end_line"], max_lines)
+            for part, (start, end) in enumerate(pieces, start=1):
+                packed.append({
+                    **unit,
+                    "name": f"{unit['name']} (part {part} of {len(pieces)})",
+                    "start_line": start,
+                    "end_line": end,
+                    "fingerprint": _text_fingerprint(lines, start, end)
+                })
+            group_open = False
+            continue
+
+        if group_open and unit["end_line"] - packed[-1]["start_line"] + 1 <= max_lines:
+            packed[-1] = {
+                "name": f"{packed[-1]['name'].split(' to ')[0]} to {unit['name']}",
+                "kind": packed[-1]["kind"] if packed[-1]["kind"] == unit["kind"] else "mixed",
+                "start_line": packed[-1]["start_line"],
+                "end_line": unit["end_line"],
+                "fingerprint": content_hash(packed[-1]["fingerprint"], unit["fingerprint"])
+            }
+        else:
+            packed.append(dict(unit))
+        group_open = not _ends_group(unit, max_lines)
+    return packed
+
+def split_units(code, facts=None, max_lines=UNIT_MAX_LINES, tree=None):
+    """
+    Split a large file into units for the per-unit analysis. Returns None when the code
+    is below `CODEXPERT_LARGE_INPUT_LINES`. Python files are split along top-level
+    definitions, reusing `tree` when the caller already parsed them; other languages
+    at blank lines.
+    """
+    lines = code.splitlines()
+    if len(lines) <= LARGE_INPUT_LINES:
+        return None
+
+    if facts and facts["parsed"] and facts["language"] == "python":
+        units = _python_units(code, tree)
+    else:
+        units = _block_units(lines)
+
+    units = _pack(units, lines, max_lines)
+    for unit in units:
+        if unit["kind"] == "block":
+            unit["name"] = f"lines {unit['start_line']}-{unit['end_line']}"
+
+    logger.info(f"Large input of {len(lines)} lines split into {len(units)} units")
+    return units or None
+
+def unit_code(code, unit):
+    return "\n".join(code.splitlines()[unit["start_line"] - 1:unit["end_line"]])
+
+def unit_facts(facts, code, unit):
+    """
+    The static analysis facts that fall inside a unit of `code`.
+    """
+    if not facts or not facts["parsed"]:
+        return None
+
+    inside = lambda item: unit["start_line"] <= item["line"] <= unit["end_line"]
+    functions = [function for function in facts["functions"] if inside(function)]
+    classes = [cls for cls in facts["classes"] if inside(cls)]
+    return {
+        **facts,
+        "functions": functions,
+        "classes": classes,
+        "imports": [],
+        "metrics": {
+            **facts["metrics"],
+            **line_metrics(unit_code(code, unit)),
+            "functions": len(functions),
+            "classes": len(classes),
+            "max_complexity": max((function["complexity"] for function in functions), default=1)
+        }
+    }
+
+def outline(code, units):
+    """
+    One line per unit with its first line of code, given to the stages that reason
+    about the file as a whole instead of the full source.
+    """
+    lines = code.splitlines()
+    entries = []
+    for unit in units:
+        first_line = next((line.strip() for line in lines[unit["start_line"] - 1:unit["end_line"]] if line.strip()), "")
+        entries.append(f"- {unit['name']} (lines {unit['start_line']}-{unit['end_line']}): {first_line}")
+    return f"File of {len(lines)} lines, too large to include; outline of its units:\n" + "\n".join(entries)
+
+async def map_units(units, analyze_unit, concurrency=UNIT_CONCURRENCY):
+    """
+    Run `analyze_unit(index, unit)` for every unit, at most `concurrency` at a time,
+    and return the results in unit order.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def run(index, unit):
+        async with semaphore:
+            return await analyze_unit(index, unit)
+
+    return await asyncio.gather(*[run(index, unit) for index, unit in enumerate(units)])
+
+def merge_evaluations(units, evaluations):
+    errors = [
+        f"{unit['name']}: {error}"
+        for unit, evaluation in zip(units, evaluations)
+        for error in evaluation.get("errors") or []
+    ]
+    return {
+        "works": all(evaluation["works"] for evaluation in evaluations),
+        "errors": errors or None
+    }
+
+def merge_refactoring_suggestions(units, results):
+    suggestions, rationale = [], []
+    for unit, result in zip(units, results):
+        unit_rationale = list(result["rationale"])
+        for index, suggestion in enumerate(result["suggestions"]):
+            suggestions.append(f"{unit['name']}: {suggestion}")
+            rationale.append(unit_rationale[index] if index < len(unit_rationale) else "")
+    return {"suggestions": suggestions, "rationale": rationale}
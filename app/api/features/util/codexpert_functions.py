@@ -1,58 +1,166 @@
-from dotenv import load_dotenv, find_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.schema import (
+import asyncio
+
+from langchain_core.messages import (
        AIMessage,
        HumanMessage,
        SystemMessage
   )
-from langchain_core.output_parsers import JsonOutputParser
-from langchain_community.tools.tavily_search import TavilySearchResults
-from langgraph.prebuilt import create_react_agent
-from app.api.features.schemas.codexpert_schema import CodeEvaluation, CodeOutput, DesignPatternResearch, QualityAttributesApplication, RefactoringSuggestions
-from app.api.logger import setup_logger
+from app.api.features.schemas.codexpert_schema import CodeEvaluation, CodeOutput, CodePatch, DesignPatternResearch, QualityAttributesApplication, RefactoringSuggestions
+from app.api.logger import log_payload, setup_logger
+from app.api.registry import registry
+from app.api.features.util.cache import content_hash, normalize_text
+from app.api.features.util.llm_invocation import format_instructions_for, invoke_agent_structured, invoke_structured, resolve_mode
+from app.api.features.util.chunking import map_units, merge_evaluations, merge_refactoring_suggestions, outline, split_units, unit_code, unit_facts
+from app.api.features.util.patching import PatchError, apply_edits, unified_diff
+from app.api.features.util.static_analysis import analyze, analyze_with_tree, render_facts
 
 logger = setup_logger(__name__)
-load_dotenv(find_dotenv())
 
-chat_openai_llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0.7)
+def analyze_code(code, programming_language):
+    """
+    Static analysis and, for a large file, its units, from a single parse. This is
+    CPU-bound on large inputs, so the node runs it in a worker thread.
+    """
+    facts, tree = analyze_with_tree(code, programming_language)
+    if facts is not None and not facts["parsed"]:
+        return facts, None
+    return facts, split_units(code, facts, tree=tree)
+
+async def static_analysis(state):
+    """
+    Parse the code locally before any LLM call. A syntax error answers the code
+    evaluation on the spot and ends the run.
+    """
+    facts, units = await asyncio.to_thread(analyze_code, state['code'], state['programming_language'])
+    update = {"static_analysis": facts}
+
+    if facts is not None and not facts["parsed"]:
+        update["code_evaluation"] = CodeEvaluation(works=False, errors=facts["syntax_errors"]).model_dump()
+    else:
+        update["units"] = units
+
+    log_payload(logger, "Static Analysis", facts)
+
+    return update
 
-def code_evaluation(state):
-    json_parser = JsonOutputParser(pydantic_object=CodeEvaluation)
+def unit_state(state, index):
+    """
+    The state seen by the per-unit analysis of a large file: the unit's code and facts,
+    and its own evaluation once there is one.
+    """
+    unit = state['units'][index]
+    return {
+        **state,
+        "code": unit_code(state['code'], unit),
+        "context": f"{state.get('context') or 'No additional context provided.'} This is {unit['name']}, lines {unit['start_line']}-{unit['end_line']} of a larger file.",
+        "static_analysis": unit_facts(state.get('static_analysis'), state['code'], unit),
+        "code_evaluation": (state.get('unit_evaluations') or {}).get(str(index))
+    }
+
+async def analyze_units(state, stage, analyze):
+    """
+    Run `analyze` on every unit of a large file. Results are stored by unit fingerprint,
+    so a resubmitted file only pays for the units that changed.
+    """
+    cache = registry.get("codexpert_unit_cache")
+    reused = []
+
+    async def analyze_unit(index, unit):
+        unit_input = unit_state(state, index)
+        key = content_hash(
+            stage,
+            unit['fingerprint'],
+            normalize_text(state['programming_language']).lower(),
+            normalize_text(state.get('context')),
+            bool(state['is_ai_related']),
+            resolve_mode(state),
+            unit_input['code_evaluation']
+        )
+
+        cached_result = await cache.get(key)
+        if cached_result is not None:
+            reused.append(index)
+            return cached_result
+
+        result = await analyze(unit_input)
+        await cache.set(key, result)
+        return result
+
+    results = await map_units(state['units'], analyze_unit)
+    logger.info(f"{stage}: reused the results of {len(reused)} of {len(state['units'])} units")
+    return results
+
+def code_for_prompt(state):
+    # Stages that reason about the file as a whole get the outline of a large one
+    if state.get('units'):
+        return outline(state['code'], state['units'])
+    return state['code']
+
+async def code_evaluation(state):
+    if not state.get('units'):
+        return {"code_evaluation": await evaluate_code(state)}
+
+    evaluations = await analyze_units(state, "code_evaluation", evaluate_code)
+
+    return {
+        "code_evaluation": merge_evaluations(state['units'], evaluations),
+        "unit_evaluations": {str(index): evaluation for index, evaluation in enumerate(evaluations)}
+    }
+
+async def evaluate_code(state):
+    mode = resolve_mode(state)
+    format_instructions = format_instructions_for(CodeEvaluation, mode)
+
+    # The syntax was already checked when a local parser is available
+    if state.get('static_analysis'):
+        task = "The code parses without syntax errors. Analyze it for logical issues"
+        steps = """1. Identify any logical issues.
+        2. Determine if the code works correctly."""
+    else:
+        task = f"Analyze the following {state['programming_language']} code for syntax errors and logical issues"
+        steps = """1. Check for syntax errors.
+        2. Identify any logical issues.
+        3. Determine if the code works correctly."""
 
     messages = [
         SystemMessage(content=f"You are an expert in analyzing {state['programming_language']} code."),
         HumanMessage(content=f"""
-        Analyze the following {state['programming_language']} code for syntax errors and logical issues:
+        {task}:
 
         {state['code']}
 
         Context: {state.get('context', 'No additional context provided.')}
 
         Step-by-step reasoning:
-        1. Check for syntax errors.
-        2. Identify any logical issues.
-        3. Determine if the code works correctly.
+        {steps}
 
         The code is AI-related: {'Yes' if state['is_ai_related'] else 'No'}
 
         Provide a brief evaluation, listing errors, if any, and confirming if the code works as expected.
 
-        Ensure your response follows the format and requirements specified in {json_parser.get_format_instructions()}.
+        Ensure your response follows the format and requirements specified in {format_instructions}.
         """)
     ]
 
-    result = chat_openai_llm.invoke(messages)
+    parsed_result = await invoke_structured("chat_openai_llm", messages, CodeEvaluation, node="code_evaluation", mode=mode)
 
-    parsed_result = json_parser.parse(result.content)
+    log_payload(logger, "Code Evaluation", parsed_result)
 
-    logger.info(f"Code Evaluation: {parsed_result}")
+    return parsed_result
+
+async def generate_refactoring_suggestions(state):
+    if not state.get('units'):
+        return {"refactoring_suggestions": await suggest_refactorings(state)}
+
+    results = await analyze_units(state, "generate_refactoring_suggestions", suggest_refactorings)
 
     return {
-        "code_evaluation": parsed_result
+        "refactoring_suggestions": merge_refactoring_suggestions(state['units'], results)
     }
 
-def generate_refactoring_suggestions(state):
-    json_parser = JsonOutputParser(pydantic_object=RefactoringSuggestions)
+async def suggest_refactorings(state):
+    mode = resolve_mode(state)
+    format_instructions = format_instructions_for(RefactoringSuggestions, mode)
 
     evaluation_summary = f"The code works correctly: {state['code_evaluation']['works']}."
     if state['code_evaluation']["errors"]:
@@ -60,6 +168,10 @@ def generate_refactoring_suggestions(state):
     else:
         evaluation_summary += " No errors were found."
 
+    facts_summary = render_facts(state.get('static_analysis'))
+    if facts_summary:
+        facts_summary = f"\n        Static Analysis: {facts_summary}\n"
+
     messages = [
         SystemMessage(content=f"You are an expert in refactoring {state['programming_language']} code."),
         HumanMessage(content=f"""
@@ -70,71 +182,92 @@ def generate_refactoring_suggestions(state):
         Context: {state.get('context', 'No additional context provided.')}
 
         Code Evaluation Results: {evaluation_summary}
-
+{facts_summary}
         Step-by-step reasoning:
         1. Identify areas for improvement in the code, considering the evaluation results.
         2. Suggest appropriate refactoring techniques.
         3. Provide a list of actionable refactoring suggestions.
 
-        Ensure your response follows the format and requirements specified in {json_parser.get_format_instructions()}.
+        Ensure your response follows the format and requirements specified in {format_instructions}.
         """)
     ]
 
-    result = chat_openai_llm.invoke(messages)
+    parsed_result = await invoke_structured("chat_openai_llm", messages, RefactoringSuggestions, node="generate_refactoring_suggestions", mode=mode)
 
-    parsed_result = json_parser.parse(result.content)
+    log_payload(logger, "Refactoring Suggestions", parsed_result)
 
-    logger.info(f"Refactoring Suggestions: {parsed_result}")
+    return parsed_result
 
-    return {
-        "refactoring_suggestions": parsed_result,
-    }
+async def research_design_pattern(state):
+    mode = resolve_mode(state)
+    format_instructions = format_instructions_for(DesignPatternResearch, mode)
+
+    # In the parallel pipeline this node runs alongside the evaluation, before any refactoring exists
+    if state.get('refactoring_suggestions'):
+        refactoring_summary = f"The following refactoring suggestions were provided: {', '.join(state['refactoring_suggestions']['suggestions'])}."
+    else:
+        refactoring_summary = "Not available yet, analyse the code on its own."
+
+    system_message = SystemMessage(content=f"You are an expert in software design patterns, refactoring, and AI-related code.")
+
+    # Without AI code there is nothing to look up, so a single call replaces the agent loop
+    if not state['is_ai_related']:
+        messages = [
+            system_message,
+            HumanMessage(content=f"""
+            Analyse the following code directly and suggest design patterns that could support it, based on what you know:
+
+            {code_for_prompt(state)}
+
+            Refactoring Suggestions: {refactoring_summary}
+
+            The code is not related to AI.
+
+            Ensure your response follows the format and requirements specified in {format_instructions}.
+            """)
+        ]
 
-def research_design_pattern(state):
-    search = TavilySearchResults(max_results=2)
-    tools = [search]
-    agent_executor = create_react_agent(chat_openai_llm, tools)
+        parsed_result = await invoke_structured("chat_openai_llm", messages, DesignPatternResearch, node="research_design_pattern", mode=mode)
 
-    json_parser = JsonOutputParser(pydantic_object=DesignPatternResearch)
+        log_payload(logger, "Design Pattern Research", parsed_result)
 
-    refactoring_summary = f"The following refactoring suggestions were provided: {', '.join(state['refactoring_suggestions']['suggestions'])}."
+        return {
+            "design_pattern_research": parsed_result
+        }
 
     ai_related_message = f"""
     Assess whether the following code is related to AI:
 
-    {state['code']}
+    {code_for_prompt(state)}
 
     Refactoring Suggestions: {refactoring_summary}
 
-    Is it related to AI? {'Yes' if state['is_ai_related'] else 'No'}
+    Is it related to AI? Yes
 
-    If it is about AI, use Tavily to research relevant design patterns that could support this code.
+    Use Tavily to research relevant design patterns that could support this code.
     Provide detailed information about applicable design patterns.
 
-    If not, you must not use Tavily and just analyse the code directly for suggesting design patterns in base of what you know.
-
-    Ensure your response follows the format and requirements specified in {json_parser.get_format_instructions()}.
+    Ensure your response follows the format and requirements specified in {format_instructions}.
     """
 
     messages = [
-        SystemMessage(content=f"You are an expert in software design patterns, refactoring, and AI-related code."),
+        system_message,
         HumanMessage(content=ai_related_message)
     ]
 
-    result = agent_executor.invoke({'messages': messages})
-
-    logger.info(result)
+    result, parsed_result = await invoke_agent_structured(messages, DesignPatternResearch, node="research_design_pattern", mode=mode)
 
-    parsed_result = json_parser.parse(result["messages"][-1].content)
+    log_payload(logger, "Design Pattern agent messages", result["messages"])
 
-    logger.info(f"Design Pattern Research: {parsed_result}")
+    log_payload(logger, "Design Pattern Research", parsed_result)
 
     return {
         "design_pattern_research": parsed_result
     }
 
-def apply_quality_attributes(state):
-    json_parser = JsonOutputParser(pydantic_object=QualityAttributesApplication)
+async def apply_quality_attributes(state):
+    mode = resolve_mode(state)
+    format_instructions = format_instructions_for(QualityAttributesApplication, mode)
 
     if state['design_pattern_research']['design_pattern_applicable']:
         design_pattern_summary = f"A design pattern '{state['design_pattern_research']['pattern_name']}' has been suggested for this code based on AI-related research."
@@ -148,7 +281,7 @@ def apply_quality_attributes(state):
         HumanMessage(content=f"""
         Based on the following {state['programming_language']} code and its context:
 
-        {state['code']}
+        {code_for_prompt(state)}
 
         Refactoring Summary: {refactoring_summary}
 
@@ -159,23 +292,19 @@ def apply_quality_attributes(state):
         2. Explain how each quality attribute improves the code, with specific focus on maintainability, readability, performance, or other key aspects.
         3. Provide a clear explanation for how these quality attributes interact with the refactoring and any design patterns applied.
 
-        Ensure your response follows the format and requirements specified in {json_parser.get_format_instructions()}.
+        Ensure your response follows the format and requirements specified in {format_instructions}.
         """)
     ]
 
-    result = chat_openai_llm.invoke(messages)
+    parsed_result = await invoke_structured("chat_openai_llm", messages, QualityAttributesApplication, node="apply_quality_attributes", mode=mode)
 
-    parsed_result = json_parser.parse(result.content)
-
-    logger.info(f"Quality Attributes Applied: {parsed_result}")
+    log_payload(logger, "Quality Attributes Applied", parsed_result)
 
     return {
         "quality_attributes_application": parsed_result
     }
 
-def generate_optimized_code(state):
-    json_parser = JsonOutputParser(pydantic_object=CodeOutput)
-
+def optimization_summaries(state):
     refactoring_summary = f"The following refactoring suggestions were applied: {', '.join(state['refactoring_suggestions']['suggestions'])}."
 
     if state['design_pattern_research']['design_pattern_applicable']:
@@ -185,6 +314,14 @@ def generate_optimized_code(state):
 
     quality_attributes_summary = f"Quality attributes such as {', '.join(state['quality_attributes_application']['attributes_applied'])} were applied to further improve the code."
 
+    return refactoring_summary, design_pattern_summary, quality_attributes_summary
+
+async def rewrite_code(state):
+    mode = resolve_mode(state)
+    format_instructions = format_instructions_for(CodeOutput, mode)
+
+    refactoring_summary, design_pattern_summary, quality_attributes_summary = optimization_summaries(state)
+
     messages = [
         SystemMessage(content=f"You are an expert in code optimization for {state['programming_language']} code."),
         HumanMessage(content=f"""
@@ -200,16 +337,86 @@ def generate_optimized_code(state):
 
         Return the final optimized version of the code, taking into account all previous suggestions and improvements.
 
-        Ensure your response follows the format and requirements specified in {json_parser.get_format_instructions()}.
+        Ensure your response follows the format and requirements specified in {format_instructions}.
         """)
     ]
 
-    result = chat_openai_llm.invoke(messages)
+    return await invoke_structured("chat_openai_llm", messages, CodeOutput, node="generate_optimized_code", mode=mode)
+
+async def patch_code(state):
+    """
+    Ask for edits instead of the whole file and apply them locally. Returns the patched
+    code, or None when the edits cannot be applied or break a file that parsed before.
+    """
+    mode = resolve_mode(state)
+    format_instructions = format_instructions_for(CodePatch, mode)
+
+    refactoring_summary, design_pattern_summary, quality_attributes_summary = optimization_summaries(state)
+
+    messages = [
+        SystemMessage(content=f"You are an expert in code optimization for {state['programming_language']} code."),
+        HumanMessage(content=f"""
+        Based on the previous analysis, refactoring, and design improvements, please optimize the following {state['programming_language']} code:
+
+        {state['code']}
 
-    parsed_result = json_parser.parse(result.content)
+        Refactoring Summary: {refactoring_summary}
 
-    logger.info(f"Optimized Code: {parsed_result}")
+        Design Pattern Research: {design_pattern_summary}
+
+        Quality Attributes: {quality_attributes_summary}
+
+        Return only the edits, not the whole file. In every edit, `original` must be consecutive lines copied verbatim
+        from the code above, with enough surrounding lines to appear only once, and `replacement` the text that takes their place.
+        Leave every part of the code that does not change out of the edits.
+
+        Ensure your response follows the format and requirements specified in {format_instructions}.
+        """)
+    ]
+
+    parsed_result = await invoke_structured("chat_openai_llm", messages, CodePatch, node="generate_optimized_code", mode=mode)
+
+    try:
+        patched = apply_edits(state['code'], parsed_result['edits'])
+    except PatchError as e:
+        logger.warning(f"Optimized code edits could not be applied ({e}), rewriting the whole file")
+        return None
+
+    facts = state.get('static_analysis')
+    if facts and facts['parsed']:
+        patched_facts = await asyncio.to_thread(analyze, patched, state['programming_language'])
+        if patched_facts is not None and not patched_facts['parsed']:
+            logger.warning(f"Optimized code edits broke the code ({'; '.join(patched_facts['syntax_errors'])}), rewriting the whole file")
+            return None
+
+    logger.info(f"Optimized code: {len(parsed_result['edits'])} edits applied")
+    return patched
+
+async def generate_optimized_code(state):
+    """
+    In `diff` output mode the model returns edits, which are applied and checked here and
+    returned as a unified diff; the whole file is only rewritten when that fails, and the
+    rewrite is then returned as a diff too.
+    """
+    if state.get('output_mode') != "diff":
+        parsed_result = await rewrite_code(state)
+
+        log_payload(logger, "Optimized Code", parsed_result)
+
+        return {
+            "optimized_code": parsed_result,
+            "optimized_code_patch": None
+        }
+
+    patched = await patch_code(state)
+    if patched is None:
+        patched = (await rewrite_code(state))['optimized_code']
+
+    patch = unified_diff(state['code'], patched)
+
+    log_payload(logger, "Optimized Code Patch", patch)
 
     return {
-        "optimized_code": parsed_result
-    }
\ No newline at end of file
+        "optimized_code": {"optimized_code": patched} if state.get('include_optimized_code', True) else None,
+        "optimized_code_patch": patch
+    }
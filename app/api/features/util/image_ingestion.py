@@ -0,0 +1,163 @@
+import asyncio
+import base64
+import hashlib
+import io
+import os
+
+import httpx
+from PIL import Image
+from pydantic import BaseModel
+
+from app.api.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+MAX_IMAGE_BYTES = int(os.environ.get("ARCH_IMAGE_MAX_BYTES", 10 * 1024 * 1024))
+FETCH_TIMEOUT = float(os.environ.get("ARCH_IMAGE_FETCH_TIMEOUT", 10))
+MAX_IMAGE_SIDE = int(os.environ.get("ARCH_IMAGE_MAX_SIDE", 1568))
+IMAGE_FORMAT = os.environ.get("ARCH_IMAGE_FORMAT", "WEBP").upper()
+IMAGE_QUALITY = int(os.environ.get("ARCH_IMAGE_QUALITY", 85))
+
+class ImageIngestionError(ValueError):
+    """Raised when an image cannot be fetched, decoded or is over the configured limits."""
+
+class IngestedImage(BaseModel):
+    data_url: str
+    content_hash: str
+    mime_type: str
+    original_bytes: int
+    encoded_bytes: int
+    width: int
+    height: int
+
+def build_http_client():
+    return httpx.AsyncClient(
+        follow_redirects=True,
+        timeout=httpx.Timeout(FETCH_TIMEOUT),
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=10)
+    )
+
+def decode_data_url(url):
+    header, _, data = url.partition(",")
+    if not data or ";base64" not in header:
+        raise ImageIngestionError("Only base64 encoded data URLs are supported")
+
+    # A base64 payload is 4/3 the size of the decoded bytes
+    if len(data) * 3 // 4 > MAX_IMAGE_BYTES:
+        raise ImageIngestionError(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+
+    try:
+        return base64.b64decode(data, validate=True)
+    except ValueError as e:
+        raise ImageIngestionError(f"Invalid base64 image data: {e}")
+
+async def _download(client, url):
+    async with client.stream("GET", url) as response:
+        response.raise_for_status()
+
+        content_length = response.headers.get("content-length")
+        if content_length:
+            try:
+                declared_bytes = int(content_length)
+            except ValueError:
+                raise ImageIngestionError(f"Invalid Content-Length header: {content_length!r}")
+            if declared_bytes > MAX_IMAGE_BYTES:
+                raise ImageIngestionError(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+
+        chunks = []
+        received = 0
+        async for chunk in response.aiter_bytes():
+            received += len(chunk)
+            if received > MAX_IMAGE_BYTES:
+                raise ImageIngestionError(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+            chunks.append(chunk)
+
+        return b"".join(chunks)
+
+async def fetch_image(client, url):
+    """
+    Stream an image over the pooled client, enforcing the byte cap while reading
+    and a deadline over the whole download.
+    """
+    try:
+        return await asyncio.wait_for(_download(client, url), timeout=FETCH_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise ImageIngestionError(f"Image download exceeded {FETCH_TIMEOUT} seconds")
+    except httpx.HTTPError as e:
+        raise ImageIngestionError(f"Image download failed: {e}")
+
+def prepare_image(raw):
+    """
+    Downscale the image to MAX_IMAGE_SIDE and re-encode it to IMAGE_FORMAT, keeping the
+    original bytes when re-encoding would not make the payload smaller.
+    """
+    content_hash = hashlib.sha256(raw).hexdigest()
+
+    try:
+        image = Image.open(io.BytesIO(raw))
+        image.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        raise ImageIngestionError(f"Could not decode image: {e}")
+
+    original_format = image.format
+    original_size = image.size
+
+    if image.mode not in ("RGB", "RGBA", "L"):
+        image = image.convert("RGBA" if "A" in image.getbands() or "transparency" in image.info else "RGB")
+
+    image.thumbnail((MAX_IMAGE_SIDE, MAX_IMAGE_SIDE), Image.LANCZOS)
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=IMAGE_FORMAT, quality=IMAGE_QUALITY)
+    encoded = buffer.getvalue()
+    mime_type = Image.MIME.get(IMAGE_FORMAT, "image/webp")
+
+    if image.size == original_size and len(encoded) >= len(raw) and original_format in Image.MIME:
+        encoded = raw
+        mime_type = Image.MIME[original_format]
+
+    return IngestedImage(
+        data_url=f"data:{mime_type};base64,{base64.b64encode(encoded).decode('ascii')}",
+        content_hash=content_hash,
+        mime_type=mime_type,
+        original_bytes=len(raw),
+        encoded_bytes=len(encoded),
+        width=image.width,
+        height=image.height
+    )
+
+async def ingest_bytes(raw):
+    image = await asyncio.to_thread(prepare_image, raw)
+    logger.info(
+        f"Image {image.content_hash[:12]} ingested: {image.original_bytes} -> {image.encoded_bytes} bytes, "
+        f"{image.width}x{image.height} {image.mime_type}"
+    )
+    return image
+
+async def ingest_image_url(url, client, cache=None):
+    """
+    Turn an `img_url` (http(s) or data URL) into an inline, downscaled image. Remote
+    images are kept in `cache` by URL so repeated submissions are fetched only once.
+    """
+    if url.startswith("data:"):
+        return await ingest_bytes(decode_data_url(url))
+
+    if not url.startswith(("http://", "https://")):
+        raise ImageIngestionError("img_url must be an http(s) or data URL")
+
+    if cache is not None:
+        cached_image = cache.get(url)
+        if cached_image is not None:
+            return cached_image
+
+    image = await ingest_bytes(await fetch_image(client, url))
+
+    if cache is not None:
+        cache.set(url, image)
+    return image
+
+async def ingest_upload(upload):
+    raw = await upload.read(MAX_IMAGE_BYTES + 1)
+    if len(raw) > MAX_IMAGE_BYTES:
+        raise ImageIngestionError(f"Image is larger than {MAX_IMAGE_BYTES} bytes")
+    return await ingest_bytes(raw)
@@ -0,0 +1,111 @@
+import asyncio
+import time
+import uuid
+
+from app.api.features.util.cache import LRUCache
+from app.api.features.util.metrics import set_endpoint
+from app.api.features.util.rate_limiter import set_priority
+from app.api.logger import request_id_var, setup_logger
+
+logger = setup_logger(__name__)
+
+class QueueFull(Exception):
+    pass
+
+class JobManager:
+    """
+    Runs long pipelines in the background on a fixed pool of workers fed by a bounded
+    queue. A job is an async generator of `(event, data)` pairs, the same ones the
+    streaming endpoints send, so its record shows each node's output as soon as it
+    finishes. Submissions are rejected with `QueueFull` once `max_queue` jobs wait.
+    """
+
+    def __init__(self, workers=2, max_queue=100, max_jobs=10000, ttl=3600):
+        self.workers = workers
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.jobs = LRUCache(max_size=max_jobs, ttl=ttl)
+        self.running = 0
+        self._tasks = []
+
+    def _start_workers(self):
+        # Started on first submission, inside the event loop
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def submit(self, kind, events):
+        """
+        Queue `events`, a callable returning the job's event generator, and return
+        the new job record.
+        """
+        self._start_workers()
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": "queued",
+            "run_id": None,
+            "request_id": request_id_var.get(),
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "nodes": {},
+            "result": None,
+            "error": None
+        }
+
+        try:
+            self.queue.put_nowait((job, events))
+        except asyncio.QueueFull:
+            raise QueueFull(f"Job queue is full ({self.queue.maxsize} jobs waiting), retry later")
+
+        self.jobs.set(job["job_id"], job)
+        return job
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job, events = await self.queue.get()
+            self.running += 1
+            job["status"] = "running"
+            job["started_at"] = time.time()
+
+            # Workers inherit the context of the request that started them, every job
+            # sets its own so its logs and metrics carry the submitting request
+            request_id_var.set(job["request_id"])
+            set_endpoint(f"/jobs/{job['kind']}")
+            set_priority("pipeline")
+
+            try:
+                async for event, data in events():
+                    if event == "run":
+                        job["run_id"] = data["run_id"]
+                    elif event == "node":
+                        job["nodes"][data["node"]] = data["update"]
+                    elif event == "done":
+                        job["result"] = data
+                job["status"] = "succeeded"
+            except Exception as e:
+                logger.error(f"Job {job['job_id']} failed: {e}")
+                job["status"] = "failed"
+                job["error"] = f"Error in executor: {e}"
+            finally:
+                job["finished_at"] = time.time()
+                self.running -= 1
+                self.queue.task_done()
+
+    async def aclose(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "queued": self.queue.qsize(),
+            "max_queue": self.queue.maxsize,
+            "running": self.running,
+            "jobs": self.jobs.stats()
+        }
@@ -0,0 +1,380 @@
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import random
+import re
+import threading
+import time
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.rate_limiters import BaseRateLimiter
+from pydantic import ValidationError
+
+from app.api.features.util.chat_history import estimate_tokens
+from app.api.features.util.metrics import observe_llm_call, record_tokens
+from app.api.features.util.research import agent_recursion_limit, search_budget
+from app.api.logger import setup_logger
+from app.api.registry import registry
+
+logger = setup_logger(__name__)
+
+STRUCTURED_OUTPUT_MODES = ("prompt", "native")
+STRUCTURED_OUTPUT_MODE = os.environ.get("STRUCTURED_OUTPUT_MODE", "prompt")
+NODE_RETRY_BUDGET = int(os.environ.get("NODE_RETRY_BUDGET", 2))
+NODE_RETRY_BACKOFF = float(os.environ.get("NODE_RETRY_BACKOFF", 0.5))
+RATE_LIMIT_OUTPUT_TOKENS = int(os.environ.get("RATE_LIMIT_OUTPUT_TOKENS", 800))
+
+LLM_PROVIDERS = {
+    "chat_openai_llm": "openai",
+    "google_chat_genai_llm": "google",
+    "google_genai_llm": "google"
+}
+
+# What Gemini bills for an image part, used before the real usage is known
+IMAGE_TOKENS = 258
+
+# Retry counter of the graph node currently running, set by `track_retries`
+_node_attempts = contextvars.ContextVar("node_attempts", default=None)
+
+class LLMUsageStats:
+    """
+    Per node and structured output mode counters of calls, latency, token usage and
+    parse failures, to compare the two modes on real traffic.
+    """
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def record(self, node, mode, latency, usage=None, parse_failed=False):
+        usage = usage or {}
+        with self._lock:
+            entry = self._entries.setdefault((node, mode), {
+                "calls": 0,
+                "latency_seconds": 0.0,
+                "input_tokens": 0,
+                "output_tokens": 0,
+                "parse_failures": 0
+            })
+            entry["calls"] += 1
+            entry["latency_seconds"] += latency
+            entry["input_tokens"] += usage.get("input_tokens", 0)
+            entry["output_tokens"] += usage.get("output_tokens", 0)
+            entry["parse_failures"] += int(parse_failed)
+
+    def stats(self):
+        stats = {}
+        with self._lock:
+            for (node, mode), entry in self._entries.items():
+                calls = entry["calls"]
+                stats.setdefault(node, {})[mode] = {
+                    "calls": calls,
+                    "avg_latency_ms": round(1000 * entry["latency_seconds"] / calls, 1),
+                    "avg_input_tokens": round(entry["input_tokens"] / calls, 1),
+                    "avg_output_tokens": round(entry["output_tokens"] / calls, 1),
+                    "parse_failures": entry["parse_failures"]
+                }
+        return stats
+
+def estimate_prompt_tokens(messages):
+    """
+    Tokens a call will draw from the provider's budget: the prompt text, a flat
+    cost per image part and RATE_LIMIT_OUTPUT_TOKENS for the answer.
+    """
+    total = RATE_LIMIT_OUTPUT_TOKENS
+    for message in messages:
+        content = getattr(message, "content", message)
+        if isinstance(content, str):
+            total += estimate_tokens(content)
+            continue
+        for part in content:
+            if isinstance(part, str):
+                total += estimate_tokens(part)
+            elif part.get("type") == "text":
+                total += estimate_tokens(part["text"])
+            else:
+                total += IMAGE_TOKENS
+    return total
+
+def provider_limit(provider, estimated_tokens=0):
+    """
+    Context manager that waits for a concurrency slot and budget of `provider`
+    in the shared rate governor.
+    """
+    return registry.get("rate_limits")[provider].limit(estimated_tokens)
+
+class StepRateLimiter(BaseRateLimiter):
+    """
+    LangChain rate limiter for the chat model inside the ReAct agent: every agent step
+    draws from the provider's request and token budgets. The concurrency slot is held
+    by the agent run as a whole. Sync calls, e.g. `invoke` in a worker thread, wait on
+    their own thread.
+    """
+
+    def __init__(self, limiter, estimated_tokens):
+        self.limiter = limiter
+        self.estimated_tokens = estimated_tokens
+
+    def acquire(self, *, blocking=True):
+        if not blocking:
+            return self.limiter.take_budget(self.estimated_tokens) == 0
+        self.limiter.wait_for_budget_sync(self.estimated_tokens)
+        return True
+
+    async def aacquire(self, *, blocking=True):
+        if not blocking:
+            return self.limiter.take_budget(self.estimated_tokens) == 0
+        await self.limiter.wait_for_budget(self.estimated_tokens)
+        return True
+
+def resolve_mode(state):
+    return state.get("structured_output_mode") or STRUCTURED_OUTPUT_MODE
+
+def format_instructions_for(schema, mode):
+    """
+    Text that tells the model which format to answer in. In native mode the schema is
+    sent once as a tool / response format, so the prompt only names it.
+    """
+    if mode == "native":
+        return f"the {schema.__name__} response schema"
+    return registry.format_instructions(schema)
+
+def sum_usage(messages):
+    usage = {"input_tokens": 0, "output_tokens": 0}
+    for message in messages:
+        message_usage = getattr(message, "usage_metadata", None) or {}
+        usage["input_tokens"] += message_usage.get("input_tokens", 0)
+        usage["output_tokens"] += message_usage.get("output_tokens", 0)
+    return usage
+
+def extract_json(text):
+    """
+    Tolerant JSON extraction for answers the parser rejects: drops Markdown fences and
+    surrounding prose, takes the first balanced object and removes trailing commas.
+    Returns None when nothing usable is found.
+    """
+    text = re.sub(r"```(?:json)?", "", text)
+    start = text.find("{")
+    if start == -1:
+        return None
+
+    depth = 0
+    in_string = False
+    escaped = False
+    end = None
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            depth += 1
+        elif char == "}":
+            depth -= 1
+            if depth == 0:
+                end = index + 1
+                break
+
+    if end is None:
+        return None
+
+    candidate = re.sub(r",\s*([}\]])", r"\1", text[start:end])
+    try:
+        return json.loads(candidate)
+    except json.JSONDecodeError:
+        return None
+
+def parse_json(text, schema):
+    """
+    The answer as a dict validated against `schema`, like the native mode returns it.
+    JSON with missing or mistyped fields is rejected here, so it goes through the same
+    repair and retry as text that is not JSON at all.
+    """
+    try:
+        parsed = registry.parser(schema).parse(text)
+    except OutputParserException as e:
+        parsed = extract_json(text)
+        if parsed is None:
+            raise OutputParserException(str(e), llm_output=text)
+
+    try:
+        return schema.model_validate(parsed).model_dump()
+    except ValidationError as e:
+        errors = "; ".join(f"{'.'.join(map(str, error['loc'])) or 'answer'}: {error['msg']}" for error in e.errors())
+        raise OutputParserException(f"Answer does not match {schema.__name__} ({errors})", llm_output=text)
+
+def track_retries(node_name, node):
+    """
+    Wrap a graph node so the retries spent by its LLM calls are reported in the
+    `node_retries` state field.
+    """
+    @functools.wraps(node)
+    async def wrapper(state):
+        attempts = {"retries": 0}
+        token = _node_attempts.set(attempts)
+        try:
+            update = await node(state)
+        finally:
+            _node_attempts.reset(token)
+
+        if attempts["retries"]:
+            update = {**update, "node_retries": {node_name: attempts["retries"]}}
+        return update
+    return wrapper
+
+def _count_retry():
+    attempts = _node_attempts.get()
+    if attempts is not None:
+        attempts["retries"] += 1
+
+async def _backoff(attempt):
+    await asyncio.sleep(NODE_RETRY_BACKOFF * 2 ** (attempt - 1) * random.uniform(0.8, 1.2))
+
+def repair_messages(messages, error, schema, mode):
+    """
+    Messages for a targeted retry: the original conversation, the rejected answer
+    when there is one, and the parse error.
+    """
+    repair = list(messages)
+    if isinstance(error, OutputParserException) and error.llm_output:
+        repair.append(AIMessage(content=error.llm_output))
+        repair.append(HumanMessage(content=(
+            f"Your previous answer could not be parsed: {error}. "
+            f"Reply again with only valid JSON that follows {format_instructions_for(schema, mode)}."
+        )))
+    elif isinstance(error, OutputParserException):
+        repair.append(HumanMessage(content=f"Your previous answer was not valid: {error}. Answer again using {format_instructions_for(schema, mode)}."))
+    return repair
+
+async def _invoke_once(llm_name, messages, schema, node, mode):
+    usage_stats = registry.get("llm_usage")
+    provider = LLM_PROVIDERS[llm_name]
+    limiter = registry.get("rate_limits")[provider]
+    estimated_tokens = estimate_prompt_tokens(messages)
+    start = time.perf_counter()
+
+    async with limiter.limit(estimated_tokens):
+        with observe_llm_call(provider, node):
+            if mode == "native":
+                output = await registry.structured_llm(llm_name, schema).ainvoke(messages)
+                raw = output["raw"]
+            else:
+                raw = await registry.get(llm_name).ainvoke(messages)
+
+    usage = sum_usage([raw])
+    record_tokens(provider, node, usage)
+    limiter.settle(estimated_tokens, usage["input_tokens"] + usage["output_tokens"])
+
+    if mode == "native":
+        if output["parsing_error"] is not None or output["parsed"] is None:
+            usage_stats.record(node, mode, time.perf_counter() - start, usage, parse_failed=True)
+            raise OutputParserException(f"{node} returned no valid {schema.__name__}: {output['parsing_error']}")
+        parsed_result = output["parsed"].model_dump()
+    else:
+        try:
+            parsed_result = parse_json(raw.content, schema)
+        except OutputParserException:
+            usage_stats.record(node, mode, time.perf_counter() - start, usage, parse_failed=True)
+            raise
+
+    usage_stats.record(node, mode, time.perf_counter() - start, usage)
+    return parsed_result
+
+async def invoke_structured(llm_name, messages, schema, node, mode):
+    """
+    Call the `llm_name` client from the registry and return its answer as a dict
+    matching `schema`, either through the provider's native structured output
+    (`native`) or by parsing JSON out of the text answer (`prompt`).
+
+    Failed calls are retried up to NODE_RETRY_BUDGET times with exponential backoff;
+    after a parse failure the retry includes the rejected answer and the error.
+    """
+    attempt_messages = messages
+    attempt = 0
+
+    while True:
+        try:
+            return await _invoke_once(llm_name, attempt_messages, schema, node, mode)
+        except Exception as e:
+            if attempt >= NODE_RETRY_BUDGET:
+                raise
+
+            attempt += 1
+            _count_retry()
+            logger.warning(f"{node} failed ({e}), retry {attempt} of {NODE_RETRY_BUDGET}")
+
+            await _backoff(attempt)
+            attempt_messages = repair_messages(messages, e, schema, mode)
+
+async def invoke_agent_structured(messages, schema, node, mode):
+    """
+    Run the design pattern ReAct agent. In native mode the agent returns its final
+    answer through `response_format` instead of JSON text in the last message.
+
+    A final answer that cannot be parsed is repaired with a single structured call
+    instead of running the whole agent loop again. An agent that keeps calling tools
+    past its iteration cap is replaced by a single structured call as well.
+    """
+    from langgraph.errors import GraphRecursionError
+
+    usage_stats = registry.get("llm_usage")
+    agent_name = "design_pattern_agent_native" if mode == "native" else "design_pattern_agent"
+    attempt = 0
+
+    while True:
+        start = time.perf_counter()
+        try:
+            # Each agent step draws from the OpenAI budgets, the run holds a single slot
+            async with registry.get("rate_limits")["openai"].slot():
+                with observe_llm_call("openai", node), search_budget():
+                    result = await registry.get(agent_name).ainvoke(
+                        {'messages': messages},
+                        {"recursion_limit": agent_recursion_limit(native=mode == "native")}
+                    )
+            break
+        except GraphRecursionError:
+            logger.warning(f"{node} agent reached its iteration limit, answering without it")
+            parsed_result = await invoke_structured("chat_openai_llm", messages, schema, node, mode)
+            return {"messages": messages}, parsed_result
+        except Exception as e:
+            if attempt >= NODE_RETRY_BUDGET:
+                raise
+
+            attempt += 1
+            _count_retry()
+            logger.warning(f"{node} agent failed ({e}), retry {attempt} of {NODE_RETRY_BUDGET}")
+            await _backoff(attempt)
+
+    usage = sum_usage(result["messages"])
+    record_tokens("openai", node, usage)
+
+    try:
+        if mode == "native":
+            parsed_result = result["structured_response"].model_dump()
+        else:
+            parsed_result = parse_json(result["messages"][-1].content, schema)
+    except (KeyError, AttributeError, OutputParserException) as e:
+        usage_stats.record(node, mode, time.perf_counter() - start, usage, parse_failed=True)
+        _count_retry()
+        logger.warning(f"{node} agent answer could not be parsed ({e}), repairing it")
+
+        repair = [
+            HumanMessage(content=(
+                f"Rewrite the following answer so that it follows {format_instructions_for(schema, mode)}.\n\n"
+                f"{result['messages'][-1].content}"
+            ))
+        ]
+        parsed_result = await invoke_structured("chat_openai_llm", repair, schema, node, mode)
+        return result, parsed_result
+
+    usage_stats.record(node, mode, time.perf_counter() - start, usage)
+    return result, parsed_result
@@ -0,0 +1,163 @@
+import contextvars
+import functools
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CONTENT_TYPE_LATEST, REGISTRY, Counter, Gauge, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+
+# Route template of the request being served, e.g. "/codexpert" or "/jobs/codexpert"
+_endpoint = contextvars.ContextVar("metrics_endpoint", default="unknown")
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "HTTP request latency", ["endpoint", "method", "status"], buckets=LATENCY_BUCKETS)
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "HTTP requests being served", ["endpoint"])
+
+NODE_LATENCY = Histogram("graph_node_duration_seconds", "Graph node latency", ["endpoint", "node"], buckets=LATENCY_BUCKETS)
+NODE_IN_FLIGHT = Gauge("graph_nodes_in_flight", "Graph nodes running", ["endpoint", "node"])
+NODE_RETRIES = Counter("graph_node_retries_total", "LLM call retries spent by graph nodes", ["endpoint", "node"])
+
+LLM_LATENCY = Histogram("llm_call_duration_seconds", "LLM call latency", ["endpoint", "node", "provider", "outcome"], buckets=LATENCY_BUCKETS)
+LLM_IN_FLIGHT = Gauge("llm_calls_in_flight", "LLM calls waiting for the provider", ["provider"])
+LLM_TOKENS = Histogram("llm_call_tokens", "Tokens per LLM call", ["endpoint", "node", "provider", "kind"], buckets=TOKEN_BUCKETS)
+
+TOOL_LATENCY = Histogram("tool_call_duration_seconds", "Tool call latency", ["endpoint", "tool", "outcome"], buckets=LATENCY_BUCKETS)
+TOOL_IN_FLIGHT = Gauge("tool_calls_in_flight", "Tool calls running", ["tool"])
+
+def set_endpoint(endpoint):
+    _endpoint.set(endpoint)
+
+def current_endpoint():
+    return _endpoint.get()
+
+@contextmanager
+def observe_request(endpoint, method):
+    in_flight = HTTP_IN_FLIGHT.labels(endpoint)
+    in_flight.inc()
+    start = time.perf_counter()
+    status = {"code": 500}
+    try:
+        yield status
+    finally:
+        in_flight.dec()
+        HTTP_LATENCY.labels(endpoint, method, str(status["code"])).observe(time.perf_counter() - start)
+
+def observe_node(node_name, node):
+    """
+    Wrap a graph node to record its latency, in-flight count and the retries it
+    reports in `node_retries`.
+    """
+    @functools.wraps(node)
+    async def wrapper(state):
+        endpoint = current_endpoint()
+        in_flight = NODE_IN_FLIGHT.labels(endpoint, node_name)
+        in_flight.inc()
+        start = time.perf_counter()
+        try:
+            update = await node(state)
+        finally:
+            in_flight.dec()
+            NODE_LATENCY.labels(endpoint, node_name).observe(time.perf_counter() - start)
+
+        retries = (update.get("node_retries") or {}).get(node_name, 0)
+        if retries:
+            NODE_RETRIES.labels(endpoint, node_name).inc(retries)
+        return update
+    return wrapper
+
+@contextmanager
+def observe_llm_call(provider, node):
+    in_flight = LLM_IN_FLIGHT.labels(provider)
+    in_flight.inc()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        in_flight.dec()
+        LLM_LATENCY.labels(current_endpoint(), node, provider, outcome).observe(time.perf_counter() - start)
+
+def record_tokens(provider, node, usage):
+    endpoint = current_endpoint()
+    if usage.get("input_tokens"):
+        LLM_TOKENS.labels(endpoint, node, provider, "prompt").observe(usage["input_tokens"])
+    if usage.get("output_tokens"):
+        LLM_TOKENS.labels(endpoint, node, provider, "completion").observe(usage["output_tokens"])
+
+@contextmanager
+def observe_tool_call(tool):
+    in_flight = TOOL_IN_FLIGHT.labels(tool)
+    in_flight.inc()
+    start = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        in_flight.dec()
+        TOOL_LATENCY.labels(current_endpoint(), tool, outcome).observe(time.perf_counter() - start)
+
+class RegistryCollector:
+    """
+    Exposes the counters the caches, single-flight groups, rate limiters and job queue
+    already keep, read at scrape time so the request path pays nothing for them.
+    """
+
+    def __init__(self, registry):
+        self.registry = registry
+
+    def _built(self, name):
+        # A scrape must not build clients or graphs
+        return self.registry.peek(name)
+
+    def collect(self):
+        cache_requests = CounterMetricFamily("cache_requests", "Cache lookups", labels=["cache", "result"])
+        cache_entries = GaugeMetricFamily("cache_entries", "Entries held in memory caches", labels=["cache"])
+        for name in ("codexpert_cache", "codexpert_unit_cache", "architecture_node_cache", "image_cache", "chat_summaries", "search_cache"):
+            cache = self._built(name)
+            if cache is None:
+                continue
+            stats = cache.stats()
+            stats = stats.get("memory", stats)
+            cache_requests.add_metric([name, "hit"], stats["hits"])
+            cache_requests.add_metric([name, "miss"], stats["misses"])
+            cache_entries.add_metric([name], stats["size"])
+        yield cache_requests
+        yield cache_entries
+
+        coalesced = CounterMetricFamily("single_flight_calls_saved", "Upstream calls saved by request coalescing", labels=["group"])
+        for name in ("chat_flights", "codexpert_flights", "architecture_flights", "search_flights"):
+            flights = self._built(name)
+            if flights is not None:
+                coalesced.add_metric([name.replace("_flights", "")], flights.stats()["upstream_calls_saved"])
+        yield coalesced
+
+        limits = self._built("rate_limits")
+        if limits is not None:
+            throttled = CounterMetricFamily("provider_throttled", "429 responses from providers", labels=["provider"])
+            waiting = GaugeMetricFamily("provider_calls_waiting", "Calls waiting for a provider slot", labels=["provider", "priority"])
+            rate_scale = GaugeMetricFamily("provider_rate_scale", "Share of the configured rate in use after backoff", labels=["provider"])
+            for provider, limiter in limits.items():
+                stats = limiter.stats()
+                throttled.add_metric([provider], stats["throttled"])
+                rate_scale.add_metric([provider], stats["rate_scale"])
+                for priority, count in stats["waiting"].items():
+                    waiting.add_metric([provider, priority], count)
+            yield throttled
+            yield waiting
+            yield rate_scale
+
+        jobs = self._built("job_manager")
+        if jobs is not None:
+            stats = jobs.stats()
+            yield GaugeMetricFamily("jobs_queued", "Jobs waiting for a worker", value=stats["queued"])
+            yield GaugeMetricFamily("jobs_running", "Jobs being run by a worker", value=stats["running"])
+
+def register_collector(registry):
+    REGISTRY.register(RegistryCollector(registry))
+
+def render_metrics():
+    return generate_latest(REGISTRY), CONTENT_TYPE_LATEST
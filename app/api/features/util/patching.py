@@ -0,0 +1,62 @@
+import difflib
+
+class PatchError(ValueError):
+    pass
+
+def _find(code, original):
+    """
+    Character offsets of the only occurrence of `original` in `code`. Trailing
+    whitespace is ignored when there is no exact match, since models often drop it.
+    """
+    start = code.find(original)
+    if start != -1:
+        if code.find(original, start + 1) != -1:
+            raise PatchError(f"Edit matches more than once: {original[:80]!r}")
+        return start, start + len(original)
+
+    lines = code.split("\n")
+    wanted = [line.rstrip() for line in original.strip("\n").split("\n")]
+    stripped = [line.rstrip() for line in lines]
+    matches = [
+        index for index in range(len(lines) - len(wanted) + 1)
+        if stripped[index:index + len(wanted)] == wanted
+    ]
+    if not matches:
+        raise PatchError(f"Edit does not match the code: {original[:80]!r}")
+    if len(matches) > 1:
+        raise PatchError(f"Edit matches more than once: {original[:80]!r}")
+
+    start = sum(len(line) + 1 for line in lines[:matches[0]])
+    end = start + sum(len(line) + 1 for line in lines[matches[0]:matches[0] + len(wanted)]) - 1
+
+    # Newlines around `original` were stripped for the match; the span takes them back,
+    # since the replacement keeps its own
+    if original.endswith("\n") and end < len(code):
+        end += 1
+    if original.startswith("\n") and start > 0:
+        start -= 1
+    return start, end
+
+def apply_edits(code, edits):
+    """
+    Apply `CodePatch` edits, each replacing a unique span of the code, in order.
+    Raises `PatchError` when an edit cannot be located unambiguously.
+    """
+    patched = code.replace("\r\n", "\n")
+    for edit in edits:
+        original = edit["original"].replace("\r\n", "\n")
+        if not original.strip():
+            raise PatchError("Edit with an empty original")
+
+        start, end = _find(patched, original)
+        patched = patched[:start] + edit["replacement"].replace("\r\n", "\n") + patched[end:]
+    return patched
+
+def unified_diff(original, patched, name="code"):
+    return "\n".join(difflib.unified_diff(
+        original.replace("\r\n", "\n").split("\n"),
+        patched.replace("\r\n", "\n").split("\n"),
+        fromfile=f"a/{name}",
+        tofile=f"b/{name}",
+        lineterm=""
+    ))
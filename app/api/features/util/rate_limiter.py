@@ -0,0 +1,234 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+from app.api.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+PRIORITIES = ("interactive", "pipeline")
+
+# Interactive /chat traffic may use every concurrency slot, heavy pipelines leave some free
+_priority = contextvars.ContextVar("rate_limit_priority", default="interactive")
+
+def set_priority(priority):
+    _priority.set(priority)
+
+def current_priority():
+    return _priority.get()
+
+def is_rate_limited(error):
+    """
+    Recognize provider throttling across the OpenAI, Google and Tavily SDKs.
+    """
+    status_code = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if status_code == 429:
+        return True
+    name = type(error).__name__
+    return name in ("RateLimitError", "ResourceExhausted", "TooManyRequests") or "429" in str(error)[:200]
+
+def retry_after_seconds(error):
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class TokenBucket:
+    """
+    Refills `rate_per_minute` units per minute up to `capacity`. The level may go
+    negative when actual usage turns out above the estimate, which delays later calls.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = capacity or rate_per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, scale):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate_per_minute * scale / 60)
+        self.updated = now
+
+    def wait_time(self, amount, scale=1.0):
+        self._refill(scale)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0.0
+        return (amount - self.level) * 60 / (self.rate_per_minute * scale)
+
+    def consume(self, amount):
+        self.level -= amount
+
+class PriorityGate:
+    """
+    Concurrency cap where `reserved` slots can only be taken by interactive callers.
+    """
+
+    def __init__(self, limit, reserved=0):
+        self.limit = limit
+        self.reserved = min(reserved, limit - 1)
+        self.in_use = 0
+        self.waiting = {priority: 0 for priority in PRIORITIES}
+        self._condition = asyncio.Condition()
+
+    def _available(self, priority):
+        limit = self.limit if priority == "interactive" else self.limit - self.reserved
+        return self.in_use < limit
+
+    async def acquire(self, priority):
+        async with self._condition:
+            self.waiting[priority] += 1
+            try:
+                await self._condition.wait_for(lambda: self._available(priority))
+            finally:
+                self.waiting[priority] -= 1
+            self.in_use += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_use -= 1
+            self._condition.notify_all()
+
+class ProviderLimiter:
+    """
+    Request and token budgets, concurrency cap and adaptive backoff for one provider.
+
+    A 429 halves the effective rates and pauses the provider for the Retry-After
+    delay (or an exponential cooldown); every success then recovers 5% of the rate.
+    """
+
+    def __init__(self, name, requests_per_minute, tokens_per_minute=None, max_concurrency=16, reserved_interactive=0):
+        self.name = name
+        # Bursts are capped at 6 seconds of budget, so a fresh bucket cannot spend close
+        # to two minutes' quota inside the provider's first one-minute window
+        self.requests = TokenBucket(requests_per_minute, capacity=max(1, requests_per_minute // 10))
+        self.tokens = TokenBucket(tokens_per_minute, capacity=max(1, tokens_per_minute // 10)) if tokens_per_minute else None
+        self.gate = PriorityGate(max_concurrency, reserved_interactive)
+        self.scale = 1.0
+        self.blocked_until = 0.0
+        self.cooldown = 1.0
+        self._lock = asyncio.Lock()
+        self._budget_lock = threading.Lock()
+        self.calls = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def take_budget(self, estimated_tokens=0):
+        """
+        Draw one request and `estimated_tokens` from the budgets when both are available.
+        Returns 0 when they were taken, else the seconds to wait before trying again.
+        Thread-safe, so sync callers on other threads share the budgets.
+        """
+        with self._budget_lock:
+            wait = max(
+                self.blocked_until - time.monotonic(),
+                self.requests.wait_time(1, self.scale),
+                self.tokens.wait_time(estimated_tokens, self.scale) if self.tokens else 0.0
+            )
+            if wait > 0:
+                return wait
+
+            self.requests.consume(1)
+            if self.tokens:
+                self.tokens.consume(estimated_tokens)
+            self.calls += 1
+            return 0.0
+
+    async def wait_for_budget(self, estimated_tokens=0):
+        start = time.monotonic()
+        async with self._lock:
+            while True:
+                wait = self.take_budget(estimated_tokens)
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+        self.wait_seconds += time.monotonic() - start
+
+    def wait_for_budget_sync(self, estimated_tokens=0):
+        """
+        Blocking `wait_for_budget` for sync callers. It sleeps on the calling thread, so
+        it must not be used from the event loop.
+        """
+        start = time.monotonic()
+        while True:
+            wait = self.take_budget(estimated_tokens)
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        self.wait_seconds += time.monotonic() - start
+
+    @asynccontextmanager
+    async def slot(self, priority=None):
+        """
+        Hold one concurrency slot and watch the call for provider throttling, without
+        drawing from the budgets (for multi-step calls whose steps are limited one by one).
+        """
+        await self.gate.acquire(priority or current_priority())
+        try:
+            yield self
+        except Exception as e:
+            if is_rate_limited(e):
+                self.report_rate_limited(retry_after_seconds(e))
+            raise
+        else:
+            self.report_success()
+        finally:
+            await self.gate.release()
+
+    @asynccontextmanager
+    async def limit(self, estimated_tokens=0, priority=None):
+        async with self.slot(priority):
+            await self.wait_for_budget(estimated_tokens)
+            yield self
+
+    def settle(self, estimated_tokens, actual_tokens):
+        if self.tokens and actual_tokens:
+            with self._budget_lock:
+                self.tokens.consume(actual_tokens - estimated_tokens)
+
+    def report_rate_limited(self, retry_after=None):
+        self.throttled += 1
+        self.scale = max(0.1, self.scale / 2)
+        delay = retry_after if retry_after is not None else self.cooldown
+        self.cooldown = min(self.cooldown * 2, 60.0)
+        self.blocked_until = max(self.blocked_until, time.monotonic() + delay)
+        logger.warning(f"{self.name} rate limited, pausing {delay:.1f}s at {self.scale:.0%} of the configured rate")
+
+    def report_success(self):
+        self.scale = min(1.0, self.scale + 0.05)
+        self.cooldown = 1.0
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "throttled": self.throttled,
+            "rate_scale": round(self.scale, 2),
+            "avg_wait_ms": round(1000 * self.wait_seconds / self.calls, 1) if self.calls else 0.0,
+            "in_flight": self.gate.in_use,
+            "waiting": dict(self.gate.waiting)
+        }
+
+def build_governor():
+    def setting(name, default):
+        return int(os.environ.get(name, default))
+
+    def provider(name, prefix, rpm, tpm, concurrency):
+        max_concurrency = setting(f"{prefix}_MAX_CONCURRENCY", concurrency)
+        return ProviderLimiter(
+            name,
+            requests_per_minute=setting(f"{prefix}_RPM", rpm),
+            tokens_per_minute=setting(f"{prefix}_TPM", tpm) if tpm else None,
+            max_concurrency=max_concurrency,
+            reserved_interactive=max_concurrency * setting("RATE_LIMIT_INTERACTIVE_RESERVE_PERCENT", 25) // 100
+        )
+
+    return {
+        "openai": provider("openai", "OPENAI", 500, 200000, 32),
+        "google": provider("google", "GOOGLE", 1000, 4000000, 32),
+        "tavily": provider("tavily", "TAVILY", 100, None, 8)
+    }
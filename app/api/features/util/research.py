@@ -0,0 +1,82 @@
+import contextvars
+import os
+import re
+from contextlib import contextmanager
+
+from app.api.features.util.cache import content_hash
+from app.api.features.util.metrics import observe_tool_call
+from app.api.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+RESEARCH_MAX_TOOL_CALLS = int(os.environ.get("RESEARCH_MAX_TOOL_CALLS", 2))
+RESEARCH_MAX_ITERATIONS = int(os.environ.get("RESEARCH_MAX_ITERATIONS", 3))
+
+SEARCH_LIMIT_REACHED = "Search limit reached for this run. Answer with the results you already have."
+
+# Searches the agent run in progress may still make, set by `search_budget`
+_searches_left = contextvars.ContextVar("searches_left", default=None)
+
+def normalize_query(query):
+    """
+    Case, punctuation and spacing do not change what a search returns, so they do
+    not split the cache.
+    """
+    return " ".join(re.sub(r"[^\w+#]+", " ", query.lower()).split())
+
+def agent_recursion_limit(native=False):
+    # Every iteration is a model step and a tool step, plus the final answer and, in
+    # native mode, the structured response step
+    return 2 * RESEARCH_MAX_ITERATIONS + (2 if native else 1)
+
+@contextmanager
+def search_budget(limit=RESEARCH_MAX_TOOL_CALLS):
+    # A list, so the tool calls running in copies of this context share the count
+    token = _searches_left.set([limit])
+    try:
+        yield
+    finally:
+        _searches_left.reset(token)
+
+def _take_search():
+    left = _searches_left.get()
+    if left is None:
+        return True
+    if left[0] <= 0:
+        return False
+
+    left[0] -= 1
+    return True
+
+def build_research_tool(search, limiter, cache, flights):
+    """
+    Wrap the Tavily tool for the design pattern agent: results are cached by normalized
+    query, identical searches in flight share one call, and each agent run may only
+    search `RESEARCH_MAX_TOOL_CALLS` times.
+    """
+    from langchain_core.tools import StructuredTool
+
+    async def cached_search(query: str):
+        if not _take_search():
+            logger.info("Search limit reached, the agent has to answer with what it has")
+            return SEARCH_LIMIT_REACHED
+
+        key = content_hash("search", normalize_query(query))
+        results = cache.get(key)
+        if results is not None:
+            return results
+
+        async def fetch():
+            async with limiter.limit():
+                with observe_tool_call("tavily"):
+                    return await search.ainvoke({"query": query})
+
+        results = await flights.run(key, fetch)
+        cache.set(key, results)
+        return results
+
+    return StructuredTool.from_function(
+        coroutine=cached_search,
+        name=search.name,
+        description=search.description
+    )
@@ -0,0 +1,129 @@
+import asyncio
+import sqlite3
+import threading
+import time
+
+from app.api.features.util.cache import LRUCache
+
+class InMemorySessionStore:
+    """
+    Conversation sessions kept in a bounded LRU. Each session holds at most
+    `max_messages` `(role, text)` pairs; `offset` counts the ones trimmed away.
+    """
+
+    def __init__(self, max_sessions=10000, ttl=24 * 3600, max_messages=200):
+        self.sessions = LRUCache(max_size=max_sessions, ttl=ttl)
+        self.max_messages = max_messages
+        self._lock = threading.Lock()
+
+    async def load(self, session_key):
+        session = self.sessions.get(session_key)
+        if session is None:
+            return 0, []
+        return session["offset"], list(session["messages"])
+
+    async def append(self, session_key, messages):
+        with self._lock:
+            session = self.sessions.get(session_key) or {"offset": 0, "messages": []}
+            session["messages"].extend(messages)
+
+            overflow = len(session["messages"]) - self.max_messages
+            if overflow > 0:
+                del session["messages"][:overflow]
+                session["offset"] += overflow
+
+            self.sessions.set(session_key, session)
+
+    async def purge(self):
+        # The LRU drops expired sessions on access and evicts the oldest when full
+        return 0
+
+    def stats(self):
+        return self.sessions.stats()
+
+class SQLiteSessionStore:
+    """
+    Conversation sessions stored in a SQLite file, shared between workers and kept
+    across restarts. Messages are numbered per session, so the first stored
+    sequence number is the offset of the trimmed history.
+
+    Like the in-memory store, a session expires `ttl` seconds after its last message:
+    it reads as empty from then on, and `purge` deletes its rows.
+    """
+
+    def __init__(self, path, ttl=24 * 3600, max_messages=200):
+        self.path = path
+        self.ttl = ttl
+        self.max_messages = max_messages
+
+        with self._connect() as connection:
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS session_messages ("
+                "session_key TEXT NOT NULL, seq INTEGER NOT NULL, role TEXT NOT NULL, text TEXT NOT NULL, "
+                "created_at REAL NOT NULL, PRIMARY KEY (session_key, seq))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def _load(self, session_key):
+        with self._connect() as connection:
+            rows = connection.execute(
+                "SELECT seq, role, text, created_at FROM session_messages WHERE session_key = ? ORDER BY seq",
+                (session_key,)
+            ).fetchall()
+
+            if rows and rows[-1][3] < time.time() - self.ttl:
+                connection.execute("DELETE FROM session_messages WHERE session_key = ?", (session_key,))
+                rows = []
+
+        if not rows:
+            return 0, []
+        return rows[0][0], [(role, text) for _, role, text, _ in rows]
+
+    def _append(self, session_key, messages):
+        with self._connect() as connection:
+            # An expired session starts over, as it does in the in-memory store
+            connection.execute(
+                "DELETE FROM session_messages WHERE session_key = ? AND "
+                "(SELECT MAX(created_at) FROM session_messages WHERE session_key = ?) < ?",
+                (session_key, session_key, time.time() - self.ttl)
+            )
+            next_seq = connection.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM session_messages WHERE session_key = ?",
+                (session_key,)
+            ).fetchone()[0]
+
+            now = time.time()
+            connection.executemany(
+                "INSERT INTO session_messages (session_key, seq, role, text, created_at) VALUES (?, ?, ?, ?, ?)",
+                [(session_key, next_seq + index, role, text, now) for index, (role, text) in enumerate(messages)]
+            )
+            connection.execute(
+                "DELETE FROM session_messages WHERE session_key = ? AND seq < ?",
+                (session_key, next_seq + len(messages) - self.max_messages)
+            )
+
+    def _purge(self):
+        with self._connect() as connection:
+            return connection.execute(
+                "DELETE FROM session_messages WHERE session_key IN ("
+                "SELECT session_key FROM session_messages GROUP BY session_key HAVING MAX(created_at) < ?)",
+                (time.time() - self.ttl,)
+            ).rowcount
+
+    async def load(self, session_key):
+        return await asyncio.to_thread(self._load, session_key)
+
+    async def append(self, session_key, messages):
+        await asyncio.to_thread(self._append, session_key, messages)
+
+    async def purge(self):
+        """
+        Delete the messages of expired sessions. Returns the number of rows deleted.
+        """
+        return await asyncio.to_thread(self._purge)
+
+    def stats(self):
+        return {"path": self.path}
@@ -0,0 +1,49 @@
+import asyncio
+
+from app.api.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key: the first caller starts the work and
+    every caller that arrives while it is still running awaits the same result.
+
+    The work runs in its own task, so a caller that disconnects does not cancel it
+    for the others.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._in_flight = {}
+        self.executions = 0
+        self.shared = 0
+
+    async def run(self, key, factory):
+        task = self._in_flight.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda finished: self._forget(key, finished))
+            self.executions += 1
+        else:
+            self.shared += 1
+            logger.info(f"Joined in-flight {self.name} execution: {key[:12]}")
+
+        return await asyncio.shield(task)
+
+    def _forget(self, key, task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+
+        # Retrieve the exception so it is not reported as unhandled when every caller has gone
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {
+            "in_flight": len(self._in_flight),
+            "executions": self.executions,
+            "upstream_calls_saved": self.shared
+        }
@@ -1,12 +1,9 @@
 
-from dotenv import load_dotenv, find_dotenv
-from langchain_openai import ChatOpenAI
-from langchain.schema import (
+from langchain_core.messages import (
        AIMessage,
        HumanMessage,
        SystemMessage
   )
-from langchain_google_genai import ChatGoogleGenerativeAI
 from app.api.features.schemas.software_architecture_assistant_schemas import (
     ArchitectureImprovementSchema,
     ArchitectureValidationSchema,
@@ -14,15 +11,28 @@ from app.api.features.schemas.software_architecture_assistant_schemas import (
     QualityAttributesSchema, 
 
 )
-from langchain_core.output_parsers import JsonOutputParser
-
-load_dotenv(find_dotenv())
-
-chat_openai_llm = ChatOpenAI(model_name="gpt-4o-mini", temperature=0.7)
-google_chat_genai_llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash")
-
-def generate_architecture_description(state):
-    parser = JsonOutputParser(pydantic_object=ArchitectureSchema)
+from app.api.features.util.image_ingestion import ImageIngestionError
+from app.api.features.util.llm_invocation import format_instructions_for, invoke_structured, resolve_mode
+from app.api.logger import log_payload, setup_logger
+from app.api.registry import registry
+
+logger = setup_logger(__name__)
+
+def image_for_model(state):
+    """
+    The run's ingested image, looked up by hash since it is not checkpointed. A remote
+    image that is no longer held is sent by URL instead.
+    """
+    image = registry.get("ingested_images").get(state["img_hash"])
+    if image is not None:
+        return image.data_url
+    if state["img_url"].startswith(("http://", "https://")):
+        return state["img_url"]
+    raise ImageIngestionError("The image of this run is no longer available, submit it again")
+
+async def generate_architecture_description(state):
+    mode = resolve_mode(state)
+    format_instructions = format_instructions_for(ArchitectureSchema, mode)
 
     lang_message = {
         "en": "Analyze the image and give me the architecture description with the following details: architecture name, layers, components, external services, events, and data flow description.",
@@ -45,25 +55,24 @@ def generate_architecture_description(state):
             "type": "text",
             "text": lang_message.get(state['lang'])
         },
-        {"type": "image_url", "image_url": state["img_url"]},
+        {"type": "image_url", "image_url": image_for_model(state)},
         {"type": "text", "text": f"You must provide all the answers in this language: {state['lang']}"},
-        {"type": "text", "text": f"{format_message.get(state['lang'])}: {parser.get_format_instructions()}"}
+        {"type": "text", "text": f"{format_message.get(state['lang'])}: {format_instructions}"}
     ]
 
     message = HumanMessage(content=message_content)
 
-    response = google_chat_genai_llm.invoke([message]).content
-
-    detected_architecture = parser.parse(response)
+    detected_architecture = await invoke_structured("google_chat_genai_llm", [message], ArchitectureSchema, node="generate_architecture_description", mode=mode)
 
-    print(f"Architecture Description: {detected_architecture}")
+    log_payload(logger, "Architecture Description", detected_architecture)
 
     return {
         "detected_architecture": detected_architecture
     }
 
-def validate_architecture(state):
-    json_parser = JsonOutputParser(pydantic_object=ArchitectureValidationSchema)
+async def validate_architecture(state):
+    mode = resolve_mode(state)
+    format_instructions = format_instructions_for(ArchitectureValidationSchema, mode)
 
     lang = state['lang']
     detected_architecture = state['detected_architecture']
@@ -82,22 +91,21 @@ def validate_architecture(state):
                      
         Answer in this language: {lang}
 
-        Respond with suggestions for improvement or state if the architecture fully meets the requirements. Ensure your response follows the format specified in {json_parser.get_format_instructions()}.
+        Respond with suggestions for improvement or state if the architecture fully meets the requirements. Ensure your response follows the format specified in {format_instructions}.
         """)
     ]
 
-    result = chat_openai_llm.invoke(messages)
+    parsed_result = await invoke_structured("chat_openai_llm", messages, ArchitectureValidationSchema, node="validate_architecture", mode=mode)
 
-    parsed_result = json_parser.parse(result.content)
-
-    print(f"Architecture Validation Result: {parsed_result}")
+    log_payload(logger, "Architecture Validation Result", parsed_result)
 
     return {
         "architecture_with_requirements": parsed_result
     }
 
-def suggest_architecture_improvements(state):
-    json_parser = JsonOutputParser(pydantic_object=ArchitectureImprovementSchema)
+async def suggest_architecture_improvements(state):
+    mode = resolve_mode(state)
+    format_instructions = format_instructions_for(ArchitectureImprovementSchema, mode)
 
     architecture_with_requirements = state['architecture_with_requirements']
     requirements = state['requirements']
@@ -116,22 +124,21 @@ def suggest_architecture_improvements(state):
 
         Answer in this language: {lang}
 
-        Respond with suggestions for improvement. Ensure your response follows the format specified in {json_parser.get_format_instructions()}.
+        Respond with suggestions for improvement. Ensure your response follows the format specified in {format_instructions}.
         """)
     ]
 
-    result = chat_openai_llm.invoke(messages)
-
-    parsed_result = json_parser.parse(result.content)
+    parsed_result = await invoke_structured("chat_openai_llm", messages, ArchitectureImprovementSchema, node="suggest_architecture_improvements", mode=mode)
 
-    print(f"Architecture Improvement Suggestions: {parsed_result}")
+    log_payload(logger, "Architecture Improvement Suggestions", parsed_result)
 
     return {
         "improved_architecture": parsed_result
     }
 
-def evaluate_architecture_quality(state):
-    json_parser = JsonOutputParser(pydantic_object=QualityAttributesSchema)
+async def evaluate_architecture_quality(state):
+    mode = resolve_mode(state)
+    format_instructions = format_instructions_for(QualityAttributesSchema, mode)
 
     improved_architecture = state['improved_architecture']
     lang = state['lang']
@@ -146,15 +153,13 @@ def evaluate_architecture_quality(state):
                      
         Answer in this language: {lang}
 
-        Respond with a detailed evaluation of the quality attributes and ensure your response follows the format specified in {json_parser.get_format_instructions()}.
+        Respond with a detailed evaluation of the quality attributes and ensure your response follows the format specified in {format_instructions}.
         """)
     ]
 
-    result = chat_openai_llm.invoke(messages)
-
-    parsed_result = json_parser.parse(result.content)
+    parsed_result = await invoke_structured("chat_openai_llm", messages, QualityAttributesSchema, node="evaluate_architecture_quality", mode=mode)
 
-    print(f"Architecture Quality Evaluation: {parsed_result}")
+    log_payload(logger, "Architecture Quality Evaluation", parsed_result)
 
     return {
         "architecture_with_quality_attributes": parsed_result
@@ -0,0 +1,174 @@
+import ast
+import re
+import sys
+
+from app.api.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Functions above this cyclomatic complexity are named in the prompts, at most MAX_LISTED of them
+COMPLEX_FUNCTION = 10
+MAX_LISTED = 5
+
+# Grammar added after the server's Python, as (release, check on the failing line and message).
+# Code that fails on one of these may be valid for a newer Python, so the LLM evaluates it.
+NEWER_GRAMMAR = [
+    ((3, 12), lambda line, message: re.match(r"\s*type\s+\w+\s*(\[.*\])?\s*=", line) is not None),
+    ((3, 12), lambda line, message: re.match(r"\s*(async\s+def|def|class)\s+\w+\s*\[", line) is not None),
+    ((3, 12), lambda line, message: message.startswith("f-string")),
+    ((3, 14), lambda line, message: message == "multiple exception types must be parenthesized")
+]
+
+def may_be_newer_syntax(error):
+    line = error.text or ""
+    return any(sys.version_info < release and check(line, error.msg or "") for release, check in NEWER_GRAMMAR)
+
+BRANCH_NODES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.IfExp, ast.ExceptHandler, ast.Assert, ast.comprehension)
+NESTING_NODES = (ast.If, ast.For, ast.AsyncFor, ast.While, ast.Try, ast.With, ast.AsyncWith)
+
+def complexity(node):
+    """
+    McCabe-style count: one path, plus one per branch, boolean operand and match case.
+    """
+    count = 1
+    for child in ast.walk(node):
+        if isinstance(child, BRANCH_NODES):
+            count += 1
+        elif isinstance(child, ast.BoolOp):
+            count += len(child.values) - 1
+        elif type(child).__name__ == "match_case":
+            count += 1
+    return count
+
+def nesting_depth(node, depth=0):
+    deepest = depth
+    for child in ast.iter_child_nodes(node):
+        child_depth = depth + 1 if isinstance(child, NESTING_NODES) else depth
+        deepest = max(deepest, nesting_depth(child, child_depth))
+    return deepest
+
+def line_metrics(code):
+    lines = code.splitlines()
+    stripped = [line.strip() for line in lines]
+    return {
+        "lines": len(lines),
+        "code_lines": sum(1 for line in stripped if line and not line.startswith("#")),
+        "comment_lines": sum(1 for line in stripped if line.startswith("#"))
+    }
+
+def _function_facts(node):
+    arguments = node.args
+    return {
+        "name": node.name,
+        "line": node.lineno,
+        "end_line": node.end_lineno,
+        "arguments": len(arguments.posonlyargs) + len(arguments.args) + len(arguments.kwonlyargs),
+        "is_async": isinstance(node, ast.AsyncFunctionDef),
+        "complexity": complexity(node)
+    }
+
+def analyze_python(code):
+    """
+    Returns the facts and the syntax tree, which is None when the code does not parse.
+    Both are None when the code may be written for a newer Python than the server's.
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        if may_be_newer_syntax(e):
+            logger.info(f"Static analysis skipped: line {e.lineno} may use syntax newer than Python {sys.version_info.major}.{sys.version_info.minor}")
+            return None, None
+        location = f"line {e.lineno}" + (f", column {e.offset}" if e.offset else "")
+        source_line = f": `{e.text.strip()}`" if e.text and e.text.strip() else ""
+        return {
+            "language": "python",
+            "parsed": False,
+            "syntax_errors": [f"SyntaxError at {location}: {e.msg}{source_line}"],
+            "metrics": line_metrics(code)
+        }, None
+    except ValueError as e:
+        # e.g. null bytes in the source
+        return {"language": "python", "parsed": False, "syntax_errors": [f"Invalid source: {e}"], "metrics": line_metrics(code)}, None
+
+    # One walk over the module collects every kind of fact
+    functions, classes, imports = [], [], set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            functions.append(_function_facts(node))
+        elif isinstance(node, ast.ClassDef):
+            classes.append({
+                "name": node.name,
+                "line": node.lineno,
+                "bases": [ast.unparse(base) for base in node.bases],
+                "methods": [child.name for child in node.body if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef))]
+            })
+        elif isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom):
+            imports.add(node.module or ".")
+
+    return {
+        "language": "python",
+        "parsed": True,
+        "syntax_errors": [],
+        "functions": functions,
+        "classes": classes,
+        "imports": sorted(imports),
+        "metrics": {
+            **line_metrics(code),
+            "functions": len(functions),
+            "classes": len(classes),
+            "max_nesting_depth": nesting_depth(tree),
+            "max_complexity": max((function["complexity"] for function in functions), default=complexity(tree))
+        }
+    }, tree
+
+# Languages with a local parser, by normalized `programming_language`
+ANALYZERS = {
+    "python": analyze_python,
+    "python3": analyze_python,
+    "py": analyze_python
+}
+
+def analyze_with_tree(code, programming_language):
+    """
+    Parse the code locally when a parser for its language is available. Returns the
+    facts and the syntax tree, or (None, None) when there is no parser, the code is too
+    deeply nested to parse or may need a newer parser.
+    """
+    analyzer = ANALYZERS.get((programming_language or "").strip().lower())
+    if analyzer is None:
+        return None, None
+
+    try:
+        return analyzer(code)
+    except (RecursionError, MemoryError) as e:
+        logger.warning(f"Static analysis skipped: {type(e).__name__}")
+        return None, None
+
+def analyze(code, programming_language):
+    """
+    The facts of `analyze_with_tree`, without the tree.
+    """
+    return analyze_with_tree(code, programming_language)[0]
+
+def render_facts(facts):
+    """
+    Compact text summary of `analyze` results for the prompts. The prompts already carry
+    the code, so only the functions above `COMPLEX_FUNCTION` are named. Empty when
+    there are none.
+    """
+    if not facts or not facts["parsed"]:
+        return ""
+
+    complex_functions = sorted(
+        (function for function in facts["functions"] if function["complexity"] > COMPLEX_FUNCTION),
+        key=lambda function: -function["complexity"]
+    )
+    if not complex_functions:
+        return ""
+
+    return "Most complex functions: " + ", ".join(
+        f"{function['name']} (line {function['line']}, cyclomatic complexity {function['complexity']})"
+        for function in complex_functions[:MAX_LISTED]
+    ) + "."
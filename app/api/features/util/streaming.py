@@ -0,0 +1,59 @@
+import json
+
+from fastapi.responses import StreamingResponse
+
+from app.api.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+def sse_event(event, data):
+    payload = json.dumps(data, default=str, ensure_ascii=False)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+async def graph_events(graph, state, config=None):
+    """
+    Run a compiled graph with `astream` and yield a `node` event with each node's
+    update as soon as it finishes, followed by a `done` event with the final state,
+    read from the checkpoint when the run has a `config`.
+    """
+    async for update in graph.astream(state, config, stream_mode="updates"):
+        for node, values in update.items():
+            if values:
+                state.update(values)
+            yield "node", {"node": node, "update": values}
+
+    # Updates were merged without the state reducers, e.g. `node_retries`, the checkpoint has them applied
+    if config is not None:
+        state = (await graph.aget_state(config)).values
+
+    yield "done", state
+
+def sse_response(events):
+    """
+    Wrap an async generator of `(event, data)` pairs in a Server-Sent Events response.
+    Errors raised while streaming are sent to the client as a final `error` event.
+    """
+    async def body():
+        try:
+            async for event, data in events:
+                yield sse_event(event, data)
+        except Exception as e:
+            error_message = f"Error in executor: {e}"
+            logger.error(error_message)
+            yield sse_event("error", {"message": error_message})
+
+    return StreamingResponse(
+        body(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def ndjson_response(lines):
+    """
+    Wrap an async generator of JSON serializable objects in a newline-delimited JSON response.
+    """
+    async def body():
+        async for line in lines:
+            yield json.dumps(line, default=str, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(body(), media_type="application/x-ndjson")
@@ -1,15 +1,89 @@
+import atexit
+import contextvars
+import copy
+import json
 import logging
+import logging.handlers
 import os
+import queue
+import random
 
 # Global variable to track logger configuration state
 logger_configured = False
 
+LOG_MAX_MESSAGE_CHARS = int(os.environ.get("LOG_MAX_MESSAGE_CHARS", 2000))
+LOG_PAYLOAD_SAMPLE_RATE = float(os.environ.get("LOG_PAYLOAD_SAMPLE_RATE", 0.1))
+
+request_id_var = contextvars.ContextVar("request_id", default=None)
+
+_queue_handler = None
+
+def default_level(env_type):
+    if os.environ.get("LOG_LEVEL"):
+        return os.environ["LOG_LEVEL"].upper()
+    return "INFO" if env_type in ("sandbox", "production") else "DEBUG"
+
+def truncate_message(message, max_chars=LOG_MAX_MESSAGE_CHARS):
+    if len(message) <= max_chars:
+        return message
+    return f"{message[:max_chars]}... [{len(message) - max_chars} characters truncated]"
+
+class JsonFormatter(logging.Formatter):
+    """
+    One JSON object per line, with the request ID of the request that logged it.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            "request_id": getattr(record, "request_id", None)
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class RequestQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to the listener thread. Only the message is rendered (and truncated)
+    on the calling side; formatting and the stream write happen off the request path.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = truncate_message(record.getMessage())
+        record.args = None
+        record.request_id = request_id_var.get()
+        return record
+
+def _configure(env_type):
+    """
+    Build the shared queue handler and start the listener that writes to stderr.
+    """
+    global logger_configured, _queue_handler
+
+    formatter = JsonFormatter() if os.environ.get("LOG_FORMAT", "json") == "json" else logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, stream_handler, respect_handler_level=False)
+    listener.start()
+    atexit.register(listener.stop)
+
+    _queue_handler = RequestQueueHandler(records)
+    _queue_handler.setLevel(default_level(env_type))
+    logger_configured = True
+
 def setup_logger(name=__name__):
     """
     Sets up a logger based on the environment.
 
-    If the environment variable ENV_TYPE is set to 'sandbox' or 'production', it configures
-    Google Cloud Logging. Otherwise, it uses the standard logging.
+    Records go through a queue to a background thread that writes them as JSON lines
+    (or plain text with LOG_FORMAT=text). The level is INFO when ENV_TYPE is 'sandbox'
+    or 'production' and DEBUG otherwise, unless LOG_LEVEL is set.
 
     Parameters:
     name (str): The name of the logger.
@@ -17,20 +91,26 @@ def setup_logger(name=__name__):
     Returns:
     logging.Logger: Configured logger.
     """
-    global logger_configured
     env_type = os.environ.get('ENV_TYPE', 'undefined')
-    project = os.environ.get('PROJECT_ID', 'undefined')
+
+    if not logger_configured:
+        _configure(env_type)
 
     # Obtain a reference to the logger
     logger = logging.getLogger(name)
-    
+
     # Check if the logger is already configured
     if not logger.handlers:
-        handler = logging.StreamHandler()
-        formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-        handler.setFormatter(formatter)
-        logger.addHandler(handler)
-        logger.setLevel(logging.DEBUG)
+        logger.addHandler(_queue_handler)
+        logger.setLevel(default_level(env_type))
         logger.propagate = True
 
-    return logger
\ No newline at end of file
+    return logger
+
+def log_payload(logger, label, payload):
+    """
+    Log a large value (a node result, an agent transcript) at DEBUG level for a
+    LOG_PAYLOAD_SAMPLE_RATE share of the calls. Nothing is rendered when skipped.
+    """
+    if logger.isEnabledFor(logging.DEBUG) and random.random() < LOG_PAYLOAD_SAMPLE_RATE:
+        logger.debug("%s: %s", label, payload)
@@ -0,0 +1,308 @@
+from app.api.features.util.cache import LRUCache, SQLiteCache, TieredCache
+from app.api.features.util.image_ingestion import build_http_client
+from app.api.features.util.jobs import JobManager
+from app.api.features.util.rate_limiter import build_governor
+from app.api.features.util.research import build_research_tool
+from app.api.features.util.session_store import InMemorySessionStore, SQLiteSessionStore
+from app.api.features.util.single_flight import SingleFlight
+from app.api.logger import setup_logger
+
+import asyncio
+import importlib
+import os
+
+logger = setup_logger(__name__)
+
+class Registry:
+    """
+    Process-wide holder for objects that are expensive to build and safe to share
+    between requests: compiled graphs, prompt templates, JSON parsers, LLM clients and tools.
+
+    Every entry is registered as a factory and built once, either eagerly by `warm_up()`
+    or `warm_up_in_background()` from the application lifespan hook, or lazily on first lookup.
+    """
+
+    def __init__(self):
+        self._factories = {}
+        self._closers = {}
+        self._on_loop = set()
+        self._objects = {}
+        self._parsers = {}
+        self._format_instructions = {}
+        self._structured_llms = {}
+
+    def register(self, name, factory, close=None, on_loop=False):
+        """
+        `on_loop` marks factories that need the running event loop, which
+        `warm_up_in_background()` does not move to a worker thread.
+        """
+        self._factories[name] = factory
+        if close is not None:
+            self._closers[name] = close
+        if on_loop:
+            self._on_loop.add(name)
+
+    def get(self, name):
+        if name not in self._objects:
+            self._objects[name] = self._factories[name]()
+        return self._objects[name]
+
+    def peek(self, name):
+        """
+        The `name` object if it was already built, without building it.
+        """
+        return self._objects.get(name)
+
+    def parser(self, schema):
+        if schema not in self._parsers:
+            from langchain_core.output_parsers import JsonOutputParser
+            self._parsers[schema] = JsonOutputParser(pydantic_object=schema)
+        return self._parsers[schema]
+
+    def format_instructions(self, schema):
+        if schema not in self._format_instructions:
+            self._format_instructions[schema] = self.parser(schema).get_format_instructions()
+        return self._format_instructions[schema]
+
+    def structured_llm(self, name, schema):
+        """
+        The `name` client bound to the provider's native structured output for `schema`,
+        returning both the raw message (for token usage) and the parsed object.
+        """
+        if (name, schema) not in self._structured_llms:
+            self._structured_llms[(name, schema)] = self.get(name).with_structured_output(schema, include_raw=True)
+        return self._structured_llms[(name, schema)]
+
+    def warm_up(self, schemas=(), modules=()):
+        for module in modules:
+            importlib.import_module(module)
+        for name in self._factories:
+            try:
+                self.get(name)
+            except Exception as e:
+                logger.warning(f"Could not build '{name}' at startup, it will be retried on first use: {e}")
+        for schema in schemas:
+            self.format_instructions(schema)
+        logger.info(f"Registry ready with {len(self._objects)} objects and {len(self._parsers)} parsers")
+
+    async def warm_up_in_background(self, schemas=(), modules=()):
+        """
+        Import `modules` and build the registered objects one at a time in a worker
+        thread, while the server is already accepting requests. Only the factories
+        registered `on_loop` run on the event loop, one per loop iteration.
+
+        An object a request builds meanwhile is kept, and the background one dropped.
+        """
+        for module in modules:
+            try:
+                await asyncio.to_thread(importlib.import_module, module)
+            except Exception as e:
+                logger.warning(f"Could not preload '{module}', it will be imported on first use: {e}")
+
+        for name, factory in list(self._factories.items()):
+            if name in self._objects:
+                continue
+            try:
+                if name in self._on_loop:
+                    self.get(name)
+                    await asyncio.sleep(0)
+                else:
+                    self._objects.setdefault(name, await asyncio.to_thread(factory))
+            except Exception as e:
+                logger.warning(f"Could not build '{name}' at startup, it will be retried on first use: {e}")
+
+        for schema in schemas:
+            await asyncio.to_thread(self.format_instructions, schema)
+        logger.info(f"Registry ready with {len(self._objects)} objects and {len(self._parsers)} parsers")
+
+    async def aclose(self):
+        for name, close in self._closers.items():
+            if name in self._objects:
+                await close(self._objects[name])
+        self.clear()
+
+    def clear(self):
+        self._objects.clear()
+        self._parsers.clear()
+        self._format_instructions.clear()
+        self._structured_llms.clear()
+
+# Provider SDKs and LangGraph are imported by the factories that need them, so
+# importing the application does not pay for them before the first use
+def _chat_openai_llm():
+    from langchain_openai import ChatOpenAI
+    return ChatOpenAI(model_name="gpt-4o-mini", temperature=0.7)
+
+def _google_chat_genai_llm():
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    return ChatGoogleGenerativeAI(model="gemini-1.5-flash")
+
+def _google_genai_llm():
+    from langchain_google_genai import GoogleGenerativeAI
+    return GoogleGenerativeAI(model="gemini-1.5-flash")
+
+def _tavily_search():
+    from langchain_community.tools.tavily_search import TavilySearchResults
+    return TavilySearchResults(max_results=2)
+
+def _chatbot_prompt():
+    from app.api.features.chatbot import build_prompt
+    return build_prompt()
+
+def _chatbot_chain():
+    return registry.get("chatbot_prompt") | registry.get("google_genai_llm")
+
+def _summary_chain():
+    from app.api.features.chatbot import build_summary_prompt
+    return build_summary_prompt() | registry.get("google_genai_llm")
+
+def _chat_summaries():
+    return LRUCache(
+        max_size=int(os.environ.get("CHAT_SUMMARY_CACHE_SIZE", 1024)),
+        ttl=float(os.environ.get("CHAT_SUMMARY_CACHE_TTL", 6 * 3600))
+    )
+
+def _agent_openai_llm():
+    from app.api.features.util.llm_invocation import StepRateLimiter
+
+    # Same client as `chat_openai_llm`, but every agent step waits for the OpenAI budgets
+    step_tokens = int(os.environ.get("RATE_LIMIT_AGENT_STEP_TOKENS", 2000))
+    return registry.get("chat_openai_llm").model_copy(
+        update={"rate_limiter": StepRateLimiter(registry.get("rate_limits")["openai"], step_tokens)}
+    )
+
+def _research_tool():
+    return build_research_tool(
+        registry.get("tavily_search"),
+        registry.get("rate_limits")["tavily"],
+        registry.get("search_cache"),
+        registry.get("search_flights")
+    )
+
+def _search_cache():
+    return LRUCache(
+        max_size=int(os.environ.get("RESEARCH_CACHE_SIZE", 1024)),
+        ttl=float(os.environ.get("RESEARCH_CACHE_TTL", 6 * 3600))
+    )
+
+def _design_pattern_agent():
+    from langgraph.prebuilt import create_react_agent
+    return create_react_agent(registry.get("agent_openai_llm"), [registry.get("research_tool")])
+
+def _design_pattern_agent_native():
+    from app.api.features.schemas.codexpert_schema import DesignPatternResearch
+    from langgraph.prebuilt import create_react_agent
+    return create_react_agent(
+        registry.get("agent_openai_llm"),
+        [registry.get("research_tool")],
+        response_format=DesignPatternResearch
+    )
+
+def _llm_usage():
+    from app.api.features.util.llm_invocation import LLMUsageStats
+    return LLMUsageStats()
+
+def _checkpointer():
+    from app.api.features.util.checkpoints import build_checkpointer
+    return build_checkpointer()
+
+async def _close_checkpointer(checkpointer):
+    from app.api.features.util.checkpoints import close_checkpointer
+    await close_checkpointer(checkpointer)
+
+def _codexpert_graph(mode):
+    def factory():
+        from app.api.features.codexpert import compile_workflow
+        return compile_workflow(mode)
+    return factory
+
+def _architecture_graph():
+    from app.api.features.software_architecture_assistant import compile_workflow
+    return compile_workflow()
+
+def _codexpert_cache():
+    ttl = float(os.environ.get("CODEXPERT_CACHE_TTL", 3600))
+    memory = LRUCache(max_size=int(os.environ.get("CODEXPERT_CACHE_SIZE", 256)), ttl=ttl)
+    disk_path = os.environ.get("CODEXPERT_CACHE_DB")
+    disk = SQLiteCache(disk_path, ttl=ttl) if disk_path else None
+    return TieredCache(memory, disk)
+
+def _codexpert_unit_cache():
+    # Per-unit results of large files, kept longer so files edited over a session reuse them
+    ttl = float(os.environ.get("CODEXPERT_UNIT_CACHE_TTL", 24 * 3600))
+    memory = LRUCache(max_size=int(os.environ.get("CODEXPERT_UNIT_CACHE_SIZE", 4096)), ttl=ttl)
+    disk_path = os.environ.get("CODEXPERT_CACHE_DB")
+    disk = SQLiteCache(disk_path, ttl=ttl) if disk_path else None
+    return TieredCache(memory, disk)
+
+def _architecture_node_cache():
+    return LRUCache(
+        max_size=int(os.environ.get("ARCHITECTURE_CACHE_SIZE", 512)),
+        ttl=float(os.environ.get("ARCHITECTURE_CACHE_TTL", 3600))
+    )
+
+def _image_cache():
+    return LRUCache(
+        max_size=int(os.environ.get("ARCH_IMAGE_CACHE_SIZE", 64)),
+        ttl=float(os.environ.get("ARCH_IMAGE_CACHE_TTL", 300))
+    )
+
+def _ingested_images():
+    # Images of running architecture graphs by content hash, kept as long as their checkpoints
+    return LRUCache(
+        max_size=int(os.environ.get("ARCH_IMAGE_STORE_SIZE", 64)),
+        ttl=float(os.environ.get("CHECKPOINT_TTL", 24 * 3600))
+    )
+
+def _job_manager():
+    return JobManager(
+        workers=int(os.environ.get("JOB_WORKERS", 2)),
+        max_queue=int(os.environ.get("JOB_QUEUE_SIZE", 100)),
+        max_jobs=int(os.environ.get("JOB_MAX_RECORDS", 10000)),
+        ttl=float(os.environ.get("JOB_TTL", 3600))
+    )
+
+def _session_store():
+    max_messages = int(os.environ.get("CHAT_SESSION_MAX_MESSAGES", 200))
+    ttl = float(os.environ.get("CHAT_SESSION_TTL", 24 * 3600))
+    if os.environ.get("CHAT_SESSION_STORE", "memory") == "sqlite":
+        return SQLiteSessionStore(os.environ.get("CHAT_SESSION_DB", "chat_sessions.sqlite"), ttl=ttl, max_messages=max_messages)
+    return InMemorySessionStore(
+        max_sessions=int(os.environ.get("CHAT_SESSION_CACHE_SIZE", 10000)),
+        ttl=ttl,
+        max_messages=max_messages
+    )
+
+registry = Registry()
+
+registry.register("chat_openai_llm", _chat_openai_llm)
+registry.register("google_chat_genai_llm", _google_chat_genai_llm)
+registry.register("google_genai_llm", _google_genai_llm)
+registry.register("tavily_search", _tavily_search)
+registry.register("rate_limits", build_governor)
+registry.register("agent_openai_llm", _agent_openai_llm)
+registry.register("search_cache", _search_cache)
+registry.register("search_flights", lambda: SingleFlight("search"))
+registry.register("research_tool", _research_tool)
+registry.register("chatbot_prompt", _chatbot_prompt)
+registry.register("chatbot_chain", _chatbot_chain)
+registry.register("summary_chain", _summary_chain)
+registry.register("chat_summaries", _chat_summaries)
+registry.register("session_store", _session_store)
+registry.register("design_pattern_agent", _design_pattern_agent)
+registry.register("design_pattern_agent_native", _design_pattern_agent_native)
+registry.register("llm_usage", _llm_usage)
+registry.register("checkpointer", _checkpointer, close=_close_checkpointer, on_loop=True)
+registry.register("codexpert_sequential_graph", _codexpert_graph("sequential"))
+registry.register("codexpert_parallel_graph", _codexpert_graph("parallel"))
+registry.register("architecture_graph", _architecture_graph)
+registry.register("codexpert_cache", _codexpert_cache)
+registry.register("codexpert_unit_cache", _codexpert_unit_cache)
+registry.register("architecture_node_cache", _architecture_node_cache)
+registry.register("http_client", build_http_client, close=lambda client: client.aclose())
+registry.register("image_cache", _image_cache)
+registry.register("ingested_images", _ingested_images)
+registry.register("job_manager", _job_manager, close=lambda jobs: jobs.aclose())
+registry.register("chat_flights", lambda: SingleFlight("chat"))
+registry.register("codexpert_flights", lambda: SingleFlight("codexpert"))
+registry.register("architecture_flights", lambda: SingleFlight("architecture"))
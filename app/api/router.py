@@ -1,32 +1,94 @@
-from fastapi import APIRouter, Depends
-from app.api.features.chatbot import chatbot_executor
-from app.api.features.schemas.codexpert_schema import CodeInput
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, File, Form, HTTPException, Response, UploadFile
+from app.api.features.schemas.codexpert_schema import CodeBatchInput, CodeInput
 from app.api.features.schemas.schemas import ChatRequest, ChatResponse, Message
 from app.api.features.schemas.software_architecture_assistant_schemas import SoftwareArchitectureAssistantArgs
-from app.api.features.software_architecture_assistant import compile_workflow
-from app.api.features.codexpert import compile_workflow as compile_codexpert
-from app.api.logger import setup_logger
+from app.api.features.util.checkpoints import RunConflict, RunFailed, RunNotFound
+from app.api.features.util.image_ingestion import ImageIngestionError, ingest_image_url, ingest_upload
+from app.api.features.util.jobs import QueueFull
+from app.api.features.util.metrics import render_metrics
+from app.api.features.util.streaming import ndjson_response, sse_response
+from app.api.logger import log_payload, setup_logger
+from app.api.registry import registry
 from app.api.auth.auth import key_check
 
-
-from dotenv import load_dotenv, find_dotenv
-
-load_dotenv(find_dotenv())
+import asyncio
+import importlib
 
 logger = setup_logger(__name__)
 router = APIRouter()
 
+_features = {}
+
+async def feature(name):
+    """
+    Feature modules, and the LangChain stack behind them, are imported on first use, in a
+    worker thread so the event loop keeps serving other requests meanwhile.
+    """
+    # Not `sys.modules`: it also holds modules another thread is still importing
+    if name not in _features:
+        _features[name] = await asyncio.to_thread(importlib.import_module, f"app.api.features.{name}")
+
+    return _features[name]
+
+def run_failed(error):
+    """
+    A failed checkpointed run is reported with its `run_id`, so the client can resume it.
+    """
+    error_message = f"Error in executor: {error}"
+    logger.error(f"{error_message} (run {error.run_id})")
+    return HTTPException(status_code=500, detail={"message": error_message, "run_id": error.run_id})
+
+def submit_job(kind, events):
+    try:
+        job = registry.get("job_manager").submit(kind, events)
+    except QueueFull as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "30"})
+
+    return {"job_id": job["job_id"], "status": job["status"]}
+
 @router.get("/")
 def read_root():
     return {"Hello": "World"}
 
+@router.get("/cache/stats")
+async def cache_stats( _ = Depends(key_check) ):
+    return {
+        "codexpert": registry.get("codexpert_cache").stats(),
+        "codexpert_units": registry.get("codexpert_unit_cache").stats(),
+        "architecture_nodes": registry.get("architecture_node_cache").stats(),
+        "search": registry.get("search_cache").stats()
+    }
+
+@router.get("/single-flight/stats")
+async def single_flight_stats( _ = Depends(key_check) ):
+    return {
+        "chat": registry.get("chat_flights").stats(),
+        "codexpert": registry.get("codexpert_flights").stats(),
+        "architecture": registry.get("architecture_flights").stats(),
+        "search": registry.get("search_flights").stats()
+    }
+
+@router.get("/llm/stats")
+async def llm_stats( _ = Depends(key_check) ):
+    return registry.get("llm_usage").stats()
+
+@router.get("/metrics")
+async def metrics( _ = Depends(key_check) ):
+    content, content_type = render_metrics()
+    return Response(content=content, media_type=content_type)
+
+@router.get("/rate-limits/stats")
+async def rate_limit_stats( _ = Depends(key_check) ):
+    return {provider: limiter.stats() for provider, limiter in registry.get("rate_limits").items()}
+
 @router.post("/chat", response_model=ChatResponse)
 async def chat( request: ChatRequest, _ = Depends(key_check) ):
+    chatbot_feature = await feature("chatbot")
     user_name = request.user.fullName
-    chat_messages = request.messages
-    user_query = chat_messages[-1].payload.text
+    conversation = await chatbot_feature.load_conversation(request)
     
-    response = chatbot_executor(user_name=user_name, user_query=user_query, messages=chat_messages)
+    response = await chatbot_feature.chatbot_executor(user_name=user_name, conversation=conversation)
     
     formatted_response = Message(
         role="ai",
@@ -34,23 +96,126 @@ async def chat( request: ChatRequest, _ = Depends(key_check) ):
         payload={"text": response}
     )
     
-    return ChatResponse(data=[formatted_response])
+    return ChatResponse(data=[formatted_response], session_id=conversation.session_id)
+
+@router.post("/chat/stream")
+async def chat_stream( request: ChatRequest, _ = Depends(key_check) ):
+    chatbot_feature = await feature("chatbot")
+    user_name = request.user.fullName
+    conversation = await chatbot_feature.load_conversation(request)
+
+    async def events():
+        if conversation.session_id:
+            yield "session", {"session_id": conversation.session_id}
+        async for chunk in chatbot_feature.chatbot_stream(user_name=user_name, conversation=conversation):
+            yield "token", {"text": chunk}
+        yield "done", {}
+
+    return sse_response(events())
 
 @router.post("/software-architecture-assistant")
 async def software_architecture_assistant( request: SoftwareArchitectureAssistantArgs, _ = Depends(key_check) ):
+    architecture_feature = await feature("software_architecture_assistant")
+    
+    try:
+        logger.info(f"Image URL loaded: {request.img_url[:100]}")
+
+        image = await ingest_image_url(request.img_url, registry.get("http_client"), cache=registry.get("image_cache"))
+    except ImageIngestionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        result = await architecture_feature.run_architecture_assistant(
+            image,
+            img_url=request.img_url,
+            requirements=request.requirements,
+            lang=request.lang,
+            use_cache=request.use_cache,
+            structured_output_mode=request.structured_output_mode,
+            run_id=request.run_id
+        )
+    
+    except RunConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RunFailed as e:
+        raise run_failed(e)
+    except Exception as e:
+        error_message = f"Error in executor: {e}"
+        logger.error(error_message)
+        raise ValueError(error_message)
+    
+    return result
+
+@router.post("/software-architecture-assistant/stream")
+async def software_architecture_assistant_stream( request: SoftwareArchitectureAssistantArgs, _ = Depends(key_check) ):
+    architecture_feature = await feature("software_architecture_assistant")
+
+    try:
+        logger.info(f"Image URL loaded: {request.img_url[:100]}")
+
+        image = await ingest_image_url(request.img_url, registry.get("http_client"), cache=registry.get("image_cache"))
+    except ImageIngestionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return sse_response(
+        architecture_feature.stream_architecture_assistant(
+            image,
+            img_url=request.img_url,
+            requirements=request.requirements,
+            lang=request.lang,
+            use_cache=request.use_cache,
+            structured_output_mode=request.structured_output_mode,
+            run_id=request.run_id
+        )
+    )
+
+@router.post("/software-architecture-assistant/runs/{run_id}/resume")
+async def software_architecture_assistant_resume( run_id: str, _ = Depends(key_check) ):
+    architecture_feature = await feature("software_architecture_assistant")
+
+    try:
+        return await architecture_feature.resume_architecture_assistant(run_id)
+    except RunNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RunConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RunFailed as e:
+        raise run_failed(e)
+
+@router.post("/software-architecture-assistant/upload")
+async def software_architecture_assistant_upload(
+    file: UploadFile = File(...),
+    requirements: str = Form(...),
+    lang: str = Form(...),
+    use_cache: bool = Form(True),
+    structured_output_mode: Optional[Literal["prompt", "native"]] = Form(None),
+    run_id: Optional[str] = Form(None),
+    _ = Depends(key_check)
+):
+    architecture_feature = await feature("software_architecture_assistant")
     
     try:
-        logger.info(f"Image URL loaded: {request.img_url}")
-
-        architecture_assistant = compile_workflow()
-        result = architecture_assistant.invoke(
-            {
-                "img_url": request.img_url,
-                "requirements": request.requirements,
-                "lang": request.lang
-            }
+        logger.info(f"Image uploaded: {file.filename}")
+
+        image = await ingest_upload(file)
+    except ImageIngestionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    try:
+        result = await architecture_feature.run_architecture_assistant(
+            image,
+            img_url=f"upload:{file.filename}",
+            requirements=requirements,
+            lang=lang,
+            use_cache=use_cache,
+            structured_output_mode=structured_output_mode,
+            run_id=run_id
         )
     
+    except RunConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RunFailed as e:
+        raise run_failed(e)
     except Exception as e:
         error_message = f"Error in executor: {e}"
         logger.error(error_message)
@@ -60,25 +225,101 @@ async def software_architecture_assistant( request: SoftwareArchitectureAssistan
 
 @router.post("/codexpert")
 async def codexpert( request: CodeInput, _ = Depends(key_check) ):
+    codexpert_feature = await feature("codexpert")
     
     try:
-        logger.info(f"Args. loaded successfully: {request}")
-
-        codexpert = compile_codexpert()
-        result = codexpert.invoke(
-            {
-                "code": request.code,
-                "programming_language": request.programming_language,
-                "is_ai_related": request.is_ai_related,
-                "context": request.context
-            }
-        )
+        log_payload(logger, "Args. loaded successfully", request)
+
+        result = await codexpert_feature.run_codexpert(request)
 
         logger.info("CodeXpert worked successfully!")
     
+    except RunConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RunFailed as e:
+        raise run_failed(e)
     except Exception as e:
         error_message = f"Error in executor: {e}"
         logger.error(error_message)
         raise ValueError(error_message)
     
-    return result
\ No newline at end of file
+    return result
+
+@router.post("/codexpert/stream")
+async def codexpert_stream( request: CodeInput, _ = Depends(key_check) ):
+    codexpert_feature = await feature("codexpert")
+    log_payload(logger, "Args. loaded successfully", request)
+
+    return sse_response(codexpert_feature.stream_codexpert(request))
+
+@router.post("/codexpert/runs/{run_id}/resume")
+async def codexpert_resume( run_id: str, _ = Depends(key_check) ):
+    codexpert_feature = await feature("codexpert")
+
+    try:
+        return await codexpert_feature.resume_codexpert(run_id)
+    except RunNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except RunConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except RunFailed as e:
+        raise run_failed(e)
+
+@router.post("/codexpert/batch")
+async def codexpert_batch( request: CodeBatchInput, _ = Depends(key_check) ):
+    codexpert_feature = await feature("codexpert")
+    logger.info(f"CodeXpert batch of {len(request.items)} items with max_concurrency={request.max_concurrency}")
+
+    entries = codexpert_feature.run_codexpert_batch(request.items, request.max_concurrency)
+
+    if request.stream:
+        return ndjson_response(entries)
+
+    results = [None] * len(request.items)
+    async for entry in entries:
+        results[entry["index"]] = entry
+
+    return {"results": results}
+
+@router.post("/jobs/codexpert", status_code=202)
+async def codexpert_job( request: CodeInput, _ = Depends(key_check) ):
+    codexpert_feature = await feature("codexpert")
+    log_payload(logger, "Args. loaded successfully", request)
+
+    return submit_job("codexpert", lambda: codexpert_feature.stream_codexpert(request))
+
+@router.post("/jobs/architecture", status_code=202)
+async def architecture_job( request: SoftwareArchitectureAssistantArgs, _ = Depends(key_check) ):
+    architecture_feature = await feature("software_architecture_assistant")
+
+    try:
+        logger.info(f"Image URL loaded: {request.img_url[:100]}")
+
+        image = await ingest_image_url(request.img_url, registry.get("http_client"), cache=registry.get("image_cache"))
+    except ImageIngestionError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    return submit_job(
+        "architecture",
+        lambda: architecture_feature.stream_architecture_assistant(
+            image,
+            img_url=request.img_url,
+            requirements=request.requirements,
+            lang=request.lang,
+            use_cache=request.use_cache,
+            structured_output_mode=request.structured_output_mode,
+            run_id=request.run_id
+        )
+    )
+
+@router.get("/jobs/stats")
+async def job_stats( _ = Depends(key_check) ):
+    return registry.get("job_manager").stats()
+
+@router.get("/jobs/{job_id}")
+async def job_status( job_id: str, _ = Depends(key_check) ):
+    job = registry.get("job_manager").get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job '{job_id}' not found or expired")
+
+    return job
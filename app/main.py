@@ -2,25 +2,69 @@ from fastapi import FastAPI, Request, Depends
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, suppress
+from starlette.routing import Match
 from app.api.router import router
-from app.api.logger import setup_logger
+from app.api.logger import request_id_var, setup_logger
 from app.api.error_utilities import ErrorResponse
+from app.api.registry import registry
+from app.api.features.util.checkpoints import purge_periodically
+from app.api.features.util.metrics import observe_request, register_collector, set_endpoint
+from app.api.features.schemas.codexpert_schema import CodeEvaluation, CodeOutput, CodePatch, DesignPatternResearch, QualityAttributesApplication, RefactoringSuggestions
+from app.api.features.schemas.software_architecture_assistant_schemas import ArchitectureImprovementSchema, ArchitectureSchema, ArchitectureValidationSchema, QualityAttributesSchema
 
+import asyncio
 import os
+import uuid
 
-from dotenv import load_dotenv, find_dotenv
+logger = setup_logger(__name__)
 
-load_dotenv(find_dotenv())
+# eager: warm everything up before serving; background: serve right away and warm up
+# behind the first requests; lazy: build everything on first use
+STARTUP_MODE = os.environ.get("STARTUP_MODE", "eager")
 
-logger = setup_logger(__name__)
+# Feature modules and SDKs that the router and the registry otherwise import on first use
+PRELOAD_MODULES = [
+    "langchain_openai",
+    "langchain_google_genai",
+    "langchain_community.tools.tavily_search",
+    "langgraph.prebuilt",
+    "app.api.features.chatbot",
+    "app.api.features.codexpert",
+    "app.api.features.software_architecture_assistant"
+]
+
+WARM_UP_SCHEMAS = [
+    CodeEvaluation,
+    RefactoringSuggestions,
+    DesignPatternResearch,
+    QualityAttributesApplication,
+    CodeOutput,
+    CodePatch,
+    ArchitectureSchema,
+    ArchitectureValidationSchema,
+    ArchitectureImprovementSchema,
+    QualityAttributesSchema
+]
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    logger.info(f"Initializing Application Startup")
+    logger.info(f"Initializing Application Startup ({STARTUP_MODE} mode)")
+    warm_up = None
+    if STARTUP_MODE == "eager":
+        registry.warm_up(schemas=WARM_UP_SCHEMAS, modules=PRELOAD_MODULES)
+    elif STARTUP_MODE == "background":
+        warm_up = asyncio.create_task(registry.warm_up_in_background(schemas=WARM_UP_SCHEMAS, modules=PRELOAD_MODULES))
+    purge = asyncio.create_task(purge_periodically())
     logger.info(f"Successfully Completed Application Startup")
     
     yield
+    for task in (warm_up, purge):
+        if task is not None:
+            task.cancel()
+            with suppress(asyncio.CancelledError):
+                await task
+    await registry.aclose()
     logger.info("Application shutdown")
 
 app = FastAPI(lifespan = lifespan)
@@ -48,4 +92,35 @@ async def validation_exception_handler(request: Request, exc: RequestValidationE
         content=error_response.dict()
     )
 
+def route_template(request: Request):
+    # Label metrics by route template, not raw path, to keep job and run IDs out of them
+    for route in router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return route.path
+    return "unmatched"
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    endpoint = route_template(request)
+    set_endpoint(endpoint)
+
+    with observe_request(endpoint, request.method) as status:
+        response = await call_next(request)
+        status["code"] = response.status_code
+
+    return response
+
+@app.middleware("http")
+async def request_id_middleware(request: Request, call_next):
+    # Every log record written while serving the request carries its ID
+    request_id = request.headers.get("X-Request-ID") or uuid.uuid4().hex
+    request_id_var.set(request_id)
+
+    response = await call_next(request)
+    response.headers["X-Request-ID"] = request_id
+    return response
+
+register_collector(registry)
+
 app.include_router(router)
\ No newline at end of file
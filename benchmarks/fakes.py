@@ -0,0 +1,335 @@
+import asyncio
+import json
+import random
+import re
+import time
+import typing
+import uuid
+from enum import Enum
+from typing import Any, Dict, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.language_models.llms import LLM
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult, GenerationChunk
+from langchain_core.runnables import RunnableLambda
+from langchain_core.tools import BaseTool
+from pydantic import BaseModel, ConfigDict, PrivateAttr
+
+from app.api.features.schemas.codexpert_schema import (
+    CodeEvaluation,
+    CodeOutput,
+    CodePatch,
+    DesignPatternResearch,
+    QualityAttributesApplication,
+    RefactoringSuggestions
+)
+from app.api.features.schemas.software_architecture_assistant_schemas import (
+    ArchitectureImprovementSchema,
+    ArchitectureSchema,
+    ArchitectureValidationSchema,
+    QualityAttributesSchema
+)
+
+SCHEMAS = [
+    CodeEvaluation,
+    RefactoringSuggestions,
+    DesignPatternResearch,
+    QualityAttributesApplication,
+    CodeOutput,
+    CodePatch,
+    ArchitectureSchema,
+    ArchitectureValidationSchema,
+    ArchitectureImprovementSchema,
+    QualityAttributesSchema
+]
+
+CHARS_PER_TOKEN = 4
+
+class FakeRateLimitError(Exception):
+    """
+    Raised when a fake provider's quota is exceeded, recognized as a 429 by the rate limiter.
+    """
+    status_code = 429
+
+class FakeProviderError(Exception):
+    status_code = 500
+
+class ProviderProfile(BaseModel):
+    """
+    Behaviour of a fake provider: per-call latency drawn from a log-normal distribution
+    around `median_latency`, the prompt read at `prompt_tokens_per_second` when set,
+    output streamed at `tokens_per_second`, random failures at `failure_rate` and,
+    when `requests_per_minute` is set, 429s above that quota.
+
+    `malformed_rate` is the share of JSON text answers that come back damaged in one of
+    the ways in MALFORMATIONS, to exercise the parse repair and retry path.
+
+    A `blocking` provider sleeps on the calling thread, like a synchronous SDK call
+    made from an async handler, to compare with the async path.
+    """
+    median_latency: float = 0.3
+    latency_sigma: float = 0.4
+    tokens_per_second: float = 200.0
+    prompt_tokens_per_second: Optional[float] = None
+    output_tokens: int = 200
+    failure_rate: float = 0.0
+    malformed_rate: float = 0.0
+    requests_per_minute: Optional[int] = None
+    blocking: bool = False
+
+def _rename_first_field(answer):
+    first = next(iter(answer))
+    return json.dumps({f"{first}_value" if index == 0 else key: value for index, (key, value) in enumerate(answer.items())})
+
+# Ways a model damages a JSON answer. The first three are recovered locally, by the JSON
+# parser or `extract_json`; the others fail schema validation and need a retry, unless a
+# truncation happens to keep every required field.
+MALFORMATIONS = {
+    "prose": lambda answer: f"Here is the result you asked for:\n{json.dumps(answer)}\nLet me know if you need anything else.",
+    "fenced": lambda answer: f"```json\n{json.dumps(answer, indent=2)}\n```",
+    "trailing_comma": lambda answer: json.dumps(answer)[:-1] + ",}",
+    "truncated": lambda answer: json.dumps(answer)[:len(json.dumps(answer)) // 2],
+    "renamed_field": _rename_first_field
+}
+
+class Quota:
+    """
+    Sliding one-minute window of accepted calls, shared by every client of a fake provider.
+    """
+
+    def __init__(self, requests_per_minute):
+        self.requests_per_minute = requests_per_minute
+        self.calls = []
+        self.rejected = 0
+
+    def check(self):
+        if not self.requests_per_minute:
+            return
+        now = time.monotonic()
+        self.calls = [call for call in self.calls if now - call < 60]
+        if len(self.calls) >= self.requests_per_minute:
+            self.rejected += 1
+            raise FakeRateLimitError("429 Too Many Requests: fake provider quota exceeded")
+        self.calls.append(now)
+
+class FakeBehaviour:
+    """
+    Latency, failures and quota of one fake provider, with a seeded random generator
+    so runs are repeatable.
+    """
+
+    def __init__(self, profile, seed=0):
+        self.profile = profile
+        self.random = random.Random(seed)
+        self.quota = Quota(profile.requests_per_minute)
+        self.calls = 0
+        self.malformed = {}
+
+    def latency(self, output_tokens, prompt_tokens=0):
+        profile = self.profile
+        base = profile.median_latency * self.random.lognormvariate(0, profile.latency_sigma) if profile.median_latency else 0.0
+        if profile.prompt_tokens_per_second:
+            base += prompt_tokens / profile.prompt_tokens_per_second
+        return base + output_tokens / profile.tokens_per_second
+
+    async def call(self, output_tokens, prompt_tokens=0):
+        self.calls += 1
+        self.quota.check()
+        if self.profile.blocking:
+            time.sleep(self.latency(output_tokens, prompt_tokens))
+        else:
+            await asyncio.sleep(self.latency(output_tokens, prompt_tokens))
+        if self.random.random() < self.profile.failure_rate:
+            raise FakeProviderError("Fake provider error")
+
+    def render_answer(self, answer):
+        """
+        JSON text of `answer`, damaged at `malformed_rate`.
+        """
+        if not answer or self.random.random() >= self.profile.malformed_rate:
+            return json.dumps(answer)
+        kind = self.random.choice(list(MALFORMATIONS))
+        self.malformed[kind] = self.malformed.get(kind, 0) + 1
+        return MALFORMATIONS[kind](answer)
+
+def example_value(annotation):
+    """
+    A small valid value for a type annotation, recursing into models, lists and dicts.
+    """
+    origin = typing.get_origin(annotation)
+    args = typing.get_args(annotation)
+
+    if origin is typing.Union:
+        return example_value(next(arg for arg in args if arg is not type(None)))
+    if origin is typing.Literal:
+        return args[0]
+    if origin in (list, List):
+        return [example_value(args[0])] if args else []
+    if origin in (dict, Dict):
+        return {"example": example_value(args[1])} if args else {}
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return example_instance(annotation)
+    if isinstance(annotation, type) and issubclass(annotation, Enum):
+        return next(iter(annotation)).value
+    if annotation is bool:
+        return True
+    if annotation is int:
+        return 3
+    if annotation is float:
+        return 0.5
+    if annotation is Any:
+        return "example"
+    return "example"
+
+def example_instance(schema):
+    return {name: example_value(field.annotation) for name, field in schema.model_fields.items()}
+
+def answer_for(schema, text):
+    """
+    Schema-valid answer to a prompt. A rewritten file is as long as the prompt that
+    carries it, and a patch makes no edits, so both output modes stay valid and their
+    output sizes compare like real answers.
+    """
+    if schema is CodeOutput:
+        return {"optimized_code": text}
+    if schema is CodePatch:
+        return {"edits": []}
+    return example_instance(schema)
+
+def requested_schema(text, schemas=SCHEMAS):
+    """
+    The schema whose JSON format instructions appear in the prompt, if any.
+    """
+    match = re.search(r"Here is the output schema:\s*```\s*(\{.*?\})\s*```", text, re.DOTALL)
+    if match is None:
+        return None
+    try:
+        properties = set(json.loads(match.group(1)).get("properties", {}))
+    except json.JSONDecodeError:
+        return None
+    return next((schema for schema in schemas if set(schema.model_fields) == properties), None)
+
+def message_text(messages):
+    parts = []
+    for message in messages:
+        content = message.content
+        if isinstance(content, str):
+            parts.append(content)
+        else:
+            parts.extend(part.get("text", "") for part in content if isinstance(part, dict))
+    return "\n".join(parts)
+
+def usage(prompt_text, answer_text):
+    input_tokens = len(prompt_text) // CHARS_PER_TOKEN + 1
+    output_tokens = len(answer_text) // CHARS_PER_TOKEN + 1
+    return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that answers with schema-valid JSON for the schema named in the prompt's
+    format instructions (or bound with `with_structured_output`), after a simulated
+    provider delay. Text answers are damaged at the profile's `malformed_rate`. Bound to tools, it makes `search_calls` tool calls before answering.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    behaviour: FakeBehaviour
+    search_calls: int = 1
+    bound_tools: List[str] = []
+
+    @property
+    def _llm_type(self):
+        return "fake-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.model_copy(update={"bound_tools": [tool.name for tool in tools]})
+
+    def _answer(self, messages):
+        text = message_text(messages)
+        tool_messages = sum(isinstance(message, ToolMessage) for message in messages)
+
+        if self.bound_tools and tool_messages < self.search_calls:
+            return AIMessage(
+                content="",
+                tool_calls=[{"name": self.bound_tools[0], "args": {"query": text[-200:]}, "id": uuid.uuid4().hex}],
+                usage_metadata=usage(text, "")
+            )
+
+        schema = requested_schema(text)
+        answer = self.behaviour.render_answer(answer_for(schema, text)) if schema else "This is a fake answer. " * 10
+        return AIMessage(content=answer, usage_metadata=usage(text, answer))
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError("FakeChatModel only supports async calls")
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._answer(messages)
+        await self.behaviour.call(message.usage_metadata["output_tokens"], message.usage_metadata["input_tokens"])
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._answer(messages)
+        await self.behaviour.call(0, message.usage_metadata["input_tokens"])
+        for index in range(0, len(message.content), 20):
+            await asyncio.sleep(20 / CHARS_PER_TOKEN / self.behaviour.profile.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=message.content[index:index + 20]))
+
+    def with_structured_output(self, schema, include_raw=False, **kwargs):
+        async def answer(messages):
+            if hasattr(messages, "to_messages"):
+                messages = messages.to_messages()
+            text = message_text(messages)
+            parsed = schema.model_validate(answer_for(schema, text))
+            raw = AIMessage(content="", usage_metadata=usage(text, parsed.model_dump_json()))
+            await self.behaviour.call(raw.usage_metadata["output_tokens"], raw.usage_metadata["input_tokens"])
+            return {"raw": raw, "parsed": parsed, "parsing_error": None} if include_raw else parsed
+
+        return RunnableLambda(answer)
+
+class FakeTextModel(LLM):
+    """
+    Text completion model standing in for `GoogleGenerativeAI` in the chatbot chains.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    behaviour: FakeBehaviour
+
+    @property
+    def _llm_type(self):
+        return "fake-text"
+
+    def _call(self, prompt, stop=None, run_manager=None, **kwargs):
+        raise NotImplementedError("FakeTextModel only supports async calls")
+
+    async def _acall(self, prompt, stop=None, run_manager=None, **kwargs):
+        answer = "This is a fake answer. " * (self.behaviour.profile.output_tokens // 6)
+        await self.behaviour.call(len(answer) // CHARS_PER_TOKEN, len(prompt) // CHARS_PER_TOKEN)
+        return answer
+
+    async def _astream(self, prompt, stop=None, run_manager=None, **kwargs):
+        await self.behaviour.call(0, len(prompt) // CHARS_PER_TOKEN)
+        for _ in range(self.behaviour.profile.output_tokens // 6):
+            await asyncio.sleep(6 / self.behaviour.profile.tokens_per_second)
+            yield GenerationChunk(text="This is a fake answer. ")
+
+class FakeSearchTool(BaseTool):
+    """
+    Stand-in for the Tavily search tool, returning two canned results.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    name: str = "tavily_search_results_json"
+    description: str = "A search engine. Input should be a search query."
+    behaviour: FakeBehaviour
+
+    _results: list = PrivateAttr(default_factory=lambda: [
+        {"url": "https://example.com/patterns/strategy", "content": "The Strategy pattern defines a family of algorithms."},
+        {"url": "https://example.com/patterns/factory", "content": "The Factory pattern creates objects without naming their classes."}
+    ])
+
+    def _run(self, query: str):
+        raise NotImplementedError("FakeSearchTool only supports async calls")
+
+    async def _arun(self, query: str):
+        await self.behaviour.call(0)
+        return self._results
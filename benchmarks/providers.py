@@ -0,0 +1,23 @@
+from benchmarks.fakes import FakeBehaviour, FakeChatModel, FakeSearchTool, FakeTextModel, ProviderProfile
+
+def install_fake_providers(registry, openai=None, google=None, tavily=None, seed=0):
+    """
+    Replace the OpenAI, Gemini and Tavily clients in `registry` with fakes following
+    the given `ProviderProfile`s. Must run before the application starts, or any
+    object already built from the real clients is rebuilt on next use.
+
+    Returns the behaviour of each provider, to read call counts and quota rejections.
+    """
+    behaviours = {
+        "openai": FakeBehaviour(openai or ProviderProfile(), seed=seed),
+        "google": FakeBehaviour(google or ProviderProfile(), seed=seed + 1),
+        "tavily": FakeBehaviour(tavily or ProviderProfile(median_latency=0.5, output_tokens=0), seed=seed + 2)
+    }
+
+    registry.register("chat_openai_llm", lambda: FakeChatModel(behaviour=behaviours["openai"]))
+    registry.register("google_chat_genai_llm", lambda: FakeChatModel(behaviour=behaviours["google"]))
+    registry.register("google_genai_llm", lambda: FakeTextModel(behaviour=behaviours["google"]))
+    registry.register("tavily_search", lambda: FakeSearchTool(behaviour=behaviours["tavily"]))
+    registry.clear()
+
+    return behaviours
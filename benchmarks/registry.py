@@ -0,0 +1,76 @@
+"""
+Measure the per-request setup the registry removes: building each endpoint's graphs,
+prompts, parsers, clients and tools for every request, as the handlers did before,
+against looking them up in the warmed registry.
+
+    python -m benchmarks.registry --runs 50
+
+No provider is called; the real clients are only constructed, with placeholder keys.
+"""
+import argparse
+import os
+import statistics
+import time
+
+def endpoints():
+    from app.api.features.schemas.codexpert_schema import CodeEvaluation, CodeOutput, DesignPatternResearch, QualityAttributesApplication, RefactoringSuggestions
+    from app.api.features.schemas.software_architecture_assistant_schemas import ArchitectureImprovementSchema, ArchitectureSchema, ArchitectureValidationSchema, QualityAttributesSchema
+
+    # What each handler used to build per request: registry entries and parser schemas
+    return {
+        "chat": (["chatbot_chain"], []),
+        "codexpert": (
+            ["codexpert_sequential_graph", "chat_openai_llm", "design_pattern_agent"],
+            [CodeEvaluation, RefactoringSuggestions, DesignPatternResearch, QualityAttributesApplication, CodeOutput]
+        ),
+        "architecture": (
+            ["architecture_graph", "google_chat_genai_llm"],
+            [ArchitectureSchema, ArchitectureValidationSchema, ArchitectureImprovementSchema, QualityAttributesSchema]
+        )
+    }
+
+def setup(registry, names, schemas, rebuild):
+    start = time.perf_counter()
+    if rebuild:
+        registry.clear()
+    for name in names:
+        registry.get(name)
+    for schema in schemas:
+        registry.format_instructions(schema)
+    return time.perf_counter() - start
+
+def measure(registry, names, schemas, runs):
+    # One untimed build first, so module imports are not counted as per-request cost
+    setup(registry, names, schemas, rebuild=True)
+    rebuilt = [setup(registry, names, schemas, rebuild=True) for _ in range(runs)]
+    setup(registry, names, schemas, rebuild=False)
+    cached = [setup(registry, names, schemas, rebuild=False) for _ in range(runs)]
+    return {
+        "rebuilt_ms": round(1000 * statistics.median(rebuilt), 3),
+        "registry_ms": round(1000 * statistics.median(cached), 3)
+    }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=50)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    os.environ.setdefault("ENV_TYPE", "dev")
+    os.environ.setdefault("CHECKPOINT_STORE", "memory")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    for key in ("OPENAI_API_KEY", "GOOGLE_API_KEY", "TAVILY_API_KEY"):
+        os.environ.setdefault(key, "benchmark")
+
+    from app.api.registry import registry
+
+    print(f"median per-request setup over {args.runs} runs, milliseconds")
+    print(f"{'endpoint':<16}{'rebuilt':>12}{'registry':>12}")
+    for endpoint, (names, schemas) in endpoints().items():
+        result = measure(registry, names, schemas, args.runs)
+        print(f"{endpoint:<16}{result['rebuilt_ms']:>12}{result['registry_ms']:>12}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Replay a JSONL request mix against the ASGI app with fake providers and report
+latency percentiles, throughput and event-loop lag.
+
+    python -m benchmarks.replay benchmarks/mixes/mixed.jsonl --concurrency 16 --requests 200
+
+Each mix line is `{"name", "method", "path", "json", "weight"}`; `{n}` inside string
+values of `json` is replaced by the request number, to control cache hits.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+from benchmarks.fakes import ProviderProfile
+
+def load_mix(path):
+    with open(path) as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+def render(value, number):
+    if isinstance(value, str):
+        return value.replace("{n}", str(number))
+    if isinstance(value, list):
+        return [render(item, number) for item in value]
+    if isinstance(value, dict):
+        return {key: render(item, number) for key, item in value.items()}
+    return value
+
+def schedule(mix, total, seed):
+    generator = random.Random(seed)
+    weights = [entry.get("weight", 1) for entry in mix]
+    return [(number, generator.choices(mix, weights)[0]) for number in range(total)]
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def summarize(values):
+    return {
+        "count": len(values),
+        "p50_ms": round(1000 * percentile(values, 0.50), 1),
+        "p95_ms": round(1000 * percentile(values, 0.95), 1),
+        "p99_ms": round(1000 * percentile(values, 0.99), 1),
+        "max_ms": round(1000 * max(values, default=0.0), 1)
+    }
+
+async def monitor_loop_lag(samples, interval=0.01):
+    """
+    Measures how late the event loop wakes up a sleeping task; blocking work on the
+    loop shows up here before it shows up in request latency.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - start - interval))
+
+async def replay(app, mix, total=100, concurrency=8, seed=0, headers=None):
+    import httpx
+
+    from app.api.registry import registry
+
+    requests = schedule(mix, total, seed)
+    latencies = {}
+    errors = {}
+    lag_samples = []
+
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", headers=headers, timeout=None) as client:
+            queue = asyncio.Queue()
+            for request in requests:
+                queue.put_nowait(request)
+
+            async def worker():
+                while not queue.empty():
+                    number, entry = queue.get_nowait()
+                    name = entry.get("name", entry["path"])
+                    start = time.perf_counter()
+                    try:
+                        response = await client.request(entry.get("method", "POST"), entry["path"], json=render(entry.get("json"), number))
+                        failed = response.status_code >= 400
+                    except Exception:
+                        failed = True
+                    latencies.setdefault(name, []).append(time.perf_counter() - start)
+                    errors[name] = errors.get(name, 0) + int(failed)
+
+            monitor = asyncio.create_task(monitor_loop_lag(lag_samples))
+            start = time.perf_counter()
+            await asyncio.gather(*[worker() for _ in range(concurrency)])
+            elapsed = time.perf_counter() - start
+            monitor.cancel()
+
+        # Read before shutdown, which drops the registry's objects
+        llm_usage = registry.get("llm_usage").stats()
+
+    all_latencies = [value for values in latencies.values() for value in values]
+    return {
+        "requests": total,
+        "concurrency": concurrency,
+        "elapsed_seconds": round(elapsed, 2),
+        "throughput_rps": round(total / elapsed, 2),
+        "latency": summarize(all_latencies),
+        "endpoints": {name: {**summarize(values), "errors": errors[name]} for name, values in sorted(latencies.items())},
+        "event_loop_lag": summarize(lag_samples),
+        "llm_usage": llm_usage
+    }
+
+def print_report(report, behaviours):
+    print(f"{report['requests']} requests, concurrency {report['concurrency']}, {report['elapsed_seconds']}s, {report['throughput_rps']} req/s")
+    print(f"{'endpoint':<40}{'count':>7}{'errors':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in report["endpoints"].items():
+        print(f"{name:<40}{stats['count']:>7}{stats['errors']:>8}{stats['p50_ms']:>10}{stats['p95_ms']:>10}{stats['p99_ms']:>10}")
+    lag = report["event_loop_lag"]
+    print(f"event loop lag: p50 {lag['p50_ms']} ms, p99 {lag['p99_ms']} ms, max {lag['max_ms']} ms")
+    for provider, behaviour in behaviours.items():
+        print(f"{provider}: {behaviour.calls} calls, {behaviour.quota.rejected} rejected by quota")
+    parsing = report["parsing"]
+    if parsing["malformed"]:
+        kinds = ", ".join(f"{kind} {count}" for kind, count in sorted(parsing["malformed_kinds"].items()))
+        print(f"malformed answers: {parsing['malformed']} ({kinds}), {parsing['repaired']} repaired locally, {parsing['retried']} retried")
+
+def parsing_report(behaviours, usage_stats):
+    """
+    Malformed answers the fakes sent, split into those `parse_json` recovered without
+    a call and those that cost a retry.
+    """
+    kinds = {}
+    for behaviour in behaviours.values():
+        for kind, count in behaviour.malformed.items():
+            kinds[kind] = kinds.get(kind, 0) + count
+    malformed = sum(kinds.values())
+    retried = sum(mode["parse_failures"] for modes in usage_stats.values() for mode in modes.values())
+    return {"malformed": malformed, "malformed_kinds": kinds, "repaired": max(malformed - retried, 0), "retried": retried}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("mix", help="JSONL request mix")
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.3, help="Median provider latency in seconds")
+    parser.add_argument("--latency-sigma", type=float, default=0.4, help="Log-normal spread of the provider latency")
+    parser.add_argument("--tokens-per-second", type=float, default=200.0)
+    parser.add_argument("--prompt-tokens-per-second", type=float, default=None, help="Prompt reading rate; prompt size does not add latency when unset")
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="Share of JSON answers returned damaged (prose, fences, trailing commas, truncated, renamed fields)")
+    parser.add_argument("--blocking-providers", action="store_true", help="Fake providers block the event loop, like synchronous SDK calls")
+    parser.add_argument("--openai-rpm", type=int, default=None, help="Quota enforced by the fake OpenAI provider")
+    parser.add_argument("--google-rpm", type=int, default=None, help="Quota enforced by the fake Google provider")
+    parser.add_argument("--tavily-rpm", type=int, default=None, help="Quota enforced by the fake Tavily provider")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="Application setting, e.g. CODEXPERT_PIPELINE_MODE=parallel")
+    parser.add_argument("--json", help="Also write the report to this file")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+
+    # Settings are read at import time, so they are applied before the app is imported
+    os.environ.setdefault("ENV_TYPE", "dev")
+    os.environ.setdefault("CHECKPOINT_STORE", "memory")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    for setting in args.env:
+        name, value = setting.split("=", 1)
+        os.environ[name] = value
+
+    from app.api.registry import registry
+    from app.main import app
+    from benchmarks.providers import install_fake_providers
+
+    def profile(rpm, output_tokens=200):
+        return ProviderProfile(
+            median_latency=args.latency,
+            latency_sigma=args.latency_sigma,
+            tokens_per_second=args.tokens_per_second,
+            prompt_tokens_per_second=args.prompt_tokens_per_second,
+            output_tokens=output_tokens,
+            failure_rate=args.failure_rate,
+            malformed_rate=args.malformed_rate,
+            requests_per_minute=rpm,
+            blocking=args.blocking_providers
+        )
+
+    behaviours = install_fake_providers(
+        registry,
+        openai=profile(args.openai_rpm),
+        google=profile(args.google_rpm),
+        tavily=profile(args.tavily_rpm, output_tokens=0),
+        seed=args.seed
+    )
+
+    headers = {"api-key": "production" if os.environ["ENV_TYPE"] == "production" else "dev"}
+    report = asyncio.run(replay(app, load_mix(args.mix), args.requests, args.concurrency, args.seed, headers))
+    report["providers"] = {provider: {"calls": behaviour.calls, "quota_rejections": behaviour.quota.rejected} for provider, behaviour in behaviours.items()}
+    report["parsing"] = parsing_report(behaviours, report["llm_usage"])
+
+    print_report(report, behaviours)
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Measure cold-start time per STARTUP_MODE: each run is a fresh interpreter that imports
+the app, starts its lifespan and serves a first `GET /` and a first `/codexpert` call
+with fake providers.
+
+    python -m benchmarks.startup --runs 5 --import-budget 1.0 --ready-budget 1.0 --modes background lazy
+
+Exits with status 1 when a median exceeds its budget, so it can gate a CI job.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODES = ["eager", "background", "lazy"]
+METRICS = ["import_seconds", "ready_seconds", "first_response_seconds", "first_codexpert_seconds"]
+
+def child(mode):
+    """
+    One cold start; every time is measured from before the application import, minus
+    the time the benchmark itself spends loading the fake providers.
+    """
+    start = time.perf_counter()
+    os.environ.setdefault("ENV_TYPE", "dev")
+    os.environ.setdefault("CHECKPOINT_STORE", "memory")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ["STARTUP_MODE"] = mode
+
+    from app.main import app
+    imported = time.perf_counter()
+
+    import asyncio
+    import httpx
+    from app.api.registry import registry
+    from benchmarks.fakes import ProviderProfile
+    from benchmarks.providers import install_fake_providers
+    from benchmarks.replay import load_mix, render
+
+    fast = ProviderProfile(median_latency=0.01, latency_sigma=0.0, tokens_per_second=100000.0)
+    install_fake_providers(registry, openai=fast, google=fast, tavily=fast)
+    entry = load_mix(os.path.join(os.path.dirname(__file__), "mixes", "codexpert.jsonl"))[0]
+
+    # Loading the fakes imports LangChain, which the lazy modes would otherwise defer
+    setup = time.perf_counter() - imported
+
+    async def serve():
+        timings = {}
+        async with app.router.lifespan_context(app):
+            timings["ready_seconds"] = time.perf_counter() - start - setup
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", headers={"api-key": "dev"}, timeout=None) as client:
+                await client.get("/")
+                timings["first_response_seconds"] = time.perf_counter() - start - setup
+                response = await client.post(entry["path"], json=render(entry["json"], 0))
+                response.raise_for_status()
+                timings["first_codexpert_seconds"] = time.perf_counter() - start - setup
+        return timings
+
+    timings = asyncio.run(serve())
+    timings["import_seconds"] = imported - start
+    print(json.dumps(timings))
+
+def measure(mode, runs, env):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.run(
+            [sys.executable, "-m", "benchmarks.startup", "--child", mode],
+            capture_output=True, text=True, check=True, env={**os.environ, **env}
+        ).stdout
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {metric: round(statistics.median(sample[metric] for sample in samples), 3) for metric in METRICS}
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--modes", nargs="+", choices=MODES, default=MODES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=None, help="Maximum median import time in seconds")
+    parser.add_argument("--ready-budget", type=float, default=None, help="Maximum median time until the lifespan is ready, in seconds")
+    parser.add_argument("--env", action="append", default=[], metavar="NAME=VALUE", help="Application setting for every run")
+    parser.add_argument("--json", help="Also write the report to this file")
+    parser.add_argument("--child", choices=MODES, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if args.child:
+        child(args.child)
+        return
+
+    env = dict(setting.split("=", 1) for setting in args.env)
+    report = {mode: measure(mode, args.runs, env) for mode in args.modes}
+
+    print(f"median of {args.runs} cold starts, seconds since the application import started")
+    print(f"{'mode':<12}" + "".join(f"{metric.replace('_seconds', ''):>18}" for metric in METRICS))
+    for mode, medians in report.items():
+        print(f"{mode:<12}" + "".join(f"{medians[metric]:>18}" for metric in METRICS))
+
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump(report, file, indent=2)
+
+    budgets = {"import_seconds": args.import_budget, "ready_seconds": args.ready_budget}
+    exceeded = [
+        f"{mode}: {metric} {medians[metric]}s > {budget}s"
+        for mode, medians in report.items()
+        for metric, budget in budgets.items()
+        if budget is not None and medians[metric] > budget
+    ]
+    for line in exceeded:
+        print(f"over budget, {line}")
+    if exceeded:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
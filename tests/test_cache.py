@@ -0,0 +1,81 @@
+import asyncio
+import sqlite3
+import time
+
+from app.api.features.util.cache import LRUCache, SQLiteCache, TieredCache, content_hash, memoize_node, normalize_code
+
+def test_normalize_code_ignores_formatting_noise():
+    assert normalize_code("\r\n    def f():\r\n        return 1   \r\n\r\n") == normalize_code("def f():\n    return 1")
+    assert content_hash("code", normalize_code("x = 1\n")) == content_hash("code", normalize_code("  x = 1"))
+
+def test_lru_cache_evicts_the_least_recently_used_entry():
+    cache = LRUCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+def test_lru_cache_expires_entries_after_the_ttl():
+    cache = LRUCache(ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1 and cache.stats()["size"] == 0
+
+def test_sqlite_cache_round_trips_json_and_expires(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "cache.sqlite"), ttl=60)
+    cache.set("a", {"works": True, "errors": ["x"]})
+    assert cache.get("a") == {"works": True, "errors": ["x"]}
+
+    expired = SQLiteCache(str(tmp_path / "cache.sqlite"), ttl=-1)
+    expired.set("b", 1)
+    assert expired.get("b") is None and expired.stats()["expirations"] == 1
+
+def test_tiered_cache_promotes_disk_hits_to_memory(tmp_path):
+    disk = SQLiteCache(str(tmp_path / "cache.sqlite"))
+    disk.set("a", [1, 2])
+    cache = TieredCache(LRUCache(), disk)
+
+    assert asyncio.run(cache.get("a")) == [1, 2]
+    assert cache.memory.get("a") == [1, 2]
+
+def test_tiered_cache_survives_disk_errors(tmp_path):
+    class BrokenDisk(SQLiteCache):
+        def get(self, key):
+            raise sqlite3.OperationalError("database is locked")
+
+        def set(self, key, value):
+            raise sqlite3.OperationalError("database is locked")
+
+    cache = TieredCache(LRUCache(), BrokenDisk(str(tmp_path / "cache.sqlite")))
+
+    async def run():
+        await cache.set("a", 1)
+        return await cache.get("a"), await cache.get("b")
+
+    assert asyncio.run(run()) == (1, None)
+
+def test_memoize_node_keys_on_the_fields_it_reads():
+    calls = []
+
+    async def node(state):
+        calls.append(state["code"])
+        return {"result": state["code"].upper()}
+
+    cached = memoize_node(LRUCache(), "node", ["code"])(node)
+
+    async def run():
+        first = await cached({"code": "a", "unrelated": 1})
+        second = await cached({"code": "a", "unrelated": 2})
+        other = await cached({"code": "b"})
+        refreshed = await cached({"code": "a", "use_cache": False})
+        return first, second, other, refreshed
+
+    first, second, other, refreshed = asyncio.run(run())
+    assert first == second == refreshed == {"result": "A"} and other == {"result": "B"}
+    assert calls == ["a", "b", "a"]
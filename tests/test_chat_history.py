@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+from app.api.features import chatbot
+from app.api.features.chatbot import Conversation, build_chat_inputs
+from app.api.features.util.cache import LRUCache
+from app.api.features.util.chat_history import estimate_tokens, render_message, split_history, truncate_text
+from app.api.registry import registry
+
+def test_split_history_keeps_the_newest_lines_that_fit():
+    lines = [f"human: message {number}" for number in range(10)]
+    cost = estimate_tokens(lines[0])
+
+    older, recent = split_history(lines, token_budget=3 * cost)
+
+    assert recent == lines[-3:] and older == lines[:-3]
+    assert split_history(lines, token_budget=0) == (lines, [])
+
+def test_truncate_text_keeps_the_head_and_tail():
+    text = "head " + "x" * 5000 + " tail"
+
+    truncated = truncate_text(text, max_tokens=100)
+
+    assert truncated.startswith("head ") and truncated.endswith(" tail")
+    assert "characters omitted" in truncated and len(truncated) < 500
+    assert truncate_text("short", max_tokens=100) == "short"
+
+def conversation(history, **fields):
+    return Conversation(conversation_id="user-1", user_query="next question", history=history, **fields)
+
+def history(count):
+    return [("human" if number % 2 == 0 else "ai", f"message number {number} " + "word " * 10) for number in range(count)]
+
+LINE_TOKENS = estimate_tokens(render_message(*history(1)[0]))
+
+class SummaryChain:
+    def __init__(self):
+        self.calls = []
+
+    async def ainvoke(self, inputs):
+        self.calls.append(inputs)
+        return f"summary of {inputs['new_lines'].count(chr(10)) + 1} lines"
+
+@pytest.fixture
+def summaries(monkeypatch):
+    chain = SummaryChain()
+    monkeypatch.setitem(registry._objects, "summary_chain", chain)
+    monkeypatch.setitem(registry._objects, "chat_summaries", LRUCache())
+    monkeypatch.setattr(chatbot, "CHAT_SUMMARY_BATCH_TOKENS", 3 * LINE_TOKENS)
+    return chain
+
+def test_history_within_the_budget_is_sent_verbatim(summaries):
+    inputs = asyncio.run(build_chat_inputs("Ada", conversation(history(4)), token_budget=10000))
+
+    assert inputs["conversation_summary"] == "No earlier conversation."
+    assert inputs["chat_history"].count("\n") == 3
+    assert summaries.calls == []
+
+def test_older_lines_are_summarized_once_and_the_summary_reused(summaries):
+    budget = 3 * LINE_TOKENS
+
+    async def run():
+        first = await build_chat_inputs("Ada", conversation(history(10)), token_budget=budget)
+        # The client resends the same history with one more exchange
+        second = await build_chat_inputs("Ada", conversation(history(12)), token_budget=budget)
+        return first, second
+
+    first, second = asyncio.run(run())
+
+    assert first["conversation_summary"] == "summary of 7 lines"
+    assert first["chat_history"].count("\n") == 2
+    # The two lines that left the budget since are below the batch size, so they are sent as they are
+    assert second["conversation_summary"] == "summary of 7 lines"
+    assert second["chat_history"].count("\n") == 4
+    assert len(summaries.calls) == 1
+
+def test_stateless_summaries_are_not_reused_for_another_conversation(summaries):
+    budget = 3 * LINE_TOKENS
+    other = [(role, text.replace("message", "other")) for role, text in history(10)]
+
+    async def run():
+        await build_chat_inputs("Ada", conversation(history(10)), token_budget=budget)
+        return await build_chat_inputs("Ada", conversation(other), token_budget=budget)
+
+    asyncio.run(run())
+
+    assert len(summaries.calls) == 2
+    assert "other number 0" in summaries.calls[1]["new_lines"]
+    assert summaries.calls[1]["summary"] == "No summary yet."
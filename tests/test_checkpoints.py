@@ -0,0 +1,96 @@
+import asyncio
+from typing import TypedDict
+
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from app.api.features.util import checkpoints
+from app.api.features.util.checkpoints import RunConflict, checkpoint_path, claim_run, invoke_run, purge_stale_runs, run_config
+from app.api.registry import registry
+
+class State(TypedDict):
+    value: int
+
+@pytest.fixture
+def checkpointer(monkeypatch):
+    saver = MemorySaver()
+    monkeypatch.setitem(registry._objects, "checkpointer", saver)
+    return saver
+
+def build_graph(checkpointer):
+    async def increment(state):
+        return {"value": state["value"] + 1}
+
+    workflow = StateGraph(State)
+    workflow.add_node("increment", increment)
+    workflow.add_edge(START, "increment")
+    workflow.add_edge("increment", END)
+    return workflow.compile(checkpointer=checkpointer)
+
+async def leave_checkpoint(graph, run_id):
+    await graph.aupdate_state(run_config(run_id), {"value": 1}, as_node="increment")
+
+def test_invoke_run_deletes_the_checkpoint_of_a_finished_run(checkpointer):
+    graph = build_graph(checkpointer)
+
+    async def run():
+        assert await invoke_run(graph, {"value": 1}, "run-1") == {"value": 2}
+        return await checkpointer.aget_tuple(run_config("run-1"))
+
+    assert asyncio.run(run()) is None
+
+def test_a_new_run_with_a_checkpointed_id_is_refused(checkpointer):
+    graph = build_graph(checkpointer)
+
+    async def run():
+        await leave_checkpoint(graph, "run-1")
+        await invoke_run(graph, {"value": 5}, "run-1")
+
+    with pytest.raises(RunConflict, match="already exists"):
+        asyncio.run(run())
+
+def test_a_running_id_is_refused_even_for_resume(checkpointer):
+    async def run():
+        async with claim_run("run-1"):
+            async with claim_run("run-1", resume=True):
+                pass
+
+    with pytest.raises(RunConflict, match="already running"):
+        asyncio.run(run())
+
+def test_claim_run_releases_the_id(checkpointer):
+    async def run():
+        async with claim_run("run-1"):
+            pass
+        async with claim_run("run-1"):
+            pass
+
+    asyncio.run(run())
+    assert "run-1" not in checkpoints._active_runs
+
+def test_purge_deletes_only_stale_runs(checkpointer):
+    graph = build_graph(checkpointer)
+
+    async def run():
+        await leave_checkpoint(graph, "stale")
+        await leave_checkpoint(graph, "running")
+        assert await purge_stale_runs(checkpointer, ttl=3600) == 0
+
+        async with claim_run("running", resume=True):
+            purged = await purge_stale_runs(checkpointer, ttl=0)
+        return purged, await checkpointer.aget_tuple(run_config("stale")), await checkpointer.aget_tuple(run_config("running"))
+
+    purged, stale, running = asyncio.run(run())
+    assert purged == 1
+    assert stale is None and running is not None
+
+def test_checkpoint_path_defaults_to_the_temporary_directory(monkeypatch, tmp_path):
+    monkeypatch.delenv("CHECKPOINT_DB", raising=False)
+    monkeypatch.setattr(checkpoints.tempfile, "gettempdir", lambda: str(tmp_path))
+    assert checkpoint_path() == str(tmp_path / "checkpoints.sqlite")
+
+def test_checkpoint_path_is_none_when_not_writable(monkeypatch, tmp_path):
+    monkeypatch.setenv("CHECKPOINT_DB", str(tmp_path / "checkpoints.sqlite"))
+    monkeypatch.setattr(checkpoints.os, "access", lambda path, mode: False)
+    assert checkpoint_path() is None
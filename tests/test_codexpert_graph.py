@@ -0,0 +1,51 @@
+import asyncio
+
+import pytest
+from langgraph.checkpoint.memory import MemorySaver
+
+from app.api.features import codexpert
+from app.api.features.codexpert import NODE_DEPENDENCIES, SEQUENTIAL_ORDER, build_workflow, direct_dependencies
+
+CODE = "def total(items):\n    return sum(items)\n"
+
+def test_direct_dependencies_drop_the_implied_ones():
+    assert direct_dependencies("generate_optimized_code") == ["apply_quality_attributes"]
+    assert direct_dependencies("apply_quality_attributes") == ["generate_refactoring_suggestions", "research_design_pattern"]
+    assert direct_dependencies("code_evaluation_node") == []
+
+def run_with_recording_nodes(monkeypatch, mode):
+    events = []
+
+    def recording(name):
+        async def node(state):
+            events.append(("start", name))
+            await asyncio.sleep(0.01)
+            events.append(("end", name))
+            return {}
+        return node
+
+    monkeypatch.setattr(codexpert, "NODES", {name: recording(name) for name in codexpert.NODES})
+    graph = build_workflow(mode).compile(checkpointer=MemorySaver())
+    state = {"code": CODE, "programming_language": "Python"}
+    asyncio.run(graph.ainvoke(state, {"configurable": {"thread_id": mode}}))
+    return events
+
+def test_parallel_nodes_start_after_their_dependencies(monkeypatch):
+    events = run_with_recording_nodes(monkeypatch, "parallel")
+
+    assert sorted(name for kind, name in events if kind == "start") == sorted(NODE_DEPENDENCIES)
+    for name, dependencies in NODE_DEPENDENCIES.items():
+        started = events.index(("start", name))
+        assert all(events.index(("end", dependency)) < started for dependency in dependencies)
+
+    # The design pattern research does not wait for the evaluation
+    assert events.index(("start", "research_design_pattern")) < events.index(("end", "code_evaluation_node"))
+
+def test_sequential_nodes_run_one_at_a_time(monkeypatch):
+    events = run_with_recording_nodes(monkeypatch, "sequential")
+
+    assert events == [(kind, name) for name in SEQUENTIAL_ORDER for kind in ("start", "end")]
+
+def test_unknown_pipeline_mode_is_refused():
+    with pytest.raises(ValueError, match="pipeline mode"):
+        build_workflow("fastest")
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+from app.api.features import codexpert
+from app.api.features.schemas.codexpert_schema import CodeInput
+from app.api.features.util.cache import LRUCache, TieredCache
+from app.api.features.util.single_flight import SingleFlight
+from app.api.registry import registry
+
+@pytest.fixture
+def runs(monkeypatch):
+    """
+    Replace the graph run with a stub that records the run ids it was given.
+    """
+    started = []
+
+    async def invoke_run(graph, state, run_id):
+        started.append(run_id)
+        await asyncio.sleep(0.01)
+        return {"run_id": run_id, "code": state["code"]}
+
+    monkeypatch.setattr(codexpert, "invoke_run", invoke_run)
+    monkeypatch.setattr(codexpert, "select_graph", lambda pipeline_mode: None)
+    monkeypatch.setitem(registry._objects, "codexpert_cache", TieredCache(LRUCache()))
+    monkeypatch.setitem(registry._objects, "codexpert_flights", SingleFlight("codexpert"))
+    return started
+
+def request(run_id=None):
+    return CodeInput(code="print(1)", programming_language="python", is_ai_related=False, context="test", run_id=run_id)
+
+def test_identical_requests_share_one_run_and_the_cache(runs):
+    async def run():
+        first, second = await asyncio.gather(codexpert.run_codexpert(request()), codexpert.run_codexpert(request()))
+        cached = await codexpert.run_codexpert(request())
+        return first, second, cached
+
+    first, second, cached = asyncio.run(run())
+    assert len(runs) == 1
+    assert first == second == cached
+
+def test_a_client_run_id_always_gets_its_own_run(runs):
+    async def run():
+        await codexpert.run_codexpert(request())
+        return await asyncio.gather(codexpert.run_codexpert(request("mine")), codexpert.run_codexpert(request("other")))
+
+    mine, other = asyncio.run(run())
+    assert mine["run_id"] == "mine" and other["run_id"] == "other"
+    assert runs[1:] == ["mine", "other"]
+
+def test_batch_dedup_keeps_items_with_their_own_run_id(runs):
+    async def run():
+        items = [request(), request(), request("mine")]
+        return [entry async for entry in codexpert.run_codexpert_batch(items, max_concurrency=4)]
+
+    entries = sorted(asyncio.run(run()), key=lambda entry: entry["index"])
+    assert len(runs) == 2
+    assert entries[0]["result"] == entries[1]["result"]
+    assert entries[2]["result"]["run_id"] == "mine"
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+
+from app.api.features.util.cache import LRUCache, TieredCache
+from app.api.features.util.codexpert_functions import analyze_code, analyze_units
+from app.api.registry import registry
+
+CODE = "\n\n".join(f"def function_{number}(value):\n    return value + {number}" for number in range(200))
+
+@pytest.fixture
+def unit_cache(monkeypatch):
+    cache = TieredCache(LRUCache(max_size=1024))
+    monkeypatch.setitem(registry._objects, "codexpert_unit_cache", cache)
+    return cache
+
+def large_file_state(is_ai_related):
+    facts, units = analyze_code(CODE, "Python")
+    return {
+        "code": CODE,
+        "programming_language": "Python",
+        "is_ai_related": is_ai_related,
+        "context": None,
+        "static_analysis": facts,
+        "units": units
+    }
+
+def test_analyze_code_splits_a_large_file_from_one_parse():
+    facts, units = analyze_code(CODE, "Python")
+    assert facts["parsed"] and facts["metrics"]["functions"] == 200
+    assert units and units[0]["start_line"] == 1 and units[-1]["end_line"] == len(CODE.splitlines())
+
+def test_analyze_code_does_not_split_code_with_a_syntax_error():
+    facts, units = analyze_code(CODE + "\ndef broken(:\n", "Python")
+    assert not facts["parsed"] and units is None
+
+def test_unit_results_are_not_shared_between_ai_and_other_code(unit_cache):
+    calls = []
+
+    async def analyze(unit_state):
+        calls.append(unit_state["is_ai_related"])
+        return {"ai": unit_state["is_ai_related"]}
+
+    async def run():
+        ai = await analyze_units(large_file_state(True), "code_evaluation", analyze)
+        other = await analyze_units(large_file_state(False), "code_evaluation", analyze)
+        again = await analyze_units(large_file_state(False), "code_evaluation", analyze)
+        return ai, other, again
+
+    ai, other, again = asyncio.run(run())
+    units = len(large_file_state(False)["units"])
+    assert all(result == {"ai": True} for result in ai)
+    assert all(result == {"ai": False} for result in other) and again == other
+    assert calls == [True] * units + [False] * units
@@ -0,0 +1,109 @@
+import asyncio
+import base64
+import io
+
+import httpx
+import pytest
+from PIL import Image
+
+from app.api.features.util import image_ingestion
+from app.api.features.util.image_ingestion import ImageIngestionError, decode_data_url, fetch_image, prepare_image
+
+def png_file(path, size=(64, 48)):
+    Image.new("RGB", size, (200, 30, 30)).save(path, format="PNG")
+    return path.read_bytes()
+
+def data_url(raw, mime_type="image/png"):
+    return f"data:{mime_type};base64,{base64.b64encode(raw).decode('ascii')}"
+
+def client_for(handler):
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+async def fetch(handler, url="http://images.test/diagram.png"):
+    async with client_for(handler) as client:
+        return await fetch_image(client, url)
+
+def test_decode_data_url_returns_the_bytes(tmp_path):
+    raw = png_file(tmp_path / "diagram.png")
+    assert decode_data_url(data_url(raw)) == raw
+
+@pytest.mark.parametrize("url", ["data:image/png,not-base64", "data:image/png;base64,", "data:image/png;base64,@@@@"])
+def test_decode_data_url_rejects_invalid_urls(url):
+    with pytest.raises(ImageIngestionError):
+        decode_data_url(url)
+
+def test_decode_data_url_enforces_the_byte_cap(monkeypatch):
+    monkeypatch.setattr(image_ingestion, "MAX_IMAGE_BYTES", 16)
+    with pytest.raises(ImageIngestionError, match="larger than"):
+        decode_data_url(data_url(b"x" * 64))
+
+def test_prepare_image_downscales_and_reencodes(tmp_path, monkeypatch):
+    monkeypatch.setattr(image_ingestion, "MAX_IMAGE_SIDE", 100)
+    raw = png_file(tmp_path / "large.png", size=(400, 200))
+
+    image = prepare_image(raw)
+
+    assert (image.width, image.height) == (100, 50)
+    assert image.mime_type == "image/webp"
+    assert image.original_bytes == len(raw)
+    decoded = Image.open(io.BytesIO(decode_data_url(image.data_url)))
+    assert decoded.format == "WEBP" and decoded.size == (100, 50)
+
+def test_prepare_image_keeps_smaller_originals(tmp_path):
+    # A one-bit PNG is far smaller than its lossy WebP re-encoding
+    Image.new("1", (800, 800), 1).save(tmp_path / "mask.png", format="PNG")
+    raw = (tmp_path / "mask.png").read_bytes()
+
+    image = prepare_image(raw)
+
+    assert image.mime_type == "image/png"
+    assert image.data_url == data_url(raw)
+
+def test_prepare_image_hash_identifies_the_content(tmp_path):
+    raw = png_file(tmp_path / "diagram.png")
+    assert prepare_image(raw).content_hash == prepare_image(bytes(raw)).content_hash
+    assert prepare_image(raw).content_hash != prepare_image(png_file(tmp_path / "other.png", size=(65, 48))).content_hash
+
+def test_prepare_image_rejects_non_images():
+    with pytest.raises(ImageIngestionError, match="Could not decode"):
+        prepare_image(b"not an image")
+
+def test_fetch_image_returns_the_body(tmp_path):
+    raw = png_file(tmp_path / "diagram.png")
+    assert asyncio.run(fetch(lambda request: httpx.Response(200, content=raw))) == raw
+
+def test_fetch_image_rejects_a_declared_size_over_the_cap(monkeypatch):
+    monkeypatch.setattr(image_ingestion, "MAX_IMAGE_BYTES", 16)
+    with pytest.raises(ImageIngestionError, match="larger than"):
+        asyncio.run(fetch(lambda request: httpx.Response(200, content=b"x" * 64)))
+
+def test_fetch_image_enforces_the_cap_while_streaming(monkeypatch):
+    monkeypatch.setattr(image_ingestion, "MAX_IMAGE_BYTES", 16)
+
+    async def body():
+        for _ in range(8):
+            yield b"x" * 8
+
+    # No Content-Length: the body is chunked and only counted while reading
+    with pytest.raises(ImageIngestionError, match="larger than"):
+        asyncio.run(fetch(lambda request: httpx.Response(200, content=body())))
+
+def test_fetch_image_rejects_a_malformed_content_length():
+    handler = lambda request: httpx.Response(200, headers={"content-length": "lots"}, content=b"x")
+    with pytest.raises(ImageIngestionError, match="Content-Length"):
+        asyncio.run(fetch(handler))
+
+def test_fetch_image_enforces_the_deadline(monkeypatch):
+    monkeypatch.setattr(image_ingestion, "FETCH_TIMEOUT", 0.05)
+
+    async def body():
+        yield b"x"
+        await asyncio.sleep(1)
+        yield b"x"
+
+    with pytest.raises(ImageIngestionError, match="exceeded"):
+        asyncio.run(fetch(lambda request: httpx.Response(200, content=body())))
+
+def test_fetch_image_reports_http_errors():
+    with pytest.raises(ImageIngestionError, match="failed"):
+        asyncio.run(fetch(lambda request: httpx.Response(404)))
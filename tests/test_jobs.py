@@ -0,0 +1,32 @@
+import asyncio
+
+from app.api.features.util.jobs import JobManager
+from app.api.features.util.metrics import current_endpoint
+from app.api.logger import request_id_var
+
+def test_each_job_runs_with_its_submitters_request_id():
+    async def run():
+        jobs = JobManager(workers=1)
+        seen = {}
+
+        def events(name):
+            async def generate():
+                seen[name] = (request_id_var.get(), current_endpoint())
+                yield "done", {}
+            return generate
+
+        async def submit(request_id, name):
+            # Each request handler runs in its own context, as under the ASGI server
+            request_id_var.set(request_id)
+            return jobs.submit("codexpert", events(name))
+
+        first = await asyncio.create_task(submit("request-1", "first"))
+        second = await asyncio.create_task(submit("request-2", "second"))
+        await jobs.queue.join()
+        await jobs.aclose()
+        return first, second, seen
+
+    first, second, seen = asyncio.run(run())
+    assert first["request_id"] == "request-1" and second["request_id"] == "request-2"
+    assert seen == {"first": ("request-1", "/jobs/codexpert"), "second": ("request-2", "/jobs/codexpert")}
+    assert first["status"] == second["status"] == "succeeded"
@@ -0,0 +1,69 @@
+import pytest
+from langchain_core.exceptions import OutputParserException
+from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+
+from app.api.features.schemas.codexpert_schema import CodeEvaluation
+from app.api.features.util.llm_invocation import extract_json, parse_json, repair_messages
+
+@pytest.mark.parametrize("text, expected", [
+    ('{"works": true, "errors": null}', {"works": True, "errors": None}),
+    ('```json\n{"works": true}\n```', {"works": True}),
+    ('Here is the evaluation:\n{"works": false, "errors": ["x"]}\nHope it helps.', {"works": False, "errors": ["x"]}),
+    ('{"works": true, "errors": ["a", "b",],}', {"works": True, "errors": ["a", "b"]}),
+    ('{"outer": {"inner": "}"}} trailing {"second": 1}', {"outer": {"inner": "}"}}),
+    ('{"quote": "say \\"hi\\" {"}', {"quote": 'say "hi" {'}),
+])
+def test_extract_json_recovers_the_first_object(text, expected):
+    assert extract_json(text) == expected
+
+@pytest.mark.parametrize("text", ["no json here", '{"works": true', '{"works": tru}'])
+def test_extract_json_returns_none_without_a_usable_object(text):
+    assert extract_json(text) is None
+
+def test_parse_json_repairs_trailing_commas():
+    assert parse_json('{"works": true, "errors": [],}', CodeEvaluation) == {"works": True, "errors": []}
+
+def test_parse_json_keeps_the_rejected_answer():
+    with pytest.raises(OutputParserException) as error:
+        parse_json("not json", CodeEvaluation)
+    assert error.value.llm_output == "not json"
+
+def messages():
+    return [SystemMessage(content="system"), HumanMessage(content="evaluate this")]
+
+def test_repair_messages_replays_the_rejected_answer():
+    original = messages()
+    error = OutputParserException("Invalid json output", llm_output="not json")
+
+    repair = repair_messages(original, error, CodeEvaluation, "native")
+
+    assert repair[:2] == original
+    assert isinstance(repair[2], AIMessage) and repair[2].content == "not json"
+    assert isinstance(repair[3], HumanMessage)
+    assert "could not be parsed" in repair[3].content and "CodeEvaluation" in repair[3].content
+    assert len(original) == 2
+
+def test_repair_messages_in_prompt_mode_repeats_the_format_instructions():
+    error = OutputParserException("Invalid json output", llm_output="not json")
+
+    repair = repair_messages(messages(), error, CodeEvaluation, "prompt")
+
+    assert '"works"' in repair[-1].content
+
+def test_repair_messages_without_an_answer_only_reports_the_error():
+    repair = repair_messages(messages(), OutputParserException("no valid CodeEvaluation"), CodeEvaluation, "native")
+
+    assert len(repair) == 3
+    assert "was not valid" in repair[-1].content
+
+def test_repair_messages_retries_other_errors_unchanged():
+    assert repair_messages(messages(), TimeoutError("timed out"), CodeEvaluation, "native") == messages()
+
+@pytest.mark.parametrize("text", ['{"working": true}', '{"works": "maybe"}', '["works"]', '{"works": true, "errors": "none"}'])
+def test_parse_json_rejects_answers_that_do_not_match_the_schema(text):
+    with pytest.raises(OutputParserException, match="does not match CodeEvaluation") as error:
+        parse_json(text, CodeEvaluation)
+    assert error.value.llm_output == text
+
+def test_parse_json_fills_the_schema_defaults():
+    assert parse_json('Sure: {"works": true}', CodeEvaluation) == {"works": True, "errors": None}
@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+
+from app.api.features.util import codexpert_functions
+from app.api.features.util.codexpert_functions import generate_optimized_code
+from app.api.features.util.patching import PatchError, apply_edits, unified_diff
+
+CODE = "def total(items):\n    result = 0\n    for item in items:\n        result = result + item\n    return result\n"
+
+def test_apply_edits_replaces_a_verbatim_match():
+    patched = apply_edits(CODE, [{"original": "        result = result + item\n", "replacement": "        result += item\n"}])
+    assert patched == CODE.replace("result = result + item", "result += item")
+
+def test_apply_edits_applies_edits_in_order():
+    patched = apply_edits(CODE, [
+        {"original": "    result = 0", "replacement": "    subtotal = 0"},
+        {"original": "    return result", "replacement": "    return subtotal"}
+    ])
+    assert "subtotal = 0" in patched and "return subtotal" in patched
+
+def test_apply_edits_ignores_trailing_whitespace():
+    code = CODE.replace("    result = 0\n", "    result = 0   \n")
+    patched = apply_edits(code, [{"original": "    result = 0\n    for item in items:", "replacement": "    result = sum(items)"}])
+    assert patched == "def total(items):\n    result = sum(items)\n        result = result + item\n    return result\n"
+
+def test_apply_edits_ignores_trailing_whitespace_in_whole_line_edits():
+    code = CODE.replace("    result = 0\n", "    result = 0   \n")
+    patched = apply_edits(code, [{"original": "    result = 0\n", "replacement": "    result = 1\n"}])
+    assert patched == CODE.replace("result = 0", "result = 1")
+
+    patched = apply_edits(code, [{"original": "\n    result = 0\n", "replacement": "\n    result = 1\n"}])
+    assert patched == CODE.replace("result = 0", "result = 1")
+
+def test_apply_edits_accepts_crlf():
+    patched = apply_edits(CODE.replace("\n", "\r\n"), [{"original": "    return result\r\n", "replacement": "    return result or 0\r\n"}])
+    assert patched == CODE.replace("return result", "return result or 0")
+
+@pytest.mark.parametrize("code, original, message", [
+    (CODE, "result", "more than once"),
+    (CODE + "\n" + CODE, "    return result   ", "more than once"),
+    (CODE, "    return total", "does not match"),
+    (CODE, "  \n", "empty original")
+])
+def test_apply_edits_refuses_edits_it_cannot_place(code, original, message):
+    with pytest.raises(PatchError, match=message):
+        apply_edits(code, [{"original": original, "replacement": "x"}])
+
+def test_unified_diff_lists_only_the_changed_lines():
+    patch = unified_diff(CODE.replace("\n", "\r\n"), CODE.replace("return result", "return result or 0"))
+    assert patch.startswith("--- a/code\n+++ b/code\n")
+    assert [line for line in patch.split("\n")[2:] if line[:1] in "+-"] == ["-    return result", "+    return result or 0"]
+
+def test_unified_diff_of_identical_code_is_empty():
+    assert unified_diff(CODE, CODE) == ""
+
+def optimization_state(**overrides):
+    return {
+        "code": CODE,
+        "programming_language": "Python",
+        "static_analysis": None,
+        "refactoring_suggestions": {"suggestions": ["Use sum"]},
+        "design_pattern_research": {"design_pattern_applicable": False},
+        "quality_attributes_application": {"attributes_applied": ["KISS"]},
+        "output_mode": "diff",
+        **overrides
+    }
+
+@pytest.fixture
+def unmatched_edits(monkeypatch):
+    rewritten = "def total(items):\n    return sum(items)\n"
+
+    async def invoke_structured(llm, messages, schema, node=None, mode=None):
+        if schema.__name__ == "CodePatch":
+            return {"edits": [{"original": "    return totals", "replacement": "    return sum(items)"}]}
+        return {"optimized_code": rewritten}
+
+    monkeypatch.setattr(codexpert_functions, "invoke_structured", invoke_structured)
+    return rewritten
+
+def test_fallback_rewrite_is_returned_as_a_diff(unmatched_edits):
+    result = asyncio.run(generate_optimized_code(optimization_state()))
+    assert result["optimized_code"] == {"optimized_code": unmatched_edits}
+    assert result["optimized_code_patch"] == unified_diff(CODE, unmatched_edits)
+
+def test_fallback_rewrite_honours_include_optimized_code(unmatched_edits):
+    result = asyncio.run(generate_optimized_code(optimization_state(include_optimized_code=False)))
+    assert result["optimized_code"] is None
+    assert "+    return sum(items)" in result["optimized_code_patch"]
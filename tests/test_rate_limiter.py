@@ -0,0 +1,95 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from app.api.features.util.llm_invocation import StepRateLimiter
+from app.api.features.util.rate_limiter import PriorityGate, ProviderLimiter, TokenBucket, is_rate_limited
+
+def test_token_bucket_waits_for_the_missing_units():
+    bucket = TokenBucket(rate_per_minute=60, capacity=2)
+    assert bucket.wait_time(2) == 0.0
+
+    bucket.consume(2)
+    assert bucket.wait_time(1) == pytest.approx(1.0, abs=0.05)
+    assert bucket.wait_time(1, scale=0.5) == pytest.approx(2.0, abs=0.1)
+
+def test_token_bucket_caps_a_request_at_its_capacity():
+    bucket = TokenBucket(rate_per_minute=60, capacity=10)
+    assert bucket.wait_time(1000) == 0.0
+
+def test_priority_gate_keeps_reserved_slots_for_interactive_callers():
+    async def run():
+        gate = PriorityGate(limit=2, reserved=1)
+        await gate.acquire("pipeline")
+
+        pipeline = asyncio.create_task(gate.acquire("pipeline"))
+        await asyncio.sleep(0.01)
+        assert not pipeline.done() and gate.waiting["pipeline"] == 1
+
+        await asyncio.wait_for(gate.acquire("interactive"), 1)
+        assert gate.in_use == 2
+
+        await gate.release()
+        await gate.release()
+        await asyncio.wait_for(pipeline, 1)
+        return gate.in_use
+
+    assert asyncio.run(run()) == 1
+
+def test_provider_limiter_backs_off_on_429_and_recovers():
+    class Throttled(Exception):
+        status_code = 429
+
+    async def run():
+        limiter = ProviderLimiter("test", requests_per_minute=600)
+        with pytest.raises(Throttled):
+            async with limiter.limit():
+                raise Throttled()
+        throttled_scale = limiter.scale
+        assert limiter.take_budget() > 0
+
+        limiter.blocked_until = 0.0
+        async with limiter.limit():
+            pass
+        return throttled_scale, limiter
+
+    throttled_scale, limiter = asyncio.run(run())
+    assert throttled_scale == 0.5 and limiter.scale == pytest.approx(0.55)
+    assert limiter.throttled == 1 and limiter.gate.in_use == 0
+
+def test_is_rate_limited_recognizes_the_sdk_errors():
+    class RateLimitError(Exception):
+        pass
+
+    assert is_rate_limited(RateLimitError("slow down"))
+    assert is_rate_limited(Exception("Error code: 429 - quota exceeded"))
+    assert not is_rate_limited(ValueError("bad request"))
+
+def test_step_rate_limiter_sync_acquire_shares_the_budget():
+    limiter = ProviderLimiter("test", requests_per_minute=600)
+    step = StepRateLimiter(limiter, estimated_tokens=0)
+    capacity = limiter.requests.capacity
+
+    assert all(step.acquire(blocking=False) for _ in range(capacity))
+    assert step.acquire(blocking=False) is False
+
+    start = time.monotonic()
+    threads = [threading.Thread(target=step.acquire) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+
+    # 600 requests per minute refill one every 0.1 s
+    assert time.monotonic() - start >= 0.15
+    assert limiter.calls == capacity + 2
+
+def test_step_rate_limiter_async_acquire():
+    limiter = ProviderLimiter("test", requests_per_minute=600, tokens_per_minute=1000)
+    step = StepRateLimiter(limiter, estimated_tokens=100)
+
+    assert asyncio.run(step.aacquire()) is True
+    assert limiter.tokens.level == pytest.approx(0, abs=5)
+    assert asyncio.run(step.aacquire(blocking=False)) is False
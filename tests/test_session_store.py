@@ -0,0 +1,65 @@
+import asyncio
+import sqlite3
+import time
+
+from app.api.features.util.session_store import InMemorySessionStore, SQLiteSessionStore
+
+def age_session(path, session_key, seconds):
+    with sqlite3.connect(path) as connection:
+        connection.execute("UPDATE session_messages SET created_at = created_at - ? WHERE session_key = ?", (seconds, session_key))
+
+def test_sqlite_store_trims_old_messages_and_reports_the_offset(tmp_path):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.sqlite"), max_messages=3)
+
+    async def run():
+        await store.append("user:1", [("human", "a"), ("ai", "b")])
+        await store.append("user:1", [("human", "c"), ("ai", "d")])
+        return await store.load("user:1")
+
+    assert asyncio.run(run()) == (1, [("ai", "b"), ("human", "c"), ("ai", "d")])
+
+def test_sqlite_store_expires_sessions_after_the_ttl(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    store = SQLiteSessionStore(path, ttl=60)
+
+    async def run():
+        await store.append("user:old", [("human", "a"), ("ai", "b")])
+        await store.append("user:new", [("human", "c")])
+        age_session(path, "user:old", 120)
+
+        expired = await store.load("user:old")
+        await store.append("user:old", [("human", "again")])
+        return expired, await store.load("user:old"), await store.load("user:new")
+
+    expired, restarted, current = asyncio.run(run())
+    assert expired == (0, [])
+    assert restarted == (0, [("human", "again")])
+    assert current == (0, [("human", "c")])
+
+def test_sqlite_store_purge_deletes_only_expired_sessions(tmp_path):
+    path = str(tmp_path / "sessions.sqlite")
+    store = SQLiteSessionStore(path, ttl=60)
+
+    async def run():
+        await store.append("user:old", [("human", "a"), ("ai", "b")])
+        await store.append("user:new", [("human", "c")])
+        # The newest message is recent, so the whole session is kept
+        age_session(path, "user:new", 120)
+        await store.append("user:new", [("ai", "d")])
+        age_session(path, "user:old", 120)
+        return await store.purge()
+
+    assert asyncio.run(run()) == 2
+    with sqlite3.connect(path) as connection:
+        keys = connection.execute("SELECT DISTINCT session_key FROM session_messages").fetchall()
+    assert keys == [("user:new",)]
+
+def test_in_memory_store_expires_sessions_after_the_ttl():
+    store = InMemorySessionStore(ttl=0.01)
+
+    async def run():
+        await store.append("user:1", [("human", "a")])
+        time.sleep(0.02)
+        return await store.load("user:1"), await store.purge()
+
+    assert asyncio.run(run()) == ((0, []), 0)
@@ -0,0 +1,60 @@
+import asyncio
+
+import pytest
+
+from app.api.features.util.single_flight import SingleFlight
+
+def test_concurrent_calls_with_one_key_share_one_execution():
+    flights = SingleFlight("test")
+    calls = []
+
+    async def work(key):
+        calls.append(key)
+        await asyncio.sleep(0.01)
+        return f"result {key}"
+
+    async def run():
+        return await asyncio.gather(
+            flights.run("a", lambda: work("a")),
+            flights.run("a", lambda: work("a")),
+            flights.run("b", lambda: work("b"))
+        )
+
+    assert asyncio.run(run()) == ["result a", "result a", "result b"]
+    assert calls == ["a", "b"]
+    assert flights.stats() == {"in_flight": 0, "executions": 2, "upstream_calls_saved": 1}
+
+def test_every_caller_gets_the_error_and_the_next_call_runs_again():
+    flights = SingleFlight("test")
+    attempts = []
+
+    async def failing():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("provider down")
+
+    async def run():
+        results = await asyncio.gather(flights.run("a", failing), flights.run("a", failing), return_exceptions=True)
+        with pytest.raises(ValueError):
+            await flights.run("a", failing)
+        return results
+
+    results = asyncio.run(run())
+    assert all(isinstance(result, ValueError) for result in results)
+    assert len(attempts) == 2
+
+def test_a_cancelled_caller_does_not_cancel_the_shared_work():
+    flights = SingleFlight("test")
+
+    async def work():
+        await asyncio.sleep(0.02)
+        return "done"
+
+    async def run():
+        first = asyncio.create_task(flights.run("a", work))
+        second = asyncio.create_task(flights.run("a", work))
+        await asyncio.sleep(0.005)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == "done"
@@ -0,0 +1,53 @@
+import asyncio
+
+import pytest
+from langgraph.graph import END
+
+from app.api.features.codexpert import route_after_static_analysis
+from app.api.features.util.codexpert_functions import static_analysis
+from app.api.features.util.static_analysis import analyze, render_facts
+
+FIRST_NODES = ["code_evaluation_node"]
+
+def run_static_analysis(code, programming_language="Python"):
+    state = {"code": code, "programming_language": programming_language}
+    update = asyncio.run(static_analysis(state))
+    return update, route_after_static_analysis(FIRST_NODES)({**state, **update})
+
+def test_a_syntax_error_ends_the_run_with_its_location():
+    update, route = run_static_analysis("def total(items:\n    return sum(items)\n")
+
+    assert route == END
+    assert update["code_evaluation"]["works"] is False
+    assert update["code_evaluation"]["errors"][0].startswith("SyntaxError at line 1")
+
+def test_code_that_parses_goes_on_to_the_llm_nodes():
+    update, route = run_static_analysis("def total(items):\n    return sum(items)\n")
+
+    assert route == FIRST_NODES
+    assert update["static_analysis"]["parsed"] and "code_evaluation" not in update
+
+def test_languages_without_a_parser_go_on_to_the_llm_nodes():
+    update, route = run_static_analysis("function total(items) {", "JavaScript")
+
+    assert route == FIRST_NODES and update["static_analysis"] is None
+
+@pytest.mark.parametrize("code", [
+    "type Point = tuple[float, float]\n",
+    "def first[T](items: list[T]) -> T:\n    return items[0]\n",
+    "class Box[T]:\n    pass\n",
+    "names = ['a']\nprint(f\"{'\\n'.join(names)}\")\n",
+    "try:\n    pass\nexcept ValueError, TypeError:\n    pass\n"
+])
+def test_syntax_newer_than_the_server_is_left_to_the_llm(code):
+    update, route = run_static_analysis(code)
+
+    assert route == FIRST_NODES
+    assert update["static_analysis"] is None and "code_evaluation" not in update
+
+def test_render_facts_names_only_complex_functions():
+    branches = "".join(f"    if value == {number}:\n        return {number}\n" for number in range(12))
+    facts = analyze(f"def simple():\n    pass\n\ndef complex_one(value):\n{branches}", "python")
+
+    assert render_facts(facts) == "Most complex functions: complex_one (line 4, cyclomatic complexity 13)."
+    assert render_facts(analyze("def simple():\n    pass\n", "python")) == ""
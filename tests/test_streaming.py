@@ -0,0 +1,43 @@
+import asyncio
+from typing import Annotated, Dict, TypedDict
+
+from langgraph.checkpoint.memory import MemorySaver
+from langgraph.graph import END, START, StateGraph
+
+from app.api.features.schemas.codexpert_schema import merge_node_retries
+from app.api.features.util.streaming import graph_events
+
+class State(TypedDict):
+    value: int
+    node_retries: Annotated[Dict[str, int], merge_node_retries]
+
+def build_graph():
+    async def first(state):
+        return {"value": state["value"] + 1, "node_retries": {"first": 2}}
+
+    async def second(state):
+        return {"value": state["value"] * 10, "node_retries": {"second": 1}}
+
+    workflow = StateGraph(State)
+    workflow.add_node("first", first)
+    workflow.add_node("second", second)
+    workflow.add_edge(START, "first")
+    workflow.add_edge("first", "second")
+    workflow.add_edge("second", END)
+    return workflow.compile(checkpointer=MemorySaver())
+
+async def collect(graph, state, config):
+    return [event async for event in graph_events(graph, state, config)]
+
+def test_graph_events_streams_each_node_then_the_final_state():
+    events = asyncio.run(collect(build_graph(), {"value": 1}, {"configurable": {"thread_id": "run"}}))
+
+    assert [event for event, _ in events] == ["node", "node", "done"]
+    assert events[0][1] == {"node": "first", "update": {"value": 2, "node_retries": {"first": 2}}}
+
+def test_graph_events_final_state_applies_the_reducers():
+    events = asyncio.run(collect(build_graph(), {"value": 1}, {"configurable": {"thread_id": "run"}}))
+
+    _, final_state = events[-1]
+    assert final_state["value"] == 20
+    assert final_state["node_retries"] == {"first": 2, "second": 1}